@@ -0,0 +1,167 @@
+# acquisition.py - serial acquisition pipeline for main_ard.py
+#
+# Note: This file is not intended to run independently.
+#
+# The pipeline has three stages:
+#   read    - a thread that only blocks on ser.read() for whatever bytes have
+#             arrived, stamps them with the host time and pushes them into
+#             a bounded queue
+#   parse   - turns a batch of raw chunks (JSON lines or binary packets, see
+#             protocol.py) into tt_us/temp/pres columns
+#   compute - hands the columns to a callback (k_B derivation, logging, ...)
+# Parse and compute run in a second thread that drains the queue in batches,
+# so a slow print or plot never delays reading and the host timestamps stay
+# close to when the lines arrived. stop() ends both threads once the chunks
+# read so far are processed.
+
+import queue
+import threading
+import time
+
+import numpy as np
+
+import protocol
+
+# Maximum number of raw chunks waiting to be parsed
+QUEUE_SIZE = 4096
+
+# Maximum number of chunks parsed and computed together
+BATCH_SIZE = 256
+
+# mode is "json" or "binary". In binary mode the sample times come from the
+# Arduino micros() stamps, aligned with the host clock at the first packet.
+class SerialPipeline:
+    def __init__(self, ser, on_batch, t0=None, mode="json", queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE):
+        self.ser = ser
+        self.on_batch = on_batch
+        self.mode = mode
+        self.parser = protocol.JsonLineParser()
+        self.decoder = protocol.BinaryDecoder()
+        self.t_offset = None
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        self.chunks = 0
+        self.dropped = 0
+        self.malformed = 0
+        self.samples = 0
+        self.error = None
+        self.stopping = threading.Event()
+
+        self.reader = threading.Thread(target=self._read_loop, daemon=True)
+        self.processor = threading.Thread(target=self._process_loop, daemon=True)
+
+    def start(self):
+        self.reader.start()
+        self.processor.start()
+
+    # Stop reading, process what was read and wait for both threads
+    def stop(self, timeout=5):
+        self.stopping.set()
+        # Wake the reader if it waits in ser.read()
+        if hasattr(self.ser, "cancel_read"):
+            try:
+                self.ser.cancel_read()
+            except Exception as e:
+                print(e)
+        self.reader.join(timeout)
+        self.processor.join(timeout)
+
+    # Backpressure counters
+    def stats(self):
+        return {
+            "depth": self.queue.qsize(),
+            "chunks": self.chunks,
+            "dropped": self.dropped,
+            "lines": self.parser.lines,
+            "malformed": self.malformed + self.parser.malformed,
+            "samples": self.samples,
+            "lost": self.decoder.dropped,
+            "corrupted": self.decoder.corrupted,
+        }
+
+    # Push a raw chunk, dropping the oldest waiting chunk if the queue is full
+    def _push(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.dropped += 1
+            self.queue.put_nowait(item)
+
+    def _read_loop(self):
+        while not self.stopping.is_set():
+            try:
+                l = self.ser.read(max(self.ser.in_waiting, 1))
+            except Exception as e:
+                if not self.stopping.is_set():
+                    print(e)
+                    print("Serial reading stopped.")
+                    self.error = e
+                break
+            if not l:
+                continue
+            self.chunks += 1
+            self._push((time.perf_counter() - self.t0, l))
+        # No more chunks: the processor ends after this one
+        self.queue.put(None)
+
+    # Block for the first line, then take whatever else is already waiting
+    # (up to the None that ends the queue)
+    def _get_batch(self):
+        batch = [self.queue.get()]
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    # Parse the JSON lines in a batch of raw chunks. A line gets the host time
+    # of the chunk that completed it.
+    def _parse_json(self, batch):
+        t_chunk = np.array([b[0] for b in batch])
+        tt_us, temp, pres, line_chunk = self.parser.feed_chunks([b[1] for b in batch])
+        return (t_chunk[line_chunk], np.ones(len(tt_us), dtype=bool), tt_us, temp, pres, 0)
+
+    # Decode the binary packets in a batch of raw chunks
+    def _parse_binary(self, batch):
+        seq, t, tt_us, temp, pres = self.decoder.feed(b"".join([b[1] for b in batch]))
+        if len(t) > 0 and self.t_offset is None:
+            self.t_offset = batch[0][0] - t[0]
+        if self.t_offset is not None:
+            t = t + self.t_offset
+        return (t, np.ones(len(t), dtype=bool), tt_us, temp, pres, 0)
+
+    def _process_loop(self):
+        while True:
+            batch = self._get_batch()
+            end = batch[-1] is None
+            if end:
+                batch = batch[:-1]
+            if len(batch) > 0:
+                self._process(batch)
+            if end:
+                return
+
+    def _process(self, batch):
+        if self.mode == "binary":
+            t, keep, tt_us, temp, pres, malformed = self._parse_binary(batch)
+        else:
+            t, keep, tt_us, temp, pres, malformed = self._parse_json(batch)
+
+        # A zero time difference means the echo was missed
+        zero = keep & (tt_us == 0)
+        keep &= ~zero
+        self.malformed += malformed + int(np.count_nonzero(zero))
+        if not np.any(keep):
+            return
+        self.samples += int(np.count_nonzero(keep))
+        try:
+            self.on_batch(t[keep], tt_us[keep], temp[keep], pres[keep])
+        except Exception as e:
+            print(e)
@@ -16,6 +16,23 @@ const int echoPin = 6; // Echo Pin of Ultrasonic Sensor
 
 #define DELAY 1000
 
+// Binary mode (see protocol.py): fixed-size packets instead of JSON lines.
+// The host switches it on by sending "BIN <baud>\n".
+#define SYNC_BYTE 0xA5
+
+struct __attribute__((packed)) Packet {
+  uint8_t sync;
+  uint16_t seq;
+  uint32_t t_us;
+  uint32_t tt_us;
+  float temp;
+  float pres;
+  uint16_t crc;
+};
+
+bool binaryMode = false;
+uint16_t seq = 0;
+
 Adafruit_BMP280 bmp;
 Adafruit_MCP9808 tempsensor = Adafruit_MCP9808();
 
@@ -43,10 +60,57 @@ void setup() {
   tempsensor.setResolution(3);
 }
 
+// CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF), as binascii.crc_hqx
+uint16_t crc16(const uint8_t *data, size_t len) {
+  uint16_t crc = 0xFFFF;
+  for (size_t i = 0; i < len; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (uint8_t j = 0; j < 8; j++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+// Handle a "BIN <baud>" request from the host
+void checkCommand() {
+  if (!Serial.available()) {
+    return;
+  }
+  String cmd = Serial.readStringUntil('\n');
+  if (cmd.startsWith("BIN")) {
+    long baud = cmd.substring(4).toInt();
+    if (baud <= 0) {
+      baud = 9600;
+    }
+    Serial.print("OK ");
+    Serial.println(baud);
+    Serial.flush();
+    Serial.end();
+    Serial.begin(baud);
+    binaryMode = true;
+  }
+}
+
+void sendPacket(uint32_t t_us, uint32_t tt_us, float temperature, float pressure) {
+  Packet p;
+  p.sync = SYNC_BYTE;
+  p.seq = seq++;
+  p.t_us = t_us;
+  p.tt_us = tt_us;
+  p.temp = temperature;
+  p.pres = pressure;
+  p.crc = crc16((const uint8_t *)&p + 1, sizeof(Packet) - 3);
+  Serial.write((const uint8_t *)&p, sizeof(Packet));
+}
+
 void loop() {
    float duration, temperature, pressure;
+   uint32_t t_us;
    StaticJsonDocument<200> doc;
 
+   checkCommand();
+
    temperature = tempsensor.readTempC();
    pressure = bmp.readPressure();
 
@@ -57,12 +121,17 @@ void loop() {
    delayMicroseconds(10);
    digitalWrite(pingPin, LOW);
    pinMode(echoPin, INPUT);
+   t_us = micros();
    duration = pulseIn(echoPin, HIGH);
 
-   doc["tt_us"] = duration;
-   doc["temp"] = temperature;
-   doc["pres"] = pressure;
-   serializeJson(doc, Serial);
-   Serial.println();
+   if (binaryMode) {
+     sendPacket(t_us, (uint32_t)duration, temperature, pressure);
+   } else {
+     doc["tt_us"] = duration;
+     doc["temp"] = temperature;
+     doc["pres"] = pressure;
+     serializeJson(doc, Serial);
+     Serial.println();
+   }
    delay(DELAY);
 }
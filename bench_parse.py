@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+# bench_parse.py - microbenchmark of the serial JSON line parsing
+#
+# Compares the per-line path main_ard.py used before (decode, json.loads,
+# three key lookups, exception-driven error handling) with
+# protocol.JsonLineParser fed with raw chunks, as the acquisition pipeline
+# does. Prints lines per second for each.
+#
+# Usage: python3 bench_parse.py [number of lines]
+
+import json
+import random
+import sys
+import time
+
+import protocol
+
+# Lines as the firmware writes them, with a few broken ones mixed in
+def make_stream(n, bad_every=1000):
+    r = random.Random(0)
+    lines = []
+    for i in range(0, n):
+        if bad_every and i % bad_every == bad_every - 1:
+            lines.append(b'{"tt_us":78')
+        else:
+            tt_us = r.randint(1400, 9000)
+            temp = round(r.uniform(20, 25), 2)
+            pres = round(r.uniform(101000, 101700), 2)
+            lines.append('{{"tt_us":{0},"temp":{1},"pres":{2}}}'.format(tt_us, temp, pres).encode("ascii"))
+    return b"\r\n".join(lines) + b"\r\n"
+
+# The per-line path of the original data_collection_ard()
+def parse_per_line(stream):
+    count = 0
+    malformed = 0
+    for l in stream.splitlines(keepends=True):
+        l = l.decode('utf-8')
+        try:
+            l_json = json.loads(l)
+            tt_us = l_json['tt_us']
+            temp = l_json['temp']
+            pres = l_json['pres']
+        except Exception:
+            malformed += 1
+        else:
+            count += 1
+    return count
+
+# Chunks of chunk_size bytes, handed to the parser in batches like the
+# acquisition pipeline does
+def parse_chunks(stream, chunk_size, batch_size=1):
+    parser = protocol.JsonLineParser()
+    chunks = [stream[i:i + chunk_size] for i in range(0, len(stream), chunk_size)]
+    count = 0
+    for i in range(0, len(chunks), batch_size):
+        count += len(parser.feed_chunks(chunks[i:i + batch_size])[0])
+    return count
+
+def bench(name, fn, n_lines, repeat=3):
+    best = None
+    for i in range(0, repeat):
+        t = time.perf_counter()
+        fn()
+        t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+    print("{0:<32} {1:>12.0f} lines/s".format(name, n_lines / best))
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    stream = make_stream(n)
+
+    bench("per line (json.loads)", lambda: parse_per_line(stream), n)
+    for chunk_size, batch_size in [(64, 1), (64, 256), (1024, 1), (16384, 1)]:
+        bench("JsonLineParser, {0} B x {1}".format(chunk_size, batch_size), lambda: parse_chunks(stream, chunk_size, batch_size), n)
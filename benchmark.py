@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+
+# benchmark.py - microbenchmarks of the util.py kernels and the CSV loaders
+#
+# Times every k_B model of util.py (scalar and array versions), all of them
+# at once with models.py, the error functions and err_arr_gp, and the
+# load-and-derive step of plot.py, plot2.py, plot3.py and plot5.py, on the
+# data/ corpus and on synthetic data sets. Reports rows per second and peak
+# memory (traced by tracemalloc, in a separate run so tracing does not slow
+# the timed one).
+#
+# Usage: python3 benchmark.py [--sizes 1e4,1e5,1e6] [--json results.json]
+#                             [--compare old.json]
+#
+# Synthetic CSV files are written to --workdir, and reused by later runs with
+# the same --workdir, or else to a temporary directory removed at the end.
+# 1e7 rows take about 850 MB of disk.
+
+import argparse
+import csv
+import glob
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+
+import util
+import models
+import plot
+import plot2
+import plot3
+import plot5
+import runio
+
+DATA_HEADER = ["Time", "Exp Distance", "Measured Time Diff", "Temperature", "Derived k_B", "Derived k_B Error", "Pressure", "HC-SRO4 Raw"]
+
+# HC-SR04 Offset (us)
+SR04_OFFSET = 55
+
+# The per-row scalar functions are only timed up to this many rows
+SCALAR_MAX_ROWS = 10 ** 5
+
+# Columns of n realistic samples at distance dis (m, round trip)
+def make_columns(n, dis=0.548, seed=0):
+    r = np.random.default_rng(seed)
+    t = np.arange(n) * 1.0 + r.uniform(0, 0.01, n)
+    temp = 297.65 + np.cumsum(r.normal(0, 0.005, n))
+    pres = 101600 + np.cumsum(r.normal(0, 0.5, n))
+    c_sound = np.sqrt(util.K_B * util.GAMMA * util.N_A * temp / util.MOLAR_MASS_AIR)
+    tt = np.round(dis / c_sound + r.normal(0, 2 * 10 ** (-6), n), 6)
+    return (t, tt, temp, pres)
+
+# A data CSV of n rows in the format main_ard.py writes, written in blocks
+def make_csv(csv_loc, n, dis=0.548, block=10 ** 6):
+    with open(csv_loc, "w") as f:
+        f.write(",".join(DATA_HEADER) + "\n")
+        for i in range(0, n, block):
+            t, tt, temp, pres = make_columns(min(block, n - i), dis, seed=i)
+            t = t + i
+            kb = util.kb_from_tt_rk_n2_arr(tt, temp, dis, pres)
+            err = util.err_from_tt_pct_arr(tt, temp, dis) * kb
+            rows = np.column_stack((t, np.full(len(t), dis), tt, temp, kb, err, pres, tt - SR04_OFFSET * 10 ** (-6)))
+            np.savetxt(f, rows, fmt="%.10g", delimiter=",")
+
+# Best wall time of fn() over repeat runs, and the peak traced memory (MB)
+# of one more run
+def measure(fn, repeat, memory=True):
+    best = None
+    for i in range(0, repeat):
+        t = time.perf_counter()
+        fn()
+        t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return (best, peak)
+
+def scalar_loop(fn, *cols):
+    return [fn(*row) for row in zip(*cols)]
+
+def kernel_cases(cols, dis):
+    t, tt, temp, pres = cols
+    kb = util.kb_from_tt_rk_n2_arr(tt, temp, dis, pres)
+    err = util.err_from_tt_pct_arr(tt, temp, dis) * kb
+    d = [dis] * len(tt)
+
+    cases = []
+    for name in ["n2", "air", "vdw_n2_aprx"]:
+        cases.append(("kb_from_tt_{}".format(name), True, lambda f=getattr(util, "kb_from_tt_" + name): scalar_loop(f, tt, temp, d)))
+        cases.append(("kb_from_tt_{}_arr".format(name), False, lambda f=getattr(util, "kb_from_tt_{}_arr".format(name)): f(tt, temp, dis)))
+    for name in ["vdw_n2", "vdw_air", "rk_n2", "rk_air"]:
+        cases.append(("kb_from_tt_{}".format(name), True, lambda f=getattr(util, "kb_from_tt_" + name): scalar_loop(f, tt, temp, d, pres)))
+        cases.append(("kb_from_tt_{}_arr".format(name), False, lambda f=getattr(util, "kb_from_tt_{}_arr".format(name)): f(tt, temp, dis, pres)))
+    names = list(models.MODELS)
+    cases.append(("util *_arr (every model)", False, lambda: [(k, util.err_from_tt_pct_arr(tt, temp, dis) * k, util.cum_mean_arr(k)) for k in [getattr(util, "kb_from_tt_{}_arr".format(m))(tt, temp, dis, pres) if models.needs_pressure(m) else getattr(util, "kb_from_tt_{}_arr".format(m))(tt, temp, dis) for m in names]]))
+    cases.append(("models.evaluate (every model)", False, lambda: models.evaluate(names, tt, temp, dis, pres)))
+    cases.append(("err_from_tt_pct", True, lambda: scalar_loop(util.err_from_tt_pct, tt, temp, d)))
+    cases.append(("err_from_tt_pct_arr", False, lambda: util.err_from_tt_pct_arr(tt, temp, dis)))
+    cases.append(("err_arr_gp", False, lambda: util.err_arr_gp(t, kb, err)))
+    return cases
+
+# The load-and-derive step of each plot script, for one CSV file
+def plot_load(csv_loc):
+    t_col, distance_d, tt_col, temp_col, pres_col = plot.load_data(csv_loc)
+    return plot.derive_data(t_col, distance_d, tt_col, temp_col, pres_col)
+
+def plot2_load(csv_loc):
+    time_arr, distance_d, tt_arr, temp_arr, pres_arr = plot2.load_data(csv_loc)
+    return plot2.derive_data(tt_arr, temp_arr, distance_d, pres_arr)
+
+LOADERS = [
+    ("plot.py", plot_load),
+    ("plot2.py", plot2_load),
+    ("plot3.py", lambda csv_loc: plot3.load_run(csv_loc, 0.01)),
+    ("plot5.py", plot5.load_run),
+]
+
+# The columns the plot scripts use, read the way they used to (DictReader and
+# a float() per field) and with runio
+READ_COLUMNS = ["Time", "Measured Time Diff", "Temperature", "Pressure"]
+
+def dictreader_columns(csv_loc):
+    cols = {c: [] for c in READ_COLUMNS}
+    with open(csv_loc, "r") as f:
+        for row in csv.DictReader(f):
+            for c in READ_COLUMNS:
+                cols[c].append(float(row[c]))
+    return {c: np.array(v) for c, v in cols.items()}
+
+READERS = [
+    ("csv.DictReader", dictreader_columns),
+    ("runio.read_columns", lambda csv_loc: runio.read_columns(csv_loc, READ_COLUMNS)),
+]
+
+def count_rows(csv_loc):
+    with open(csv_loc, "rb") as f:
+        return sum(1 for l in f) - 1
+
+def result(group, name, dataset, rows, seconds, peak):
+    r = {
+        "group": group,
+        "name": name,
+        "dataset": dataset,
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_s": rows / seconds if seconds > 0 else None,
+        "peak_mb": peak,
+    }
+    print("{0:<8} {1:<28} {2:<10} {3:>10} {4:>14.0f} rows/s {5:>10}".format(group, name, dataset, rows, r["rows_per_s"], "-" if peak is None else "{:.1f} MB".format(peak)))
+    return r
+
+def bench_kernels(sizes, repeat, memory):
+    results = []
+    dis = 0.548
+    for n in sizes:
+        cols = make_columns(n, dis)
+        for name, scalar, fn in kernel_cases(cols, dis):
+            if scalar and n > SCALAR_MAX_ROWS:
+                continue
+            best, peak = measure(fn, repeat, memory)
+            results.append(result("kernel", name, "synthetic", n, best, peak))
+    return results
+
+# Loaders on the data/ corpus: every non-empty file the loader can read,
+# one after another, counted together
+def bench_corpus(data_dir, repeat, memory):
+    results = []
+    csv_locs = [c for c in sorted(glob.glob(os.path.join(data_dir, "*.csv"))) if count_rows(c) > 0]
+    for name, fn in LOADERS:
+        usable = []
+        for csv_loc in csv_locs:
+            try:
+                fn(csv_loc)
+            except Exception:
+                continue
+            usable.append(csv_loc)
+        if len(usable) == 0:
+            continue
+        rows = sum(count_rows(c) for c in usable)
+        best, peak = measure(lambda: [fn(c) for c in usable], repeat, memory)
+        print("{0}: {1} of {2} files readable".format(name, len(usable), len(csv_locs)))
+        results.append(result("loader", name, "corpus", rows, best, peak))
+    return results
+
+def bench_synthetic(sizes, workdir, repeat, memory):
+    results = []
+    for n in sizes:
+        csv_loc = os.path.join(workdir, "synthetic_{}.csv".format(n))
+        if not os.path.exists(csv_loc):
+            make_csv(csv_loc, n)
+        for name, fn in READERS:
+            best, peak = measure(lambda: fn(csv_loc), repeat, memory)
+            results.append(result("reader", name, "synthetic", n, best, peak))
+        for name, fn in LOADERS:
+            best, peak = measure(lambda: fn(csv_loc), repeat if n <= SCALAR_MAX_ROWS else 1, memory)
+            results.append(result("loader", name, "synthetic", n, best, peak))
+    return results
+
+# Speedup of every result over the matching result of an earlier run
+def compare(results, old_loc):
+    with open(old_loc, "r") as f:
+        old = json.load(f)
+    old_map = {(r["group"], r["name"], r["dataset"], r["rows"]): r for r in old["results"]}
+
+    print()
+    print("Compared with {0} ({1}):".format(old_loc, old["meta"].get("date")))
+    for r in results:
+        o = old_map.get((r["group"], r["name"], r["dataset"], r["rows"]))
+        if o is None or not o["rows_per_s"]:
+            continue
+        print("{0:<8} {1:<28} {2:<10} {3:>10} {4:>8.2f}x".format(r["group"], r["name"], r["dataset"], r["rows"], r["rows_per_s"] / o["rows_per_s"]))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the util.py kernels and the CSV loaders.")
+    parser.add_argument("--sizes", default="1e4,1e5,1e6", help="synthetic data set sizes (default 1e4,1e5,1e6)")
+    parser.add_argument("--data", default="data", help="directory of the data CSV corpus (default data)")
+    parser.add_argument("--workdir", help="directory for the synthetic CSV files, kept for later runs (default: a temporary directory)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case, the best is reported (default 3)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory runs")
+    parser.add_argument("--only", choices=["kernels", "loaders"], help="run only one group")
+    parser.add_argument("--json", help="save the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare with")
+    args = parser.parse_args()
+
+    sizes = [int(float(s)) for s in args.sizes.split(",")]
+    memory = not args.no_memory
+
+    results = []
+    if args.only != "loaders":
+        results += bench_kernels(sizes, args.repeat, memory)
+    if args.only != "kernels":
+        results += bench_corpus(args.data, args.repeat, memory)
+        # A temporary directory (removed afterwards) unless --workdir is given
+        if args.workdir:
+            os.makedirs(args.workdir, exist_ok=True)
+            results += bench_synthetic(sizes, args.workdir, args.repeat, memory)
+        else:
+            with tempfile.TemporaryDirectory(prefix="kb_bench_") as workdir:
+                results += bench_synthetic(sizes, workdir, args.repeat, memory)
+
+    if args.json:
+        meta = {
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "sizes": sizes,
+        }
+        with open(args.json, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+        print("Results saved to {}.".format(args.json))
+
+    if args.compare:
+        compare(results, args.compare)
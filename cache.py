@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+# cache.py - on-disk cache of results derived from the data CSVs
+#
+# The plot scripts derive k_B, errors and running averages from the raw
+# columns of a run every time they open it. cached() stores what a script
+# derived in an uncompressed .npz file under CACHE_DIR, so opening the same
+# run again only loads a few arrays.
+#
+# An entry is keyed by a hash of
+#   - the content of the CSV,
+#   - the name of the derivation and its parameters (model, offset, ...),
+#   - the modules of SOURCES (util.py, models.py and the gas registry of
+#     gases.py: their constants and models), and CACHE_VERSION.
+# Changing any of them gives a new key, so stale entries are never read;
+# they are evicted with the least recently used ones once the cache grows
+# over CACHE_BUDGET_MB.
+#
+# Usage: python3 cache.py info | clear
+
+import hashlib
+import json
+import os
+import sys
+import zipfile
+
+import numpy as np
+
+import util
+import models
+import gases
+
+CACHE_DIR = "data/.cache"
+
+# Size limit of the cache (MB)
+CACHE_BUDGET_MB = 256
+
+# Bump when the layout of the entries changes
+CACHE_VERSION = 1
+
+# Content hashes of the CSVs by path, with the size and mtime they were
+# taken at, kept in CACHE_DIR so a large unchanged file is not read again
+_file_hashes = None
+
+_source_hashes = {}
+
+def file_hash(path, cache_dir=CACHE_DIR):
+    global _file_hashes
+    index_loc = os.path.join(cache_dir, "hashes.json")
+    if _file_hashes is None:
+        try:
+            with open(index_loc, "r") as f:
+                _file_hashes = json.load(f)
+        except (OSError, ValueError):
+            _file_hashes = {}
+
+    st = os.stat(path)
+    key = os.path.abspath(path)
+    stamp = [st.st_size, st.st_mtime_ns]
+    entry = _file_hashes.get(key)
+    if entry is not None and entry[:2] == stamp:
+        return entry[2]
+
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    _file_hashes[key] = stamp + [h.hexdigest()]
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_loc = "{0}.{1}.tmp".format(index_loc, os.getpid())
+        with open(tmp_loc, "w") as f:
+            json.dump(_file_hashes, f)
+        os.replace(tmp_loc, index_loc)
+    except OSError as e:
+        print(e)
+    return _file_hashes[key][2]
+
+# Modules whose code and constants the cached results depend on
+SOURCES = [util, models, gases]
+
+# Hash of the source files of modules (default SOURCES)
+def source_hash(modules=None):
+    if modules is None:
+        modules = SOURCES
+    key = tuple(m.__name__ for m in modules)
+    if key not in _source_hashes:
+        h = hashlib.blake2b(digest_size=16)
+        for m in modules:
+            with open(m.__file__, "rb") as f:
+                h.update(f.read())
+        _source_hashes[key] = h.hexdigest()
+    return _source_hashes[key]
+
+def cache_key(csv_loc, name, params, cache_dir=CACHE_DIR):
+    h = hashlib.blake2b(digest_size=20)
+    h.update(repr((CACHE_VERSION, name, sorted(params.items()), source_hash(), file_hash(csv_loc, cache_dir))).encode("utf-8"))
+    return h.hexdigest()
+
+# The arrays compute() derives from csv_loc, from the cache if possible.
+# compute() returns a dict of arrays and numbers; the result is a dict of
+# arrays (numbers become 0-d arrays), whether it was cached or not.
+def cached(csv_loc, name, params, compute, cache_dir=CACHE_DIR, budget_mb=CACHE_BUDGET_MB):
+    path = os.path.join(cache_dir, cache_key(csv_loc, name, params, cache_dir) + ".npz")
+    try:
+        with np.load(path, allow_pickle=False) as f:
+            result = {k: f[k] for k in f.files}
+        os.utime(path)
+        return result
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        pass
+
+    result = {k: np.asarray(v) for k, v in compute().items()}
+    try:
+        store(path, result)
+        evict(cache_dir, budget_mb)
+    except OSError as e:
+        print(e)
+    return result
+
+# Write an entry atomically, so a concurrent reader never sees half of it
+def store(path, result):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = "{0}.{1}.tmp".format(path, os.getpid())
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **result)
+    os.replace(tmp_path, path)
+
+# Remove the least recently used entries until the cache fits the budget
+def evict(cache_dir=CACHE_DIR, budget_mb=CACHE_BUDGET_MB):
+    entries = []
+    for e in os.scandir(cache_dir):
+        if e.name.endswith(".npz"):
+            try:
+                st = e.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, e.path))
+    total = sum(e[1] for e in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= budget_mb * 2 ** 20:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("info", "clear"):
+        print("Usage: python3 cache.py info | clear")
+        exit()
+    if not os.path.isdir(CACHE_DIR):
+        print("The cache is empty.")
+        exit()
+
+    if sys.argv[1] == "clear":
+        evict(CACHE_DIR, 0)
+        print("Cache cleared.")
+    else:
+        sizes = [e.stat().st_size for e in os.scandir(CACHE_DIR) if e.name.endswith(".npz")]
+        print("{0} entries, {1:.1f} of {2} MB in {3}.".format(len(sizes), sum(sizes) / 2 ** 20, CACHE_BUDGET_MB, CACHE_DIR))
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+# calibrate.py - calibration of the HC-SR04 time offset over many runs
+#
+# The offset is the time added to the "Measured Time Diff" column (which
+# already includes SR04_OFFSET of main_ard.py) to get the true time of
+# flight. Two estimates are made from the selected runs:
+#
+#   grid - k_B of every sample is evaluated for every offset of a dense grid
+#          in one broadcasted pass (in blocks of offsets, to bound memory).
+#          The best offset is the one that makes the run means agree with
+#          each other across distances (least chi^2 around their weighted
+#          mean), with the interval where chi^2 rises by one. The offset
+#          that brings the weighted mean to the true k_B is reported too.
+#   fit  - weighted least squares of the run means of tt against d / sqrt(T)
+#          (tt = d / c - offset, with c proportional to sqrt(T)), fitting the
+#          offset and the speed of sound at T_REF jointly.
+#
+# Usage: python3 calibrate.py [all | ID,ID,... | distance=1.34 ...]
+#                             [--model rk_air] [--range -200 200] [--step 0.1]
+
+import argparse
+import time
+
+import numpy as np
+
+import util
+import models
+import multirun
+import catalog
+import runio
+
+# SR04_OFFSET of main_ard.py (us)
+SR04_OFFSET = 55
+
+# Reference temperature of the fitted speed of sound (K)
+T_REF = 293.15
+
+# Maximum number of k_B values evaluated at once (offsets x samples)
+BLOCK_SIZE = 4 * 10 ** 6
+
+# Distance, tt, temperature and pressure (None if not recorded) of a run
+def load_columns(csv_loc):
+    col = runio.read_columns(csv_loc, ["Measured Time Diff", "Temperature", "Pressure"])
+    if len(col["Measured Time Diff"]) == 0:
+        raise Exception("No samples in {}.".format(csv_loc))
+    return (runio.read_distance(csv_loc), col["Measured Time Diff"], col["Temperature"], col["Pressure"])
+
+# k_B of one model (see models.py), broadcasting tt against the other columns
+def kb_model(model, tt, temp, dis, pres):
+    kind, gas = models.resolve(model)
+    s = models.shared_terms(tt, temp, dis, pres if models.needs_pressure(model) else None)
+    return models.KINDS[kind][0](s, gas)
+
+# Per-run mean of k_B and its error for every offset (s). Returns two
+# (offsets x runs) arrays.
+def kb_grid(offsets, runs, model):
+    dis = np.concatenate([np.full(len(r[1]), r[0]) for r in runs])
+    tt = np.concatenate([r[1] for r in runs])
+    temp = np.concatenate([r[2] for r in runs])
+    pres = np.concatenate([r[3] for r in runs]) if models.needs_pressure(model) else None
+    n = np.array([len(r[1]) for r in runs])
+    starts = np.concatenate(([0], np.cumsum(n)[:-1]))
+    dis_run = np.array([r[0] for r in runs])
+
+    kb_mean = np.empty((len(offsets), len(runs)))
+    kb_err = np.empty((len(offsets), len(runs)))
+    block = max(BLOCK_SIZE // len(tt), 1)
+    for i in range(0, len(offsets), block):
+        off = offsets[i:i + block, None]
+        kb = kb_model(model, tt[None, :] + off, temp[None, :], dis[None, :], None if pres is None else pres[None, :])
+        s = np.add.reduceat(kb, starts, axis=1)
+        s2 = np.add.reduceat(kb * kb, starts, axis=1)
+        mean = s / n
+        var = np.maximum(s2 / n - mean * mean, 0) * n / np.maximum(n - 1, 1)
+        # Spread of the samples plus the distance error, which is common to
+        # all samples of a run (k_B goes with the distance squared)
+        dis_err = 2 * util.DIS_ERR_ABS / dis_run * mean
+        kb_mean[i:i + block] = mean
+        kb_err[i:i + block] = np.sqrt(var / n + dis_err * dis_err)
+    return (kb_mean, kb_err)
+
+# Chi^2 of the run means around their weighted mean, and the weighted mean,
+# for every row of the grid
+def grid_chi2(kb_mean, kb_err):
+    w = 1 / (kb_err * kb_err)
+    wmean = np.sum(w * kb_mean, axis=1) / np.sum(w, axis=1)
+    chi2 = np.sum(w * (kb_mean - wmean[:, None]) ** 2, axis=1)
+    return (chi2, wmean)
+
+# Offset of least chi^2 and its interval (chi^2 up by one, after scaling
+# chi^2 to one per degree of freedom at the minimum if it is larger)
+def grid_optimum(offsets, chi2, dof):
+    i = int(np.argmin(chi2))
+    scale = max(chi2[i] / dof, 1) if dof > 0 else 1
+    inside = offsets[chi2 <= chi2[i] + scale]
+    return (offsets[i], inside[0], inside[-1], chi2[i], i in (0, len(offsets) - 1))
+
+# Offsets where the weighted mean k_B crosses k_true, linearly interpolated
+def grid_crossings(offsets, wmean, k_true):
+    d = wmean - k_true
+    idx = np.flatnonzero(np.sign(d[:-1]) != np.sign(d[1:]))
+    return offsets[idx] - d[idx] * (offsets[idx + 1] - offsets[idx]) / (d[idx + 1] - d[idx])
+
+# Joint weighted least squares fit of tt = u * d / sqrt(T) - offset over the
+# run means. Returns (offset, speed of sound at T_REF, covariance of
+# (offset, c), chi^2, degrees of freedom).
+def wls_fit(runs):
+    x = np.array([r[0] / np.sqrt(np.mean(r[2])) for r in runs])
+    y = np.array([np.mean(r[1]) for r in runs])
+    n = np.array([len(r[1]) for r in runs])
+    sem = np.array([np.std(r[1], ddof=1) if len(r[1]) > 1 else util.TT_ERR_ABS for r in runs]) / np.sqrt(n)
+    sem = np.maximum(sem, util.TT_ERR_ABS / np.sqrt(n))
+    x_err = np.array([util.DIS_ERR_ABS / np.sqrt(np.mean(r[2])) for r in runs])
+
+    a = np.column_stack((x, -np.ones(len(x))))
+    u = np.sum(x * y) / np.sum(x * x)
+    for i in range(0, 3):
+        w = 1 / (sem * sem + (u * x_err) ** 2)
+        aw = a * w[:, None]
+        cov = np.linalg.inv(a.T @ aw)
+        u, off = cov @ (aw.T @ y)
+
+    res = y - (u * x - off)
+    chi2 = np.sum(w * res * res)
+    dof = len(x) - 2
+    if dof > 0:
+        cov = cov * max(chi2 / dof, 1)
+
+    # c = sqrt(T_REF) / u, propagated to the covariance of (offset, c)
+    j = np.array([[0, 1], [-np.sqrt(T_REF) / (u * u), 0]])
+    cov_oc = j @ cov @ j.T
+    return (off, np.sqrt(T_REF) / u, cov_oc, chi2, dof)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate the HC-SR04 time offset over many runs.")
+    parser.add_argument("runs", nargs="*", default=["all"], help="all, comma separated IDs or a catalog query (default all)")
+    parser.add_argument("--model", default="rk_air", choices=sorted(models.MODELS), help="k_B model of the grid (default rk_air)")
+    parser.add_argument("--range", nargs=2, type=float, default=[-200, 200], metavar=("FROM", "TO"), help="offset grid range in us (default -200 200)")
+    parser.add_argument("--step", type=float, default=0.1, help="offset grid step in us (default 0.1)")
+    parser.add_argument("--max-dev", type=float, default=0.25, help="drop runs whose mean k_B at zero offset is off by more than this fraction (default 0.25)")
+    parser.add_argument("--plot", action="store_true", help="plot chi^2 and the mean k_B against the offset")
+    args = parser.parse_args()
+
+    csv_locs = catalog.select_runs(" ".join(args.runs))
+    t0 = time.perf_counter()
+    runs = []
+    for csv_loc, r in zip(csv_locs, multirun.map_runs(load_columns, csv_locs, progress=False)):
+        if r is None:
+            continue
+        if models.needs_pressure(args.model) and r[3] is None:
+            continue
+        kb0 = np.mean(kb_model(args.model, r[1], r[2], r[0], r[3]))
+        if abs(kb0 / util.K_B - 1) > args.max_dev:
+            print("{0}: mean k_B {1:.4f} at zero offset, left out.".format(csv_loc, kb0))
+            continue
+        runs.append(r)
+    t_load = time.perf_counter() - t0
+    if len(runs) < 3:
+        print("At least 3 usable runs are needed, {} found.".format(len(runs)))
+        exit()
+
+    n_samples = sum(len(r[1]) for r in runs)
+    distances = np.unique([r[0] for r in runs])
+    print("{0} runs, {1} samples, {2} distances from {3:.3f} to {4:.3f} m (loaded in {5:.2f} s).".format(len(runs), n_samples, len(distances), distances[0], distances[-1], t_load))
+
+    offsets = np.arange(args.range[0], args.range[1] + args.step / 2, args.step) * 10 ** (-6)
+    t0 = time.perf_counter()
+    kb_mean, kb_err = kb_grid(offsets, runs, args.model)
+    chi2, wmean = grid_chi2(kb_mean, kb_err)
+    t_grid = time.perf_counter() - t0
+    print("Grid: {0} offsets x {1} samples in {2:.2f} s ({3:.1f} M k_B/s).".format(len(offsets), n_samples, t_grid, len(offsets) * n_samples / t_grid / 10 ** 6))
+
+    best, low, high, chi2_min, at_edge = grid_optimum(offsets, chi2, len(runs) - 1)
+    print()
+    print("Grid ({} model):".format(args.model))
+    print("  Offset of best agreement between runs: {0:.1f} us (interval {1:.1f} to {2:.1f} us), chi^2/dof {3:.2f}".format(best * 1e6, low * 1e6, high * 1e6, chi2_min / (len(runs) - 1)))
+    if at_edge:
+        print("  The optimum is at the edge of the grid; widen --range.")
+    print("  Weighted mean k_B there: {:.5f}".format(wmean[np.argmin(chi2)]))
+    for x in grid_crossings(offsets, wmean, util.K_B):
+        print("  Weighted mean k_B equals the true k_B at {:.1f} us".format(x * 1e6))
+
+    off, c_ref, cov, chi2_fit, dof = wls_fit(runs)
+    off_err = np.sqrt(cov[0, 0])
+    c_err = np.sqrt(cov[1, 1])
+    kb_c = c_ref * c_ref * util.MOLAR_MASS_AIR / (util.GAMMA * util.N_A * T_REF)
+    print()
+    print("Weighted least squares of tt against distance:")
+    print("  Offset: {0:.1f} +/- {1:.1f} us".format(off * 1e6, off_err * 1e6))
+    print("  Speed of sound at {0} K: {1:.2f} +/- {2:.2f} m/s (correlation {3:.2f})".format(T_REF, c_ref, c_err, cov[0, 1] / (off_err * c_err)))
+    print("  k_B from it (ideal gas, air): {0:.4f} +/- {1:.4f}".format(kb_c, 2 * kb_c * c_err / c_ref))
+    print("  chi^2/dof {0:.2f}".format(chi2_fit / dof if dof > 0 else float("nan")))
+    print()
+    print("Suggested SR04_OFFSET for main_ard.py: {:.0f} us".format(SR04_OFFSET + off * 1e6))
+
+    if args.plot:
+        import matplotlib.pyplot as plt
+        fig = plt.figure()
+        ax1 = fig.add_subplot(211)
+        ax2 = fig.add_subplot(212, sharex=ax1)
+        ax1.plot(offsets * 1e6, chi2, '-')
+        ax1.axvline(best * 1e6, color='k', linestyle='dashed')
+        ax1.set_ylabel(r"$\chi^2$ of run means")
+        ax2.plot(offsets * 1e6, wmean, '-', label="Weighted mean")
+        ax2.axhline(util.K_B, color='#ff7f0e', linestyle='dashed', label=r"True $k_B$")
+        ax2.set_xlabel(r"Offset ($\mu s$)")
+        ax2.set_ylabel(r"Derived $k_B$ ($10^{-23} J K^{-1}$)")
+        ax2.legend(loc="lower right")
+        plt.show()
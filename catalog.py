@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+
+# catalog.py - indexed catalog of the runs in data/
+#
+# Keeps per-run metadata and per-model k_B summaries in a SQLite file, so
+# multi-run comparisons can select runs and get their summaries without
+# opening every CSV. The catalog is updated incrementally: a CSV is only
+# read again when its size or modification time changed, or when the code
+# the summaries are derived with (cache.SOURCES) or the list of models
+# changed.
+#
+# Usage: python3 catalog.py update
+#        python3 catalog.py list [distance=1.34] [since=2019-06-01] [until=2019-06-04]
+#                                [min_rows=50] [schema=pres] [model=rk_air]
+#
+# A run's id is its file name, the Unix time at which main_ard.py started
+# it. Distances are the "Exp Distance" column (round trip, m).
+
+import datetime
+import glob
+import os
+import sqlite3
+import sys
+
+import numpy as np
+
+import models
+import runio
+import multirun
+import cache
+
+CATALOG_LOC = "data/catalog.sqlite"
+
+# Two distances closer than this (m) are the same distance in queries
+DISTANCE_TOL = 0.005
+
+# k_B models summarized per run (see models.py)
+MODELS = list(models.MODELS)
+
+SQL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    schema TEXT,
+    rows INTEGER NOT NULL,
+    distance REAL,
+    start_time REAL,
+    duration REAL,
+    temp_min REAL,
+    temp_max REAL,
+    pres_min REAL,
+    pres_max REAL
+);
+CREATE INDEX IF NOT EXISTS runs_distance ON runs (distance);
+CREATE INDEX IF NOT EXISTS runs_start_time ON runs (start_time);
+CREATE TABLE IF NOT EXISTS summaries (
+    run_id TEXT NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    model TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    kb_mean REAL,
+    kb_std REAL,
+    err_mean REAL,
+    PRIMARY KEY (run_id, model)
+);
+"""
+
+def connect(catalog_loc=CATALOG_LOC):
+    conn = sqlite3.connect(catalog_loc)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    # A catalog from before the source column is rebuilt from scratch
+    columns = [r["name"] for r in conn.execute("PRAGMA table_info(runs)")]
+    if columns and "source" not in columns:
+        conn.executescript("DROP TABLE summaries; DROP TABLE runs;")
+    conn.executescript(SQL_SCHEMA)
+    return conn
+
+# Stamp of the code and the models the summaries are derived with; a run
+# summarized under another stamp is summarized again
+def source_stamp():
+    return "{0}:{1}".format(cache.source_hash(), ",".join(MODELS))
+
+# Metadata and per-model summaries of one data CSV
+def summarize_run(csv_loc):
+    header = runio.read_header(csv_loc)
+    col = runio.read_columns(csv_loc, ["Time", "Measured Time Diff", "Temperature", "Pressure"])
+    time_arr = col["Time"]
+
+    run_id = os.path.splitext(os.path.basename(csv_loc))[0]
+    meta = {
+        "id": run_id,
+        "schema": runio.schema(header),
+        "rows": len(time_arr),
+        "distance": None,
+        "start_time": float(run_id) if run_id.isdigit() else None,
+        "duration": None,
+        "temp_min": None,
+        "temp_max": None,
+        "pres_min": None,
+        "pres_max": None,
+    }
+    summaries = []
+    if len(time_arr) == 0:
+        return (meta, summaries)
+
+    distance_d = runio.read_distance(csv_loc)
+    tt_arr = col["Measured Time Diff"]
+    temp_arr = col["Temperature"]
+    pres_arr = col.get("Pressure")
+
+    meta["distance"] = distance_d
+    meta["duration"] = time_arr[-1] - time_arr[0]
+    meta["temp_min"] = np.min(temp_arr)
+    meta["temp_max"] = np.max(temp_arr)
+    if pres_arr is not None:
+        meta["pres_min"] = np.min(pres_arr)
+        meta["pres_max"] = np.max(pres_arr)
+
+    # Runs without a pressure sensor are summarized at the standard pressure,
+    # as the plot scripts derive them
+    kb, err, avg = models.evaluate(MODELS, tt_arr, temp_arr, distance_d, runio.pressure(col))
+    kb_mean = np.mean(kb, axis=1)
+    err_mean = np.mean(err, axis=1)
+    kb_std = np.std(kb, axis=1, ddof=1) if len(tt_arr) > 1 else [None] * len(MODELS)
+    for i, model in enumerate(MODELS):
+        summaries.append((model, len(tt_arr), kb_mean[i], kb_std[i], err_mean[i]))
+    return (meta, summaries)
+
+# Bring the catalog up to date with the CSVs in data_dir (or the given
+# csv_locs): new and changed files are summarized (in parallel), removed
+# files are dropped. Returns the number of files summarized.
+def update(conn, data_dir="data", csv_locs=None, progress=False):
+    full_scan = csv_locs is None
+    if full_scan:
+        csv_locs = sorted(glob.glob(os.path.join(data_dir, "*.csv")))
+
+    known = {r["path"]: (r["size"], r["mtime_ns"], r["source"]) for r in conn.execute("SELECT path, size, mtime_ns, source FROM runs")}
+    source = source_stamp()
+    stats = {}
+    changed = []
+    for csv_loc in csv_locs:
+        try:
+            st = os.stat(csv_loc)
+        except OSError:
+            continue
+        stats[csv_loc] = (st.st_size, st.st_mtime_ns)
+        if known.get(csv_loc) != stats[csv_loc] + (source,):
+            changed.append(csv_loc)
+
+    results = multirun.map_runs(summarize_run, changed, progress=progress)
+    with conn:
+        for csv_loc, r in zip(changed, results):
+            if r is None:
+                continue
+            meta, summaries = r
+            conn.execute("DELETE FROM runs WHERE id = ?", (meta["id"],))
+            conn.execute(
+                "INSERT INTO runs VALUES (:id, :path, :size, :mtime_ns, :source, :schema, :rows, :distance, :start_time, :duration, :temp_min, :temp_max, :pres_min, :pres_max)",
+                dict(meta, path=csv_loc, size=stats[csv_loc][0], mtime_ns=stats[csv_loc][1], source=source))
+            conn.executemany(
+                "INSERT INTO summaries VALUES (?, ?, ?, ?, ?, ?)",
+                [(meta["id"],) + s for s in summaries])
+        if full_scan:
+            for path in set(known) - set(stats):
+                conn.execute("DELETE FROM runs WHERE path = ?", (path,))
+    return len(changed)
+
+def _timestamp(date):
+    return datetime.datetime.strptime(date, "%Y-%m-%d").timestamp()
+
+# Runs matching the query, oldest first. since and until are dates
+# (YYYY-MM-DD, local time); until is inclusive.
+def find_runs(conn, distance=None, since=None, until=None, min_rows=1, schema=None, tol=DISTANCE_TOL):
+    where = ["rows >= ?"]
+    params = [min_rows]
+    if distance is not None:
+        where.append("distance BETWEEN ? AND ?")
+        params += [distance - tol, distance + tol]
+    if since is not None:
+        where.append("start_time >= ?")
+        params.append(_timestamp(since))
+    if until is not None:
+        where.append("start_time < ?")
+        params.append(_timestamp(until) + 86400)
+    if schema is not None:
+        where.append("schema = ?")
+        params.append(schema)
+    return conn.execute("SELECT * FROM runs WHERE {} ORDER BY start_time, id".format(" AND ".join(where)), params).fetchall()
+
+# The summary of one model for each run id (None where the run has none)
+def summaries(conn, run_ids, model):
+    rows = conn.execute("SELECT * FROM summaries WHERE model = ? AND run_id IN ({})".format(",".join("?" * len(run_ids))), [model] + list(run_ids))
+    by_id = {r["run_id"]: r for r in rows}
+    return [by_id.get(i) for i in run_ids]
+
+# Distance, number of samples and the summaries of the given models for
+# each CSV, in input order, after updating the catalog for just these
+# files. A run that is missing or lacks one of the models gives None.
+def run_summaries(csv_locs, models, catalog_loc=CATALOG_LOC):
+    conn = connect(catalog_loc)
+    try:
+        update(conn, csv_locs=csv_locs)
+        by_path = {r["path"]: r for r in conn.execute("SELECT * FROM runs WHERE path IN ({})".format(",".join("?" * len(csv_locs))), csv_locs)}
+        run_ids = [by_path[c]["id"] if c in by_path else None for c in csv_locs]
+        summ = {m: summaries(conn, run_ids, m) for m in models}
+    finally:
+        conn.close()
+
+    results = []
+    for i, csv_loc in enumerate(csv_locs):
+        s = [summ[m][i] for m in models]
+        if csv_loc not in by_path or None in s:
+            print("No {0} summary of {1} in the catalog.".format("/".join(models), csv_loc))
+            results.append(None)
+            continue
+        results.append((by_path[csv_loc]["distance"], by_path[csv_loc]["rows"], s))
+    return results
+
+# Parse "distance=1.34 since=2019-06-01 ..." into find_runs() arguments
+def parse_query(query):
+    args = {}
+    for token in query.split():
+        key, value = token.split("=", 1)
+        if key == "distance":
+            args[key] = float(value)
+        elif key == "min_rows":
+            args[key] = int(value)
+        elif key in ("since", "until", "schema", "model"):
+            args[key] = value
+        else:
+            raise Exception("Unknown query key {}.".format(key))
+    return args
+
+# Paths of the runs matching a query string, after updating the catalog
+def select(query, catalog_loc=CATALOG_LOC, data_dir="data"):
+    args = parse_query(query)
+    args.pop("model", None)
+    conn = connect(catalog_loc)
+    try:
+        update(conn, data_dir)
+        return [r["path"] for r in find_runs(conn, **args)]
+    finally:
+        conn.close()
+
+# Paths of the runs given as "all", comma separated ids or a catalog query
+def select_runs(selection, catalog_loc=CATALOG_LOC, data_dir="data"):
+    selection = selection.strip()
+    if selection == "all":
+        return sorted(glob.glob(os.path.join(data_dir, "*.csv")))
+    if "=" in selection:
+        return select(selection, catalog_loc, data_dir)
+    return [os.path.join(data_dir, "{}.csv".format(d.strip())) for d in selection.split(",")]
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("update", "list"):
+        print("Usage: python3 catalog.py update | list [key=value ...]")
+        exit()
+
+    conn = connect()
+    n = update(conn, progress=sys.argv[1] == "update")
+    print("{} runs updated.".format(n))
+
+    if sys.argv[1] == "list":
+        args = parse_query(" ".join(sys.argv[2:]))
+        model = args.pop("model", "rk_air")
+        runs = find_runs(conn, **args)
+        summ = summaries(conn, [r["id"] for r in runs], model)
+        print("{0:<12} {1:<19} {2:>8} {3:>6} {4:>9} {5:<7} {6:>12} {7:>10}".format("id", "start", "distance", "rows", "duration", "schema", "k_B " + model, "error"))
+        for r, s in zip(runs, summ):
+            start = datetime.datetime.fromtimestamp(r["start_time"]).strftime("%Y-%m-%d %H:%M:%S") if r["start_time"] else "-"
+            kb = "{:12.6f}".format(s["kb_mean"]) if s is not None else "{:>12}".format("-")
+            err = "{:10.6f}".format(s["err_mean"]) if s is not None else "{:>10}".format("-")
+            print("{0:<12} {1:<19} {2:>8.3f} {3:>6} {4:>9.1f} {5:<7} {6} {7}".format(r["id"], start, r["distance"], r["rows"], r["duration"], r["schema"] or "-", kb, err))
+        print("{} runs.".format(len(runs)))
+    conn.close()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+# export.py - fast figure export for main_ard.py and the plot scripts
+#
+# A vector figure (EPS, PDF, SVG) of a long run holds a path for every data
+# point, error bar and cap, which makes it slow to write and to open.
+# export() rasterizes the artists with at least RASTER_MIN_POINTS points
+# (the scatter, error bars and averages) at RASTER_DPI in PDF and SVG and
+# keeps the axes, ticks, labels and legends as vectors. EPS is written as
+# plain vectors: its raster images are uncompressed and far larger than the
+# paths. export_background() pickles the figure and exports it in a fresh
+# Python process, so a program can exit while a large figure is written.
+#
+# Usage: python3 export.py [--points 10000] [--formats eps,pdf,svg,png]
+# times the export of a plot.py figure of a synthetic run, with and without
+# rasterizing.
+
+import argparse
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+
+# matplotlib is imported where it is used, so main_ard.py can read its
+# options (PLOT_FORMAT, FORMATS) before loading matplotlib
+
+# Format of the figures saved by main_ard.py and the plot scripts (EPS
+# before; PDF with rasterized data is far smaller and faster to write)
+PLOT_FORMAT = "pdf"
+
+FORMATS = ["eps", "pdf", "svg", "png"]
+VECTOR_FORMATS = ["eps", "pdf", "svg"]
+
+# Vector formats in which the dense artists are rasterized
+RASTER_FORMATS = ["pdf", "svg"]
+
+# Artists with at least this many points are rasterized in vector output
+RASTER_MIN_POINTS = 1000
+
+# Resolution of the rasterized artists (dpi)
+RASTER_DPI = 300
+
+def artist_points(a):
+    from matplotlib.collections import Collection, LineCollection
+    from matplotlib.lines import Line2D
+    if isinstance(a, Line2D):
+        return len(a.get_xdata())
+    if isinstance(a, LineCollection):
+        return len(a.get_segments())
+    if isinstance(a, Collection):
+        return len(a.get_offsets())
+    return 0
+
+# Rasterize the dense artists of every axis. Returns how many there were.
+def rasterize_dense(fig, min_points=RASTER_MIN_POINTS):
+    n = 0
+    for ax in fig.axes:
+        for a in list(ax.lines) + list(ax.collections):
+            if artist_points(a) >= min_points:
+                a.set_rasterized(True)
+                n += 1
+    return n
+
+# Save fig to loc (format from the file extension unless given)
+def export(fig, loc, fmt=None, dpi=None, rasterize=True):
+    if fmt is None:
+        fmt = os.path.splitext(loc)[1][1:].lower()
+    if fmt in RASTER_FORMATS:
+        if rasterize:
+            rasterize_dense(fig)
+        if dpi is None:
+            dpi = RASTER_DPI
+    if dpi is None:
+        fig.savefig(loc, format=fmt)
+    else:
+        fig.savefig(loc, format=fmt, dpi=dpi)
+
+# export() in a new Python process (python3 export.py --figure ...), which
+# prints a line when the figure is saved. The figure is pickled to a
+# temporary file that the child removes. A fresh process shares no threads
+# or locks with the caller (e.g. the serial reader of main_ard.py), unlike a
+# fork. Returns the pid of the child, or None if the figure was saved here.
+def export_background(fig, loc, fmt=None, dpi=None, rasterize=True):
+    try:
+        fd, fig_loc = tempfile.mkstemp(prefix="kb_figure_", suffix=".pickle")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(fig, f)
+    except Exception as e:
+        print(e)
+        export(fig, loc, fmt, dpi, rasterize)
+        print("Plot saved to {}.".format(loc))
+        return None
+
+    cmd = [sys.executable, os.path.abspath(__file__), "--figure", fig_loc, "--out", loc]
+    if fmt is not None:
+        cmd += ["--format", fmt]
+    if dpi is not None:
+        cmd += ["--dpi", str(dpi)]
+    if not rasterize:
+        cmd.append("--no-rasterize")
+    sys.stdout.flush()
+    return subprocess.Popen(cmd).pid
+
+# Export a figure pickled by export_background(), and remove the pickle
+def export_pickled(fig_loc, loc, fmt=None, dpi=None, rasterize=True):
+    import matplotlib
+    matplotlib.use("Agg")
+    try:
+        with open(fig_loc, "rb") as f:
+            fig = pickle.load(f)
+    finally:
+        os.remove(fig_loc)
+    export(fig, loc, fmt, dpi, rasterize)
+    print("Plot saved to {}.".format(loc))
+
+def bench_figure(n):
+    import plot
+    import util
+    import benchmark
+    dis = 0.548
+    t, tt, temp, pres = benchmark.make_columns(n, dis)
+    kb = util.kb_from_tt_rk_n2_arr(tt, temp, dis, pres)
+    err = util.err_from_tt_pct_arr(tt, temp, dis) * kb
+    return plot.make_figure(t, temp, pres, kb, err, util.cum_mean_arr(kb))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the figure export of a synthetic run.")
+    parser.add_argument("--points", type=int, default=10000, help="samples in the run (default 10000)")
+    parser.add_argument("--formats", default=",".join(FORMATS), help="formats to time (default all)")
+    parser.add_argument("--figure", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    parser.add_argument("--format", help=argparse.SUPPRESS)
+    parser.add_argument("--dpi", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--no-rasterize", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # The child process of export_background()
+    if args.figure:
+        try:
+            export_pickled(args.figure, args.out, args.format, args.dpi, not args.no_rasterize)
+        except Exception as e:
+            print(e)
+            sys.exit(1)
+        sys.exit()
+
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    print("{0:<6} {1:<12} {2:>9} {3:>10}".format("format", "mode", "seconds", "size"))
+    with tempfile.TemporaryDirectory(prefix="kb_export_") as workdir:
+        for fmt in args.formats.split(","):
+            modes = [("vector", False), ("rasterized", True)] if fmt in RASTER_FORMATS else [("vector" if fmt in VECTOR_FORMATS else "raster", False)]
+            for mode, rasterize in modes:
+                fig = bench_figure(args.points)
+                loc = os.path.join(workdir, "{0}_{1}.{2}".format(args.points, mode, fmt))
+                t = time.perf_counter()
+                if rasterize:
+                    export(fig, loc)
+                else:
+                    fig.savefig(loc, format=fmt)
+                t = time.perf_counter() - t
+                plt.close(fig)
+                print("{0:<6} {1:<12} {2:>9.2f} {3:>7.0f} kB".format(fmt, mode, t, os.path.getsize(loc) / 1024))
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+# gases.py - registry of gas properties and mixtures
+#
+# A gas is a record of its molar mass, molar heat capacity at constant volume
+# (Cv / R, which gives the heat-capacity ratio gamma) and its VDW and RK
+# constants, in the units of util.py. The VDW and RK constants of a gas
+# without tabulated values are derived from its critical point. mixture()
+# combines gases by mole fraction: molar mass and Cv are mole-weighted, and
+# the VDW and RK constants follow the usual mixing rules
+#   a = (sum x_i sqrt(a_i))^2,  b = sum x_i b_i.
+# The fractions may be per-sample arrays (e.g. humid air from the relative
+# humidity of the BME680), and so is every property of the mixture. Pass a
+# record to models.evaluate() to derive a run under that gas. The file is
+# part of cache.SOURCES, so editing the registry invalidates the cached
+# results and the catalog summaries.
+#
+# Usage: python3 gases.py list
+#        python3 gases.py derive all | ID,ID,... | distance=1.34 ...
+#                         --gas o2 | n2:0.79,o2:0.21 | air [--rh 45]
+
+import argparse
+import math
+
+import numpy as np
+
+import util
+
+# Molar gas constant (J/(mol K))
+R = 8.314462618
+
+GASES = {}
+
+# A gas record from its molar mass (g/mol) and Cv / R; the molar mass in
+# kg/mol and gamma = Cp / Cv = (Cv + R) / Cv follow
+def _record(name, molar_mass_g, cv, vdw, rk):
+    return {
+        "name": name,
+        "molar_mass_g": molar_mass_g,
+        "molar_mass": molar_mass_g * 10 ** (-3),
+        "cv": cv,
+        "gamma": (cv + 1) / cv,
+        "vdw": vdw,
+        "rk": rk,
+    }
+
+# VDW constants (Pa m^6 / mol^2, L / mol) from the critical temperature (K)
+# and pressure (Pa)
+def vdw_from_critical(tc, pc):
+    return (27 * R * R * tc * tc / (64 * pc), R * tc / (8 * pc) * 10 ** 3)
+
+# RK constants (Pa m^6 K^0.5 / mol^2, L / mol) from the critical point
+def rk_from_critical(tc, pc):
+    return (0.42748 * R * R * tc ** 2.5 / pc, 0.08664 * R * tc / pc * 10 ** 3)
+
+def register(name, molar_mass_g, cv, tc=None, pc=None, vdw=None, rk=None):
+    if vdw is None:
+        vdw = vdw_from_critical(tc, pc)
+    if rk is None:
+        rk = rk_from_critical(tc, pc)
+    GASES[name] = _record(name, molar_mass_g, cv, vdw, rk)
+    return GASES[name]
+
+def gas(name):
+    if name not in GASES:
+        raise Exception("Unknown gas {0} (known: {1}).".format(name, ", ".join(sorted(GASES))))
+    return GASES[name]
+
+# N2 and air keep the constants of util.py (gamma = 1.40), so models.py
+# gives the same k_B as the util.py functions
+register("n2", util.MOLAR_MASS_G_N2, 2.5, vdw=(util.VDW_A_N2, util.VDW_B_N2), rk=(util.RK_A_N2, util.RK_B_N2))
+register("air", util.MOLAR_MASS_G_AIR, 2.5, vdw=(util.VDW_A_AIR, util.VDW_B_AIR), rk=(util.RK_A_AIR, util.RK_B_AIR))
+register("o2", 31.998, 2.535, tc=154.58, pc=5.043e6)
+register("ar", 39.948, 1.5, tc=150.69, pc=4.863e6)
+register("he", 4.0026, 1.5, tc=5.195, pc=0.2275e6)
+register("co2", 44.009, 3.465, tc=304.13, pc=7.3773e6)
+register("h2o", 18.015, 3.039, tc=647.10, pc=22.064e6)
+
+# A gas record of a mixture. composition maps gas names to mole fractions
+# (numbers or per-sample arrays, normalized to a sum of 1).
+def mixture(composition, name=None):
+    names = list(composition)
+    if name is None:
+        name = "+".join(names)
+    if len(names) == 1:
+        return dict(gas(names[0]), name=name)
+
+    records = [gas(n) for n in names]
+    x = [np.asarray(composition[n], dtype=float) for n in names]
+    total = sum(x)
+    x = [xi / total for xi in x]
+
+    molar_mass_g = sum(xi * r["molar_mass_g"] for xi, r in zip(x, records))
+    cv = sum(xi * r["cv"] for xi, r in zip(x, records))
+    eos = {}
+    for kind in ["vdw", "rk"]:
+        sqrt_a = sum(xi * math.sqrt(r[kind][0]) for xi, r in zip(x, records))
+        eos[kind] = (sqrt_a * sqrt_a, sum(xi * r[kind][1] for xi, r in zip(x, records)))
+    return _record(name, molar_mass_g, cv, eos["vdw"], eos["rk"])
+
+# Saturation vapour pressure of water (Pa) at temp (K), Buck (1996)
+def saturation_pressure(temp):
+    t = np.asarray(temp, dtype=float) - 273.15
+    return 611.21 * np.exp((18.678 - t / 234.5) * (t / (257.14 + t)))
+
+# Mole fraction of water vapour at relative humidity rh (%), temperature
+# temp (K) and pressure pres (Pa)
+def water_fraction(rh, temp, pres):
+    x = np.asarray(rh, dtype=float) / 100 * saturation_pressure(temp) / np.asarray(pres, dtype=float)
+    return np.clip(x, 0, 1)
+
+# A (dry) composition with water vapour at relative humidity rh, per sample
+def humid(composition, rh, temp, pres, name=None):
+    x = water_fraction(rh, temp, pres)
+    total = sum(composition.values())
+    wet = {n: (1 - x) * f / total for n, f in composition.items()}
+    wet["h2o"] = wet.get("h2o", 0) + x
+    if name is None:
+        name = "humid " + "+".join(composition)
+    return mixture(wet, name)
+
+def humid_air(rh, temp, pres):
+    return humid({"air": 1}, rh, temp, pres, "humid air")
+
+# Composition of a gas name or a list like "n2:0.79,o2:0.21"
+def parse_composition(spec):
+    if ":" not in spec:
+        return {spec.strip(): 1.0}
+    composition = {}
+    for part in spec.split(","):
+        n, x = part.split(":")
+        composition[n.strip()] = float(x)
+    return composition
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List the registered gases, or derive k_B of runs under another gas.")
+    parser.add_argument("command", choices=["list", "derive"])
+    parser.add_argument("runs", nargs="*", default=["all"], help="derive: all, comma separated IDs or a catalog query")
+    parser.add_argument("--gas", default="air", help="gas name or composition like n2:0.79,o2:0.21 (default air)")
+    parser.add_argument("--rh", type=float, help="relative humidity (%%) of the gas, mixed in as water vapour")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        print("{0:<6} {1:>9} {2:>7} {3:>7} {4:>9} {5:>9} {6:>9} {7:>9}".format("gas", "M (g/mol)", "Cv/R", "gamma", "vdw a", "vdw b", "rk a", "rk b"))
+        for name, g in GASES.items():
+            print("{0:<6} {1:>9.4f} {2:>7.3f} {3:>7.4f} {4:>9.4f} {5:>9.5f} {6:>9.4f} {7:>9.5f}".format(name, g["molar_mass_g"], g["cv"], g["gamma"], g["vdw"][0], g["vdw"][1], g["rk"][0], g["rk"][1]))
+        exit()
+
+    import catalog
+    import models
+    import runio
+
+    try:
+        composition = parse_composition(args.gas)
+        for n in composition:
+            gas(n)
+    except Exception as e:
+        print(e)
+        exit()
+    print("{0:<32} {1:>8} {2:>8} {3:>8} {4:>8} {5:>8}".format("run", "samples", "x_h2o", "ideal", "vdw", "rk"))
+    for csv_loc in catalog.select_runs(" ".join(args.runs)):
+        try:
+            cols = runio.read_columns(csv_loc, ["Measured Time Diff", "Temperature", "Pressure"])
+            tt_arr = cols["Measured Time Diff"]
+            if len(tt_arr) == 0:
+                raise Exception("No samples in {}.".format(csv_loc))
+            temp_arr = cols["Temperature"]
+            pres_arr = runio.pressure(cols)
+            g = mixture(composition, args.gas)
+            x_w = 0
+            if args.rh is not None:
+                g = humid(composition, args.rh, temp_arr, pres_arr)
+                x_w = water_fraction(args.rh, temp_arr, pres_arr)
+            kb, err, avg = models.evaluate(["ideal", "vdw", "rk"], tt_arr, temp_arr, runio.read_distance(csv_loc), pres_arr, g)
+        except Exception as e:
+            print("{0}: {1}".format(csv_loc, e))
+            continue
+        kb_mean = np.mean(kb, axis=1)
+        print("{0:<32} {1:>8} {2:>8.4f} {3:>8.4f} {4:>8.4f} {5:>8.4f}".format(csv_loc, len(tt_arr), np.mean(x_w), kb_mean[0], kb_mean[1], kb_mean[2]))
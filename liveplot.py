@@ -0,0 +1,327 @@
+# liveplot.py - blitted, decimated live plotting for main_ard.py
+#
+# Note: This file is not intended to run independently.
+
+import numpy as np
+
+import util
+
+# Indices of the smallest and of the largest sample in each bin of width
+# consecutive samples (the last bin may be shorter)
+def _bin_minmax(y_arr, width):
+    n = len(y_arr)
+    if n == 0:
+        return (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    rows = -(-n // width)
+    padded = np.empty(rows * width)
+    padded[:n] = y_arr
+    padded[n:] = y_arr[-1]
+    padded = padded.reshape(rows, width)
+
+    first = np.arange(rows) * width
+    lo = np.minimum(first + np.argmin(padded, axis=1), n - 1)
+    hi = np.minimum(first + np.argmax(padded, axis=1), n - 1)
+    return (lo, hi)
+
+# Indices of the smallest and largest sample in each of n_bins consecutive
+# bins (plus the first and last sample), in increasing order. Plotting only
+# these keeps the envelope of the series at one bin per pixel column.
+def decimate_minmax(y_arr, n_bins):
+    y_arr = np.asarray(y_arr, dtype=float)
+    n = len(y_arr)
+    n_bins = max(int(n_bins), 1)
+    if n <= 2 * n_bins:
+        return np.arange(n)
+
+    lo, hi = _bin_minmax(y_arr, -(-n // n_bins))
+    return np.unique(np.concatenate(([0, n - 1], lo, hi)))
+
+# decimate_minmax() of a growing series, kept up to date incrementally
+#
+# The min and max index of every bin are kept between frames. Only the last
+# (partial) bin and the new samples are binned again, and when the bins no
+# longer fit in n_bins, neighbouring bins are merged and the bin width
+# doubles. A frame costs O(new samples + n_bins), however long the run is.
+class MinMaxDecimator:
+    def __init__(self):
+        self.reset(1)
+
+    def reset(self, n_bins):
+        self.n_bins = n_bins
+        self.width = 1
+        self.n = 0
+        self.lo = np.empty(0, dtype=np.int64)
+        self.hi = np.empty(0, dtype=np.int64)
+
+    # Merge pairs of bins (a trailing odd bin stays alone)
+    def _merge(self, y_arr):
+        k = len(self.lo) // 2 * 2
+        pick = np.arange(k // 2)
+        lo = self.lo[:k].reshape(-1, 2)
+        hi = self.hi[:k].reshape(-1, 2)
+        lo = lo[pick, (y_arr[lo[:, 1]] < y_arr[lo[:, 0]]).astype(int)]
+        hi = hi[pick, (y_arr[hi[:, 1]] > y_arr[hi[:, 0]]).astype(int)]
+        self.lo = np.concatenate((lo, self.lo[k:]))
+        self.hi = np.concatenate((hi, self.hi[k:]))
+        self.width *= 2
+
+    # Indices to plot of y_arr, which extends the series of the last call
+    def update(self, y_arr, n_bins):
+        y_arr = np.asarray(y_arr, dtype=float)
+        n = len(y_arr)
+        n_bins = max(int(n_bins), 1)
+        if n_bins != self.n_bins or n < self.n:
+            self.reset(n_bins)
+
+        while -(-n // self.width) > n_bins:
+            self._merge(y_arr)
+
+        first = self.n // self.width
+        start = first * self.width
+        lo, hi = _bin_minmax(y_arr[start:n], self.width)
+        self.lo = np.concatenate((self.lo[:first], lo + start))
+        self.hi = np.concatenate((self.hi[:first], hi + start))
+        self.n = n
+        return np.unique(np.concatenate(([0, n - 1], self.lo, self.hi)))
+
+# A data series drawn on one axis: a plain line or marker set
+class LineSeries:
+    def __init__(self, artist, x_col, y_col):
+        self.artist = artist
+        self.x_col = x_col
+        self.y_col = y_col
+        self.decimator = MinMaxDecimator()
+
+    def artists(self):
+        return [self.artist]
+
+    def bounds(self, snap, start):
+        x = snap[self.x_col][start:]
+        y = snap[self.y_col][start:]
+        return (x[0], x[-1], np.min(y), np.max(y))
+
+    def set_data(self, snap, idx):
+        x = snap[self.x_col]
+        y = snap[self.y_col]
+        if idx is not None:
+            x = x[idx]
+            y = y[idx]
+        self.artist.set_data(x, y)
+
+# Data points with error bars, from the lines of an ax.errorbar() container
+class ErrorBarSeries:
+    def __init__(self, lines, x_col, y_col, err_col):
+        self.line, (self.bottoms, self.tops), self.verts = lines
+        self.x_col = x_col
+        self.y_col = y_col
+        self.err_col = err_col
+        self.geometry = util.ErrorBarGeometry()
+        self.decimator = MinMaxDecimator()
+
+    def artists(self):
+        return [self.line, self.bottoms, self.tops, self.verts[0]]
+
+    def bounds(self, snap, start):
+        x = snap[self.x_col][start:]
+        y = snap[self.y_col][start:]
+        err = snap[self.err_col][start:]
+        return (x[0], x[-1], np.min(y - err), np.max(y + err))
+
+    def set_data(self, snap, idx):
+        x = snap[self.x_col]
+        y = snap[self.y_col]
+        low, up, seg = self.geometry.update(x, y, snap[self.err_col])
+        if idx is not None:
+            x, y, low, up, seg = x[idx], y[idx], low[idx], up[idx], seg[idx]
+        self.line.set_data(x, y)
+        self.bottoms.set_data(x, low)
+        self.tops.set_data(x, up)
+        self.verts[0].set_segments(seg)
+
+# A horizontal reference line over the whole time range, at value_fn()
+class HLineSeries:
+    def __init__(self, artist, x_col, value_fn):
+        self.artist = artist
+        self.x_col = x_col
+        self.value_fn = value_fn
+
+    def artists(self):
+        return [self.artist]
+
+    def bounds(self, snap, start):
+        x = snap[self.x_col]
+        y = self.value_fn()
+        return (x[0], x[-1], y, y)
+
+    def set_data(self, snap, idx):
+        x = snap[self.x_col]
+        y = self.value_fn()
+        self.artist.set_data([x[0], x[-1]], [y, y])
+
+# Live plot of the columns of a SampleStore
+#
+# The series are animated artists drawn over a cached background (blitting),
+# so a frame only redraws the data, and only when new samples have arrived.
+# The axes are rescaled, which needs a full redraw, only when the data leaves
+# the current limits. Long series are decimated, each on its own, to the
+# min/max of each pixel column: incrementally for a growing store, and over
+# the (bounded) window in ring mode. finalize() puts every point back before
+# the figure is saved. In ring mode the bounds come from the current window,
+# so the axes also shrink as old samples leave it.
+class LivePlot:
+    def __init__(self, fig, store, decimate=True):
+        self.fig = fig
+        self.canvas = fig.canvas
+        self.store = store
+        self.decimate = decimate
+
+        self.axes = []
+        self.series = {}
+        self.y_pad = {}
+        self.bounds = {}
+
+        self.seq = 0
+        self.background = None
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+
+    # y_pad: absolute margin around the data (None: 5% of the data range)
+    def add_axis(self, ax, y_pad=None):
+        self.axes.append(ax)
+        self.series[ax] = []
+        self.y_pad[ax] = y_pad
+        self.bounds[ax] = None
+
+    def add_series(self, ax, series):
+        self.series[ax].append(series)
+        for a in series.artists():
+            a.set_animated(True)
+
+    def add_line(self, ax, artist, x_col, y_col):
+        self.add_series(ax, LineSeries(artist, x_col, y_col))
+
+    def add_errorbar(self, ax, lines, x_col, y_col, err_col):
+        self.add_series(ax, ErrorBarSeries(lines, x_col, y_col, err_col))
+
+    def add_hline(self, ax, artist, x_col, value_fn):
+        self.add_series(ax, HLineSeries(artist, x_col, value_fn))
+
+    def _artists(self):
+        return [a for ax in self.axes for s in self.series[ax] for a in s.artists()]
+
+    def _on_draw(self, event):
+        # savefig() draws on a temporary canvas of the output format
+        if event is not None and event.canvas is not self.canvas:
+            return
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for ax in self.axes:
+            for s in self.series[ax]:
+                for a in s.artists():
+                    ax.draw_artist(a)
+
+    # Grow the data bounds of every axis by the samples from index start on
+    # (in ring mode, set them from the whole window)
+    def _update_bounds(self, snap, start):
+        if self.store.ring:
+            self.bounds = {ax: None for ax in self.axes}
+            start = 0
+        for ax in self.axes:
+            for s in self.series[ax]:
+                b = s.bounds(snap, start)
+                old = self.bounds[ax]
+                if old is not None:
+                    b = (min(b[0], old[0]), max(b[1], old[1]), min(b[2], old[2]), max(b[3], old[3]))
+                self.bounds[ax] = b
+
+    # Set new limits for every axis whose data left its limits. Returns
+    # whether any axis changed.
+    def _rescale(self, exact=False):
+        changed = False
+        for ax in self.axes:
+            b = self.bounds[ax]
+            if b is None:
+                continue
+            x0, x1 = ax.get_xlim()
+            y0, y1 = ax.get_ylim()
+            fits = x0 <= b[0] and b[1] <= x1 and y0 <= b[2] and b[3] <= y1
+            if not exact and fits and not (self.store.ring and self._too_wide(ax, b)):
+                continue
+
+            x_span = max(b[1] - b[0], 1)
+            if exact:
+                ax.set_xlim(b[0] - 0.05 * x_span, b[1] + 0.05 * x_span)
+            else:
+                # Leave room to the right so the time axis is not rescaled
+                # on every new sample
+                ax.set_xlim(b[0] - 0.05 * x_span, b[1] + 0.5 * x_span)
+
+            y_pad = self._y_pad(ax, b)
+            ax.set_ylim(b[2] - y_pad, b[3] + y_pad)
+            changed = True
+        return changed
+
+    def _y_pad(self, ax, b):
+        y_pad = self.y_pad[ax]
+        if y_pad is None:
+            y_pad = 0.05 * (b[3] - b[2]) or 0.01 * abs(b[3]) or 1
+        return y_pad
+
+    # Whether the limits of an axis leave far more room than the data in the
+    # ring window needs: more than half its time span on the left, or twice
+    # its padded y range
+    def _too_wide(self, ax, b):
+        x0, x1 = ax.get_xlim()
+        y0, y1 = ax.get_ylim()
+        x_span = max(b[1] - b[0], 1)
+        y_span = b[3] - b[2] + 2 * self._y_pad(ax, b)
+        return b[0] - x0 > 0.5 * x_span or y1 - y0 > 2 * y_span
+
+    def _set_data(self, snap, full=False):
+        for ax in self.axes:
+            n_bins = int(ax.bbox.width)
+            for s in self.series[ax]:
+                idx = None
+                if self.decimate and not full and hasattr(s, "y_col") and len(snap) > 2 * n_bins:
+                    if self.store.ring:
+                        idx = decimate_minmax(snap[s.y_col], n_bins)
+                    else:
+                        idx = s.decimator.update(snap[s.y_col], n_bins)
+                s.set_data(snap, idx)
+
+    # Draw the samples that arrived since the last call. Returns whether
+    # anything was drawn.
+    def update(self):
+        snap = self.store.snapshot()
+        n = len(snap)
+        if n == 0 or snap.seq == self.seq:
+            return False
+
+        start = max(n - (snap.seq - self.seq), 0)
+        self.seq = snap.seq
+        self._update_bounds(snap, start)
+        self._set_data(snap)
+
+        if self._rescale() or self.background is None:
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self.background)
+            self._draw_artists()
+            self.canvas.blit(self.fig.bbox)
+        self.canvas.flush_events()
+        return True
+
+    # Draw every sample with regular (non-animated) artists, e.g. before the
+    # figure is saved
+    def finalize(self):
+        snap = self.store.snapshot()
+        if len(snap) == 0:
+            return
+        self.seq = snap.seq
+        self.bounds = {ax: None for ax in self.axes}
+        self._update_bounds(snap, 0)
+        self._set_data(snap, full=True)
+        self._rescale(exact=True)
+        for a in self._artists():
+            a.set_animated(False)
@@ -17,6 +17,8 @@ import os
 import csv
 import itertools
 
+import samplelog
+
 import RPi.GPIO as GPIO
 
 import board
@@ -97,41 +99,17 @@ def temp_bmp():
 def file_name(suffix):
     return DATA_NAME + "." + str(suffix)
 
-# Saving the data
-def save_data():
-    h = ["Time", "Exp Distance", "Measured Time Diff", "Temperature", "Derived k_B", "Derived k_B Error"]
+# Data CSV columns
+DATA_HEADER = ["Time", "Exp Distance", "Measured Time Diff", "Temperature", "Derived k_B", "Derived k_B Error"]
 
+# Saving the data (the sample log written during the run becomes the CSV)
+def save_data():
     try:
-        with open(file_name("csv"), "w+") as f:
-            dict_writer = csv.DictWriter(f, h)
-
-            dict_writer.writeheader()
-            try:
-                count = len(time_arr)
-                if len(temp_arr) != count or len(tt_arr) != count or len(derived_kb_arr) != count:
-                    raise Exception("Different list lengths.")
-            except Exception as e:
-                print(e)
-            else:
-                pass
-
-            for i in range(0, count):
-                dict_writer.writerow({
-                    h[0]: time_arr[i],
-                    h[1]: distance_d,
-                    h[2]: tt_arr[i],
-                    h[3]: temp_arr[i],
-                    h[4]: derived_kb_arr[i],
-                    h[5]: kb_err_abs_arr[i]
-                })
-
-            f.close()
+        sample_log.finish(file_name("csv"))
         print("\nData saved to {}.\n".format(file_name('csv')))
     except Exception as e:
         print(e)
-    else:
-        pass
-    pass
+        print("The samples are kept in {}.\n".format(file_name('log')))
 
 # Save the plot
 def save_plot(fig):
@@ -219,6 +197,9 @@ distance_d = user_input("distance in cm", (1,200))
 
 distance_d = distance_d / 100 * 2
 
+# Crash-safe log of every sample, turned into the data CSV at exit
+sample_log = samplelog.SampleLog(file_name("log"), DATA_HEADER)
+
 print()
 print("NOTE: You can exit the recodring early by pressing ctrl + C.")
 
@@ -273,6 +254,8 @@ def main_controller(frame):
         derived_kb_arr.append(kb_d)
         kb_err_abs_arr.append(err_abs)
 
+        sample_log.append([t, distance_d, tt, temp, kb_d, err_abs])
+
         kb_d_avg = np.mean(derived_kb_arr)
 
         if len(time_arr) > 1:
@@ -6,24 +6,33 @@
 #
 # Some code excerpted from Physics 13BH/CS15B
 
-import util
-
-import sys
 import time
-import math
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-import numpy as np
-from scipy import stats
+
+# Startup times (s from the start of the script), reported once the live
+# plot is up
+T_START = time.perf_counter()
+startup = {}
+
+# Only the acquisition core is imported here; matplotlib and the live plot
+# are imported in the background (see import_plotting()) while the serial
+# port is opened and the first samples are buffered
+import util
+import samplelog
+import acquisition
+import protocol
+import export
+import runfile
+from store import SampleStore
+
+import argparse
+import threading
 import os
-import csv
-import itertools
 
 import serial
-import json
-import threading
 import serial.tools.list_ports
 
+startup["core imports"] = time.perf_counter() - T_START
+
 # Boltzmann constant (10^-23)
 K_B = 1.38064852
 
@@ -37,48 +46,26 @@ DATA_NAME = "data/{}".format(int(time.time()))
 def file_name(suffix):
     return DATA_NAME + "." + str(suffix)
 
-# Saving the data
-def save_data():
-    h = ["Time", "Exp Distance", "Measured Time Diff", "Temperature", "Derived k_B", "Derived k_B Error", "Pressure", "HC-SRO4 Raw"]
+# Data CSV columns
+DATA_HEADER = ["Time", "Exp Distance", "Measured Time Diff", "Temperature", "Derived k_B", "Derived k_B Error", "Pressure", "HC-SRO4 Raw"]
 
+# Saving the data (the sample log written during the run becomes the CSV)
+def save_data():
     try:
-        with open(file_name("csv"), "w+") as f:
-            dict_writer = csv.DictWriter(f, h)
-
-            dict_writer.writeheader()
-            try:
-                count = len(time_arr)
-                if len(temp_arr) != count or len(tt_arr) != count or len(derived_kb_arr) != count:
-                    raise Exception("Different list lengths.")
-            except Exception as e:
-                print(e)
-            else:
-                pass
-
-            for i in range(0, count):
-                dict_writer.writerow({
-                    h[0]: time_arr[i],
-                    h[1]: distance_d,
-                    h[2]: tt_arr[i],
-                    h[3]: temp_arr[i],
-                    h[4]: derived_kb_arr[i],
-                    h[5]: kb_err_abs_arr[i],
-                    h[6]: pres_arr[i],
-                    h[7]: tt_arr[i] - (SR04_OFFSET * 10 ** (-6))
-                })
-
-            f.close()
+        sample_log.finish(file_name("csv"))
         print("Data saved to {}.\n".format(file_name('csv')))
+        if args.kbr:
+            runfile.convert_csv(file_name("csv"), file_name("kbr"), SR04_OFFSET)
+            print("Run file saved to {}.\n".format(file_name('kbr')))
     except Exception as e:
         print(e)
-    else:
-        pass
-    pass
+        print("The samples are kept in {}.\n".format(file_name('log')))
 
-# Save the plot
+# Save the plot (with every sample, not the decimated live view)
 def save_plot(fig):
-    fig_now.savefig(file_name("eps"), format='eps')
-    print("Plot saved to {}.\n".format(file_name("eps")))
+    live.finalize()
+    print("Saving the plot to {} in the background.\n".format(file_name(PLOT_FORMAT)))
+    export.export_background(fig_now, file_name(PLOT_FORMAT))
 
 # Search for Arduino Serial Port
 def search_ard_serial_port():
@@ -105,116 +92,156 @@ def search_ard_serial_port():
             print("Will search again in {} seconds...".format(off_delay))
             time.sleep(off_delay)
 
+# Import the plotting modules (run in a background thread)
+def import_plotting():
+    global plt, LivePlot
+    import matplotlib.pyplot as plt
+    from liveplot import LivePlot
+    startup["plotting imports"] = time.perf_counter() - T_START
+
+def print_startup():
+    print("Startup: " + ", ".join("{0} {1:.2f} s".format(k, v) for k, v in sorted(startup.items(), key=lambda e: e[1])))
+    if prompt_time > 0:
+        print("(including {:.2f} s at the distance prompt)".format(prompt_time))
+
+# Stop the acquisition threads before the log is closed and the plot is
+# exported
 def exit_action():
-    if len(time_arr) > 0:
+    pipeline.stop()
+    if sample_log.count > 0:
         save_data()
         save_plot(fig_now)
+    else:
+        sample_log.close()
+        os.remove(file_name("log"))
 
 # Controller Constants
-DELAY = 1
+# Seconds between two checks of the live plot for new samples
+DELAY = 0.25
+
+plot_loader = threading.Thread(target=import_plotting, daemon=True)
+plot_loader.start()
+
+# Command line options, e.g. to run against virtual_ard.py:
+#   python3 main_ard.py --port /dev/pts/5 --distance 67
+parser = argparse.ArgumentParser(description="Measure the Boltzmann constant with the Arduino.")
+parser.add_argument("--port", help="serial port of the Arduino (default: search for it)")
+parser.add_argument("--distance", type=float, help="distance in cm (default: ask)")
+parser.add_argument("--mode", default="json", choices=["json", "binary"], help="serial protocol (default json)")
+parser.add_argument("--format", default=export.PLOT_FORMAT, choices=export.FORMATS, help="format of the saved plot (default {})".format(export.PLOT_FORMAT))
+parser.add_argument("--kbr", action="store_true", help="also save the data as a binary run file (see runfile.py)")
+args = parser.parse_args()
 
 # Arduino Serial Port Information
-SERIAL_ADR = search_ard_serial_port()
+SERIAL_ADR = args.port if args.port else search_ard_serial_port()
 SERIAL_PORT = 9600
-SERIAL_DELAY = 1
-
-distance_d = util.user_input("distance in cm", (1,400))
-distance_d = distance_d / 100 * 2
-
-# List storing values
-tt_arr = []
-time_arr = []
-temp_arr = []
-pres_arr = []
-
-derived_kb_arr = []
-kb_err_abs_arr = []
-
-kb_avg_arr = []
-
-t0 = time.perf_counter()
-
-# Arduino Data Collecting Process
-def data_collection_ard():
-    global tt_arr, time_arr, temp_arr, derived_kb_arr, kb_err_abs_arr, kb_avg_arr, pres_arr
-    try:
-        ser = serial.Serial(SERIAL_ADR, SERIAL_PORT, timeout=20)
-    except Exception as e:
-        print(e)
-        print("FATAL ERROR. EARLY EXIT.")
-        return
-    else:
-        pass
 
-    while True:
-        l = ser.readline()
-        l = l.decode('utf-8')
-        try:
-            l_json = json.loads(l)
-            tt_us = l_json['tt_us']
-            temp = l_json['temp']
-            pres = l_json['pres']
-            if tt_us == 0:
-                raise Exception("Zero Time Diff.")
-        except Exception as e:
-            print(e)
-            print("Serial reads:")
-            print(l)
-        else:
-            tt = (tt_us + SR04_OFFSET) * 10 ** (-6)
-            temp = temp + 273.15
-
-            c_s = util.c_from_tt(tt, distance_d)
-            #kb_d = util.kb_from_tt(tt, temp, distance_d)
-            #kb_d = util.kb_from_tt_vdw_n2_aprx(tt, temp, distance_d)
-            #kb_d = util.kb_from_tt_vdw_n2(tt, temp, distance_d, pres)
-            #kb_d = util.kb_from_tt_rk_air(tt, temp, distance_d, pres)
-            kb_d = util.kb_from_tt_rk_n2(tt, temp, distance_d, pres)
+# Serial protocol: "json", or "binary" to switch the firmware to compact
+# binary packets at protocol.BINARY_BAUD (falls back to JSON if it refuses)
+SERIAL_MODE = args.mode
 
+# Format of the saved plot; dense artists are rasterized in vector formats
+PLOT_FORMAT = args.format
 
-            err_pct = util.err_from_tt_pct(tt, temp, distance_d)
-            err_abs = err_pct * kb_d
-
-            # Calculate time since started
-            t = time.perf_counter() - t0
+prompt_time = 0
+if args.distance is not None and 1 <= args.distance <= 400:
+    distance_d = args.distance
+else:
+    t = time.perf_counter()
+    distance_d = util.user_input("distance in cm", (1,400))
+    prompt_time = time.perf_counter() - t
+distance_d = distance_d / 100 * 2
 
-            # Recording data
-            tt_arr.append(tt)
-            time_arr.append(t)
-            temp_arr.append(temp)
-            pres_arr.append(pres)
+# Maximum number of samples kept in memory for plotting (None: keep all).
+# Every sample is still written to the sample log and the data CSV.
+PLOT_HISTORY = None
 
-            derived_kb_arr.append(kb_d)
-            kb_err_abs_arr.append(err_abs)
+# Columnar store of the samples
+if PLOT_HISTORY is None:
+    samples = SampleStore(["tt", "time", "temp", "pres", "kb", "kb_err", "kb_avg"])
+else:
+    samples = SampleStore(["tt", "time", "temp", "pres", "kb", "kb_err", "kb_avg"], PLOT_HISTORY, ring=True)
 
-            kb_d_avg = np.mean(derived_kb_arr)
+# Crash-safe log of every sample, turned into the data CSV at exit
+sample_log = samplelog.SampleLog(file_name("log"), DATA_HEADER)
 
-            kb_avg_arr.append(kb_d_avg)
+# Running statistics of the derived k_B
+kb_stats = util.RunningStats()
 
-            if len(time_arr) > 1:
-                kb_d_sigma = stats.sem(derived_kb_arr)
-            else:
-                kb_d_sigma = 0
-            kb_d_sigma_up = kb_d_avg + 3 * kb_d_sigma
-            kb_d_sigma_down = kb_d_avg - 3 * kb_d_sigma
+t0 = time.perf_counter()
 
-            # Print result
-            print("The measured temperature is {0} K ({1} °C).".format(round(temp,2), round((temp-273.15),2)))
-            print("The derived speed of sound is {} m/s.".format(c_s))
-            print("The derived k_B is {}.".format(kb_d))
-            print("The averaged derived k_B is {}.".format(kb_d_avg))
-            print("The precision of the measurement is {}%.".format(err_pct * 100))
+# Compute stage of the acquisition pipeline: derive k_B for a batch of samples
+def process_batch(t_arr, tt_us_arr, temp_arr, pres_arr):
+    if "first sample" not in startup:
+        startup["first sample"] = time.perf_counter() - T_START
+
+    tt_arr = (tt_us_arr + SR04_OFFSET) * 10 ** (-6)
+    temp_arr = temp_arr + 273.15
+
+    #kb_arr = util.kb_from_tt_n2_arr(tt_arr, temp_arr, distance_d)
+    #kb_arr = util.kb_from_tt_vdw_n2_aprx_arr(tt_arr, temp_arr, distance_d)
+    #kb_arr = util.kb_from_tt_vdw_n2_arr(tt_arr, temp_arr, distance_d, pres_arr)
+    #kb_arr = util.kb_from_tt_rk_air_arr(tt_arr, temp_arr, distance_d, pres_arr)
+    kb_arr = util.kb_from_tt_rk_n2_arr(tt_arr, temp_arr, distance_d, pres_arr)
+
+    err_pct_arr = util.err_from_tt_pct_arr(tt_arr, temp_arr, distance_d)
+    err_abs_arr = err_pct_arr * kb_arr
+
+    # Recording data
+    for i in range(0, len(t_arr)):
+        t = t_arr[i]
+        tt = tt_arr[i]
+        temp = temp_arr[i]
+        pres = pres_arr[i]
+        kb_d = kb_arr[i]
+        err_abs = err_abs_arr[i]
+
+        sample_log.append([t, distance_d, tt, temp, kb_d, err_abs, pres, tt - (SR04_OFFSET * 10 ** (-6))])
+
+        kb_stats.add(kb_d, err_abs)
+        samples.append([tt, t, temp, pres, kb_d, err_abs, kb_stats.mean])
+
+    # Print result (of the latest sample)
+    c_s = util.c_from_tt(tt, distance_d)
+    print("The measured temperature is {0} K ({1} °C).".format(round(temp,2), round((temp-273.15),2)))
+    print("The derived speed of sound is {} m/s.".format(c_s))
+    print("The derived k_B is {}.".format(kb_d))
+    print("The averaged derived k_B is {}.".format(kb_stats.mean))
+    print("The weighted average derived k_B is {}.".format(kb_stats.wmean))
+    print("The precision of the measurement is {}%.".format(err_pct_arr[-1] * 100))
+
+    p_stats = pipeline.stats()
+    if p_stats["dropped"] > 0 or p_stats["malformed"] > 0 or len(t_arr) > 1:
+        print("Serial queue: {depth} waiting, {dropped} dropped, {malformed} malformed lines.".format(**p_stats))
+    if p_stats["lost"] > 0 or p_stats["corrupted"] > 0:
+        print("Binary packets: {lost} lost, {corrupted} corrupted.".format(**p_stats))
+
+    print()
 
-            print()
+try:
+    ser = serial.Serial(SERIAL_ADR, SERIAL_PORT, timeout=20)
+    startup["serial open"] = time.perf_counter() - T_START
+except Exception as e:
+    print(e)
+    print("FATAL ERROR. EARLY EXIT.")
+    sample_log.close()
+    os.remove(file_name("log"))
+    exit()
 
-        time.sleep(SERIAL_DELAY)
+if SERIAL_MODE == "binary" and not protocol.negotiate_binary(ser):
+    print("The Arduino did not switch to binary mode. Using JSON instead.")
+    SERIAL_MODE = "json"
 
 print()
 print("NOTE!: Exit the recodring early by pressing ctrl + C.")
 
-thread1 = threading.Thread(target=data_collection_ard, daemon=True)
+pipeline = acquisition.SerialPipeline(ser, process_batch, t0, SERIAL_MODE)
+pipeline.start()
+startup["acquisition started"] = time.perf_counter() - T_START
 
-thread1.start()
+# The samples are buffered by the pipeline while the plotting modules finish
+# loading
+plot_loader.join()
 
 fig = plt.figure()
 
@@ -244,66 +271,39 @@ def plt_init():
         ax.legend(loc="lower right")
         ax.tick_params(direction="in")
 
-    return line, bottoms, tops, verts, st_lines
-
-def main_controller(frame):
-    global tt_arr, time_arr, temp_arr, derived_kb_arr, kb_err_abs_arr, kb_avg_arr
-
+# Live plot: blitted, redrawn only when new samples have arrived
+live = LivePlot(fig, samples)
+live.add_axis(ax1)
+live.add_axis(ax2, y_pad=0.1)
+live.add_axis(ax3, y_pad=25)
+live.add_errorbar(ax1, (line, (bottoms, tops), verts), "time", "kb", "kb_err")
+live.add_hline(ax1, st_lines[0], "time", lambda: kb_stats.mean)
+live.add_hline(ax1, st_lines[1], "time", lambda: K_B)
+live.add_line(ax1, st_lines[2], "time", "kb_avg")
+live.add_line(ax2, st_lines[3], "time", "temp")
+live.add_line(ax3, st_lines[4], "time", "pres")
+
+def main_controller():
+    global startup_reported
     try:
-        # Plotting Data with Error Bars
-        err_gp = util.err_arr_gp(time_arr, derived_kb_arr, kb_err_abs_arr)
-        line.set_xdata(time_arr)
-        line.set_ydata(derived_kb_arr)
-        bottoms.set_xdata(time_arr)
-        tops.set_xdata(time_arr)
-        bottoms.set_ydata(err_gp[0])
-        tops.set_ydata(err_gp[1])
-        verts[0].set_segments(err_gp[2])
-
-        # Plotting Reference lines
-        # x_list = list(itertools.repeat([np.min(time_arr), np.max(time_arr)], 4))
-        # y_list = [[kb_d_avg , kb_d_avg], [K_B, K_B], [kb_d_sigma_up, kb_d_sigma_up], [kb_d_sigma_down], [kb_d_sigma_down]]
-
-        kb_d_avg = np.mean(derived_kb_arr)
-
-        x_list = list(itertools.repeat([np.min(time_arr), np.max(time_arr)], 2))
-        y_list = [[kb_d_avg , kb_d_avg], [K_B, K_B]]
-
-        x_list.append(time_arr)
-        y_list.append(kb_avg_arr)
-
-        x_list.append(time_arr)
-        y_list.append(temp_arr)
-
-        x_list.append(time_arr)
-        y_list.append(pres_arr)
-
-        # x_list.append(time_arr)
-        # y_list.append(tt_arr)
-
-        for lnum, st_line in enumerate(st_lines):
-            st_line.set_data(x_list[lnum], y_list[lnum])
-
-        fig.gca().relim()
-        fig.gca().autoscale_view()
-
-        for ax in [ax1, ax2, ax3]:
-            ax.relim()
-            ax.autoscale_view()
-
-        ax2.set_ylim([np.min(temp_arr) - 0.1,np.max(temp_arr) + 0.1])
-        ax3.set_ylim([np.min(pres_arr) - 25,np.max(pres_arr) + 25])
-        #ax4.set_ylim([np.min(tt_arr) * 0.9, np.max(tt_arr) * 1.1])
-
+        live.update()
+        if "live plot" not in startup:
+            startup["live plot"] = time.perf_counter() - T_START
+        if not startup_reported and "first sample" in startup:
+            startup_reported = True
+            print_startup()
     except (KeyboardInterrupt, SystemExit):
         print()
         print("Interrupt experienced.")
     except Exception as e:
         print(e)
-    finally:
-        return line, bottoms, tops, verts, st_lines
 
-anim = animation.FuncAnimation(fig, main_controller, interval=DELAY*1000, init_func = plt_init)
+startup_reported = False
+
+plt_init()
+timer = fig.canvas.new_timer(interval=DELAY*1000)
+timer.add_callback(main_controller)
+timer.start()
 
 try:
     print("NOTE: You can close the pyplot window to exit the program.")
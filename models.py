@@ -0,0 +1,100 @@
+# models.py - single-pass evaluation of several k_B models
+#
+# Note: This file is not intended to run independently.
+#
+# evaluate() derives k_B, its absolute error and its cumulative mean for a
+# list of models from the columns of a run in one vectorized pass. What the
+# models share (c^2 from tt and the distance, the molar volume, sqrt(T) and
+# the relative error) is computed once per run; each model then adds one row
+# to a (models x samples) result. A new model is one more entry in MODELS.
+#
+# The gas properties come from the records of gases.py, and may be per-sample
+# arrays (e.g. of humid air). The rows of N2 and air are exactly the values
+# of the util.py *_arr functions of the same model (the operations are kept
+# in the same order).
+
+import numpy as np
+
+import util
+import gases
+
+# Intermediates of a run shared by the models; the pressure terms only when
+# a model needs them
+def shared_terms(tt, temp, dis, pres=None):
+    temp = np.asarray(temp, dtype=float)
+    c_sound = util.c_from_tt(np.asarray(tt, dtype=float), np.asarray(dis, dtype=float))
+    s = {"temp": temp, "c2": c_sound * c_sound}
+    if pres is not None:
+        vm = 22.4 * np.asarray(pres, dtype=float) / 101325 * (temp / 273.15)
+        s["vm"] = vm
+        s["vm2"] = vm * vm
+        s["sqrt_temp"] = np.sqrt(temp)
+    return s
+
+def _kb_ideal(s, gas):
+    return s["c2"] * gas["molar_mass"] / (gas["gamma"] * util.N_A * s["temp"])
+
+# k_B with a molar correction term and compressibility factor a_f of a real
+# gas model
+def _kb_real(s, gas, m_molar, b):
+    a_f = s["vm2"] / ((s["vm"] - b) * (s["vm"] - b))
+    return (s["c2"] + m_molar) / (a_f * gas["gamma"] * s["temp"]) * (gas["molar_mass_g"] * util.AMU) * 10 ** (23)
+
+def _kb_vdw(s, gas):
+    a, b = gas["vdw"]
+    return _kb_real(s, gas, 2 * gas["gamma"] * a / (gas["molar_mass_g"] * s["vm"]), b)
+
+def _kb_rk(s, gas):
+    a, b = gas["rk"]
+    return _kb_real(s, gas, gas["gamma"] * a * (2 * s["vm"] + b) / (s["sqrt_temp"] * gas["molar_mass_g"] * (s["vm"] + b)), b)
+
+# Equations of state: k_B of one gas (a gases.py record) from the shared
+# terms, and whether the pressure is needed
+KINDS = {
+    "ideal": (_kb_ideal, False),
+    "vdw": (_kb_vdw, True),
+    "rk": (_kb_rk, True),
+}
+
+# Models by name (as in catalog.py): equation of state and gases.py gas
+MODELS = {
+    "n2": ("ideal", "n2"),
+    "air": ("ideal", "air"),
+    "vdw_n2": ("vdw", "n2"),
+    "vdw_air": ("vdw", "air"),
+    "rk_n2": ("rk", "n2"),
+    "rk_air": ("rk", "air"),
+}
+
+# Equation of state and gas record of a model: a name of MODELS, or an
+# equation of state of KINDS applied to gas
+def resolve(model, gas=None):
+    if model in MODELS:
+        kind, name = MODELS[model]
+        return (kind, gases.gas(name))
+    if model in KINDS and gas is not None:
+        return (model, gas)
+    raise Exception("Unknown model {}.".format(model))
+
+def needs_pressure(model):
+    return KINDS[MODELS[model][0] if model in MODELS else model][1]
+
+# k_B of every model for every sample. Models are names of MODELS or, for a
+# run under another gas (a gases.py record, e.g. gases.humid_air(...)),
+# equations of state ("ideal", "vdw", "rk"). Returns three
+# (models x samples) arrays: k_B, its absolute error and its cumulative mean.
+def evaluate(models, tt, temp, dis, pres=None, gas=None):
+    if pres is None and any(needs_pressure(m) for m in models):
+        raise Exception("The pressure is needed for {}.".format(", ".join(m for m in models if needs_pressure(m))))
+
+    s = shared_terms(tt, temp, dis, pres)
+    n = np.broadcast(s["c2"], s["temp"]).size
+    kb = np.empty((len(models), n))
+    for i, m in enumerate(models):
+        kind, g = resolve(m, gas)
+        kb[i] = KINDS[kind][0](s, g)
+
+    err = util.err_from_tt_pct_arr(tt, temp, dis) * kb
+    avg = np.cumsum(kb, axis=1)
+    avg /= np.arange(1, n + 1)
+    return (kb, err, avg)
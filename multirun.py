@@ -0,0 +1,77 @@
+# multirun.py - parallel loading and reduction of many data runs
+#
+# Note: This file is not intended to run independently.
+#
+# plot3.py and plot5.py reduce every run to a short summary (distance, mean
+# k_B, ...). map_runs() spreads these per-run reductions over a pool of
+# worker processes and returns the summaries in input order, printing a
+# progress line as each run completes.
+
+import multiprocessing
+import os
+import time
+
+# A worker is replaced after this many runs, so memory it holds on to
+# (e.g. a fragmented heap after a very large run) is given back
+MAX_TASKS_PER_CHILD = 8
+
+# Address space limit of a worker (MB), None for no limit. A run too large
+# for it fails with a MemoryError instead of pushing the Pi into swap.
+WORKER_MEMORY_MB = 1024
+
+def _init_worker(memory_mb):
+    if memory_mb is None:
+        return
+    try:
+        import resource
+        limit = memory_mb * 2 ** 20
+        soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+def _run_task(task):
+    i, fn, csv_loc, args = task
+    try:
+        return (i, fn(csv_loc, *args), None)
+    except Exception as e:
+        return (i, None, "{0}: {1}".format(type(e).__name__, e))
+
+# Call fn(csv_loc, *args) for every csv_loc in worker processes. Returns the
+# results in the order of csv_locs; a run that raised gives None (and its
+# error is printed). With workers=1, or a single run, everything runs in
+# this process.
+def map_runs(fn, csv_locs, args=(), workers=None, progress=True, memory_mb=WORKER_MEMORY_MB):
+    n = len(csv_locs)
+    results = [None] * n
+    if n == 0:
+        return results
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, n)
+
+    tasks = [(i, fn, csv_loc, args) for i, csv_loc in enumerate(csv_locs)]
+    t0 = time.perf_counter()
+
+    if workers == 1:
+        done = map(_run_task, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers, _init_worker, (memory_mb,), MAX_TASKS_PER_CHILD)
+        done = pool.imap_unordered(_run_task, tasks)
+
+    try:
+        for count, (i, r, err) in enumerate(done, 1):
+            results[i] = r
+            if err is not None:
+                print("{0}: {1}".format(csv_locs[i], err))
+            if progress:
+                print("[{0}/{1}] {2} ({3:.1f} s)".format(count, n, csv_locs[i], time.perf_counter() - t0))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return results
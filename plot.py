@@ -10,37 +10,33 @@ import util
 import numpy as np
 import matplotlib.pyplot as plt
 import itertools
+import argparse
 import time
+import cache
+import runio
+import export
 from scipy import stats
 
-def err_arr_gp(x_arr, data_arr, err_arr):
-    if len(data_arr) != len(err_arr):
-        return False
-    else:
-        up_arr = []
-        low_arr = []
-        seg_arr = []
-        for i in range(0, len(data_arr)):
-            x_p = x_arr[i]
-            data_p = data_arr[i]
-            err_p = err_arr[i]
-            up_p = data_p + err_p
-            low_p = data_p - err_p
-            up_arr.append(up_p)
-            low_arr.append(low_p)
-            seg_arr.append([[x_p, low_p], [x_p, up_p]])
-
-        return (low_arr, up_arr, seg_arr)
-
 def save_plot(fig):
     # eps_loc = DATA_NAME + "_plt_" + str(int(time.time())) + '.eps'
-    eps_loc = DATA_NAME + '.eps'
-    fig_now.savefig(eps_loc, format='eps')
-    print("\nPlot saved to {}.\n".format(eps_loc))
+    plot_loc = DATA_NAME + '.' + export.PLOT_FORMAT
+    if args.window is not None:
+        plot_loc = "{0}_{1:g}-{2:g}.{3}".format(DATA_NAME, t0, t1, export.PLOT_FORMAT)
+    print("\nSaving the plot to {} in the background.\n".format(plot_loc))
+    export.export_background(fig_now, plot_loc)
 
 SR04_OFFSET = 55
 
 def save_data():
+    # The samples of a time window are not the whole run
+    if args.window is not None:
+        return
+    # A run without a pressure sensor was derived at the standard pressure,
+    # which is not a measurement to write back to it
+    if "Pressure" not in runio.read_header(csv_loc):
+        print("{} has no pressure column and is not rewritten.".format(csv_loc))
+        return
+
     h = ["Time", "Exp Distance", "Measured Time Diff", "Temperature", "Derived k_B", "Derived k_B Error", "Pressure", "HC-SRO4 Raw"]
 
     try:
@@ -76,145 +72,162 @@ def save_data():
         pass
     pass
 
-def std_error(err_arr):
-    n = len(err_arr)
-    ste = np.sqrt(np.sum([e ** 2 for e in err_arr])/(n-1))
-    return ste
-
-
 # Boltzmann constant (10^-23)
 K_B = 1.38064852
 
-data_id = util.user_input("data number", val_float=False)
-DATA_NAME = DATA_NAME = "data/{}".format(data_id)
-csv_loc = DATA_NAME + ".csv"
-
-# List storing values
-tt_arr = []
-time_arr = []
-temp_arr = []
-
-derived_kb_arr = []
-kb_err_abs_arr = []
-pres_arr = []
-
-kb_avg_arr = []
-
-distance_d = 0
+# Read the columns of a data CSV (runs recorded without a pressure sensor
+# get the standard pressure), or of its samples with t0 <= Time < t1
+def load_data(csv_loc, t0=None, t1=None):
+    cols = runio.read_columns(csv_loc, ["Time", "Measured Time Diff", "Temperature", "Pressure"], t0, t1)
+    if len(cols["Time"]) == 0:
+        raise Exception("No samples in {}.".format(csv_loc))
+    return (cols["Time"], runio.read_distance(csv_loc), cols["Measured Time Diff"], cols["Temperature"], runio.pressure(cols))
+
+# Derive k_B (RK, N2) and its error for every sample and reject outliers
+# beyond 2 sigma. Returns the kept samples and the mask of kept samples.
+def derive_data(t_col, distance_d, tt_col, temp_col, pres_col):
+    kb_col = util.kb_from_tt_rk_n2_arr(tt_col, temp_col, distance_d, pres_col)
+    err_abs_col = util.err_from_tt_pct_arr(tt_col, temp_col, distance_d) * kb_col
+
+    kb_mask = util.sigma_clip_mask(kb_col, err_abs_col, 2)
+
+    tt_arr = np.array(tt_col)[kb_mask]
+    time_arr = np.array(t_col)[kb_mask]
+    temp_arr = np.array(temp_col)[kb_mask]
+    pres_arr = np.array(pres_col)[kb_mask]
+
+    derived_kb_arr = kb_col[kb_mask]
+    kb_err_abs_arr = err_abs_col[kb_mask]
+
+    kb_avg_arr = util.cum_mean_arr(derived_kb_arr)
+
+    return (time_arr, tt_arr, temp_arr, pres_arr, derived_kb_arr, kb_err_abs_arr, kb_avg_arr, kb_mask)
+
+DERIVED = ["time_arr", "tt_arr", "temp_arr", "pres_arr", "derived_kb_arr", "kb_err_abs_arr", "kb_avg_arr", "kb_mask"]
+
+# The distance and the results of derive_data() for a data CSV, from the
+# derived-results cache when the run was derived before
+def load_derived(csv_loc, t0=None, t1=None):
+    def compute():
+        t_col, distance_d, tt_col, temp_col, pres_col = load_data(csv_loc, t0, t1)
+        r = dict(zip(DERIVED, derive_data(t_col, distance_d, tt_col, temp_col, pres_col)))
+        r["distance_d"] = distance_d
+        return r
+
+    # A time window is derived directly: the cache key would hash the whole
+    # run
+    if t0 is not None or t1 is not None:
+        r = {k: np.asarray(v) for k, v in compute().items()}
+    else:
+        r = cache.cached(csv_loc, "plot.derive_data", {"model": "rk_n2", "nsigma": 2}, compute)
+    return (float(r["distance_d"]),) + tuple(r[k] for k in DERIVED)
 
-h = ["Time", "Exp Distance", "Measured Time Diff", "Temperature", "Derived k_B", "Derived k_B Error", "Pressure", "HC-SRO4 Raw"]
+# The figure of a run: k_B with errors and averages, temperature, pressure
+def make_figure(time_arr, temp_arr, pres_arr, derived_kb_arr, kb_err_abs_arr, kb_avg_arr):
+    fig = plt.figure()
 
-try:
-    csvFile = open(csv_loc, "r")
-    dict_reader = csv.DictReader(csvFile)
+    ax1 = fig.add_subplot(211)
 
-    for row in dict_reader:
-        t = float(row[h[0]])
-        distance_d = float(row[h[1]])
-        tt = float(row[h[2]])
-        temp = float(row[h[3]])
-        pres = float(row[h[6]])
+    ax2 = fig.add_subplot(223)
+    ax3 = fig.add_subplot(224)
 
-        kb_d = util.kb_from_tt_rk_n2(tt, temp, distance_d, pres)
+    line, (bottoms, tops), verts = ax1.errorbar([0], [0], yerr=0.01, capsize=0.1, fmt='ko', markersize=4, elinewidth=1,label="Realtime Measurement").lines
 
-        err_pct = util.err_from_tt_pct(tt, temp, distance_d)
-        err_abs = err_pct * kb_d
+    st_lines = [ax1.plot([], [], linestyle='dashed', label="Mean Measured Value")[0], ax1.plot([], [], linestyle='dashed', label=r"True $k_B$")[0], ax1.plot([], [], '.', label="Instantaneous Average Value", markersize=8)[0], ax2.plot([], [], '.', label="Temperature")[0], ax3.plot([], [], '.', label="Pressure")[0]]
 
-        if len(time_arr) > 1:
-            kb_d_sigma = std_error(kb_err_abs_arr)
-            kb_d_avg_pre = np.mean(derived_kb_arr)
-        else:
-            kb_d_sigma = err_abs
-            kb_d_avg_pre = kb_d
-        kb_d_sigma_up = kb_d_avg_pre + 2 * kb_d_sigma
-        kb_d_sigma_down = kb_d_avg_pre - 2 * kb_d_sigma
+    ax1.set_ylabel(r"Derived $k_B$ ($10^{-23} J K^{-1}$)")
+    ax2.set_ylabel(r"Temperature $T$ (K)")
+    ax3.set_ylabel(r"Pressure $P$ (Pa)")
 
-        if kb_d_sigma_down <= kb_d <= kb_d_sigma_up:
-            tt_arr.append(tt)
-            time_arr.append(t)
-            temp_arr.append(temp)
-            pres_arr.append(pres)
+    for ax in [ax1, ax2, ax3]:
+        ax.set_xlabel("Time (s)")
+        ax.legend(loc="lower right")
+        ax.tick_params(direction="in")
 
-            derived_kb_arr.append(kb_d)
-            kb_err_abs_arr.append(err_abs)
+    err_gp = util.err_arr_gp(time_arr, derived_kb_arr, kb_err_abs_arr)
+    line.set_xdata(time_arr)
+    line.set_ydata(derived_kb_arr)
+    bottoms.set_xdata(time_arr)
+    tops.set_xdata(time_arr)
+    bottoms.set_ydata(err_gp[0])
+    tops.set_ydata(err_gp[1])
+    verts[0].set_segments(err_gp[2])
 
-            kb_d_avg = np.mean(derived_kb_arr)
+    # Plotting Reference lines
+    # x_list = list(itertools.repeat([np.min(time_arr), np.max(time_arr)], 4))
+    # y_list = [[kb_d_avg , kb_d_avg], [K_B, K_B], [kb_d_sigma_up, kb_d_sigma_up], [kb_d_sigma_down], [kb_d_sigma_down]]
 
-            kb_avg_arr.append(kb_d_avg)
+    kb_d_avg = np.mean(derived_kb_arr)
 
-    print("The data set has been successfully loaded from CSV file.")
-except Exception as e:
-    print(e)
+    x_list = list(itertools.repeat([np.min(time_arr), np.max(time_arr)], 2))
+    y_list = [[kb_d_avg , kb_d_avg], [K_B, K_B]]
 
-fig = plt.figure()
+    x_list.append(time_arr)
+    y_list.append(kb_avg_arr)
 
-ax1 = fig.add_subplot(211)
+    x_list.append(time_arr)
+    y_list.append(temp_arr)
 
-ax2 = fig.add_subplot(223)
-ax3 = fig.add_subplot(224)
+    x_list.append(time_arr)
+    y_list.append(pres_arr)
 
-line, (bottoms, tops), verts = ax1.errorbar([0], [0], yerr=0.01, capsize=0.1, fmt='ko', markersize=4, elinewidth=1,label="Realtime Measurement").lines
+    for lnum, st_line in enumerate(st_lines):
+        st_line.set_data(x_list[lnum], y_list[lnum])
 
-st_lines = [ax1.plot([], [], linestyle='dashed', label="Mean Measured Value")[0], ax1.plot([], [], linestyle='dashed', label=r"True $k_B$")[0], ax1.plot([], [], '.', label="Instantaneous Average Value", markersize=8)[0], ax2.plot([], [], '.', label="Temperature")[0], ax3.plot([], [], '.', label="Pressure")[0]]
+    fig.gca().relim()
+    fig.gca().autoscale_view()
 
-ax1.set_ylabel(r"Derived $k_B$ ($10^{-23} J K^{-1}$)")
-ax2.set_ylabel(r"Temperature $T$ (K)")
-ax3.set_ylabel(r"Pressure $P$ (Pa)")
+    for ax in [ax1, ax2, ax3]:
+        ax.relim()
+        ax.autoscale_view()
 
-for ax in [ax1, ax2, ax3]:
-    ax.set_xlabel("Time (s)")
-    ax.legend(loc="lower right")
-    ax.tick_params(direction="in")
+    ax2.set_ylim([np.min(temp_arr) - 0.1,np.max(temp_arr) + 0.1])
+    ax3.set_ylim([np.min(pres_arr) - 25,np.max(pres_arr) + 25])
 
-err_gp = util.err_arr_gp(time_arr, derived_kb_arr, kb_err_abs_arr)
-line.set_xdata(time_arr)
-line.set_ydata(derived_kb_arr)
-bottoms.set_xdata(time_arr)
-tops.set_xdata(time_arr)
-bottoms.set_ydata(err_gp[0])
-tops.set_ydata(err_gp[1])
-verts[0].set_segments(err_gp[2])
+    return fig
 
-# Plotting Reference lines
-# x_list = list(itertools.repeat([np.min(time_arr), np.max(time_arr)], 4))
-# y_list = [[kb_d_avg , kb_d_avg], [K_B, K_B], [kb_d_sigma_up, kb_d_sigma_up], [kb_d_sigma_down], [kb_d_sigma_down]]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plot an existing data set.")
+    parser.add_argument("--window", type=float, nargs=2, metavar=("T0", "T1"), help="plot only the samples with T0 <= Time < T1 (s)")
+    args = parser.parse_args()
+    t0, t1 = args.window if args.window is not None else (None, None)
 
-kb_d_avg = np.mean(derived_kb_arr)
+    data_id = util.user_input("data number", val_float=False)
+    DATA_NAME = DATA_NAME = "data/{}".format(data_id)
+    csv_loc = DATA_NAME + ".csv"
 
-x_list = list(itertools.repeat([np.min(time_arr), np.max(time_arr)], 2))
-y_list = [[kb_d_avg , kb_d_avg], [K_B, K_B]]
+    # List storing values
+    tt_arr = []
+    time_arr = []
+    temp_arr = []
 
-x_list.append(time_arr)
-y_list.append(kb_avg_arr)
+    derived_kb_arr = []
+    kb_err_abs_arr = []
+    pres_arr = []
 
-x_list.append(time_arr)
-y_list.append(temp_arr)
+    kb_avg_arr = []
 
-x_list.append(time_arr)
-y_list.append(pres_arr)
+    distance_d = 0
 
-for lnum, st_line in enumerate(st_lines):
-    st_line.set_data(x_list[lnum], y_list[lnum])
+    try:
+        distance_d, time_arr, tt_arr, temp_arr, pres_arr, derived_kb_arr, kb_err_abs_arr, kb_avg_arr, kb_mask = load_derived(csv_loc, t0=t0, t1=t1)
 
-fig.gca().relim()
-fig.gca().autoscale_view()
+        print("{} of {} samples rejected as outliers.".format(len(kb_mask) - np.count_nonzero(kb_mask), len(kb_mask)))
+        print("The data set has been successfully loaded from CSV file.")
+    except Exception as e:
+        print(e)
 
-for ax in [ax1, ax2, ax3]:
-    ax.relim()
-    ax.autoscale_view()
+    fig = make_figure(time_arr, temp_arr, pres_arr, derived_kb_arr, kb_err_abs_arr, kb_avg_arr)
 
-ax2.set_ylim([np.min(temp_arr) - 0.1,np.max(temp_arr) + 0.1])
-ax3.set_ylim([np.min(pres_arr) - 25,np.max(pres_arr) + 25])
+    try:
+        fig_now = plt.gcf()
+        plt.show()
+    except (KeyboardInterrupt, SystemExit):
+        save_plot(fig_now)
+        save_data()
+        exit()
+    except Exception as e:
+        print(e)
 
-try:
-    fig_now = plt.gcf()
-    plt.show()
-except (KeyboardInterrupt, SystemExit):
     save_plot(fig_now)
     save_data()
-    exit()
-except Exception as e:
-    print(e)
-
-save_plot(fig_now)
-save_data()
@@ -5,12 +5,16 @@
 # Created by Jerry Yan
 
 
-import csv
 import util
 import numpy as np
 import matplotlib.pyplot as plt
 import itertools
+import argparse
 import time
+import cache
+import models
+import runio
+import export
 
 # Boltzmann constant (10^-23)
 K_B = 1.38064852
@@ -18,169 +22,164 @@ K_B = 1.38064852
 OFFSET = 0
 
 def save_plot(fig):
-    eps_loc = DATA_NAME + "_plt2_" + str(int(time.time())) + '.eps'
-    fig_now.savefig(eps_loc, format='eps')
-    print("\nPlot saved to {}.\n".format(eps_loc))
-
-data_id = util.user_input("data number", val_float=False)
-DATA_NAME = DATA_NAME = "data/{}".format(data_id)
-csv_loc = DATA_NAME + ".csv"
-
-# List storing values
-tt_arr = []
-time_arr = []
-temp_arr = []
-
-derived_kb_arr = []
-kb_err_abs_arr = []
-kb_avg_arr = []
-pres_arr = []
-
-derived_kb_vdw_arr = []
-kb_err_abs_vdw_arr = []
-kb_avg_vdw_arr = []
-
-derived_kb_rk_arr = []
-kb_err_abs_rk_arr = []
-kb_avg_rk_arr = []
-
-distance_d = 0
-
-h = ["Time", "Exp Distance", "Measured Time Diff", "Temperature", "Derived k_B", "Derived k_B Error", "Pressure"]
-
-try:
-    csvFile = open(csv_loc, "r")
-    dict_reader = csv.DictReader(csvFile)
-
-    for row in dict_reader:
-        time_arr.append(float(row[h[0]]))
-        distance_d = float(row[h[1]])
-        tt_arr.append(float(row[h[2]]))
-        temp_arr.append(float(row[h[3]]))
-        pres_arr.append(float(row[h[6]]))
-
-    print("The data set has been successfully loaded from CSV file.")
-except Exception as e:
-    print(e)
-
-for i in range(0, len(time_arr)):
-    tt = tt_arr[i] + (OFFSET * 10 ** -6)
-    temp = temp_arr[i]
-    pres = pres_arr[i]
-    c_s = util.c_from_tt(tt, distance_d)
-    kb_d = util.kb_from_tt_n2(tt, temp, distance_d)
-
-    err_pct = util.err_from_tt_pct(tt, temp, distance_d)
-    err_abs = err_pct * kb_d
-
-    derived_kb_arr.append(kb_d)
-    kb_err_abs_arr.append(err_abs)
+    plot_loc = DATA_NAME + "_plt2_" + str(int(time.time())) + '.' + export.PLOT_FORMAT
+    print("\nSaving the plot to {} in the background.\n".format(plot_loc))
+    export.export_background(fig_now, plot_loc)
+
+# Read the columns of a data CSV (runs recorded without a pressure sensor
+# get the standard pressure), or of its samples with t0 <= Time < t1
+def load_data(csv_loc, t0=None, t1=None):
+    cols = runio.read_columns(csv_loc, ["Time", "Measured Time Diff", "Temperature", "Pressure"], t0, t1)
+    if len(cols["Time"]) == 0:
+        raise Exception("No samples in {}.".format(csv_loc))
+    return (cols["Time"], runio.read_distance(csv_loc), cols["Measured Time Diff"], cols["Temperature"], runio.pressure(cols))
+
+# Models compared: without correction, with VDW correction and with RK
+# correction (N2)
+MODELS = ["n2", "vdw_n2", "rk_n2"]
+
+# Derive k_B of every model in one pass, each as (k_B, absolute error,
+# cumulative mean)
+def derive_data(tt_arr, temp_arr, distance_d, pres_arr, offset=OFFSET):
+    tt_col = np.array(tt_arr) + (offset * 10 ** -6)
+    kb, err, avg = models.evaluate(MODELS, tt_col, temp_arr, distance_d, pres_arr)
+    return [(kb[i], err[i], avg[i]) for i in range(len(MODELS))]
+
+# The columns of a data CSV and the results of derive_data(), from the
+# derived-results cache when the run was derived before
+def load_derived(csv_loc, offset=OFFSET, t0=None, t1=None):
+    def compute():
+        time_arr, distance_d, tt_arr, temp_arr, pres_arr = load_data(csv_loc, t0, t1)
+        r = {"time_arr": time_arr, "distance_d": distance_d, "tt_arr": tt_arr, "temp_arr": temp_arr, "pres_arr": pres_arr}
+        for m, (kb, err, avg) in zip(MODELS, derive_data(tt_arr, temp_arr, distance_d, pres_arr, offset)):
+            r["kb_" + m] = kb
+            r["err_" + m] = err
+            r["avg_" + m] = avg
+        return r
+
+    # A time window is derived directly: the cache key would hash the whole
+    # run
+    if t0 is not None or t1 is not None:
+        r = {k: np.asarray(v) for k, v in compute().items()}
+    else:
+        r = cache.cached(csv_loc, "plot2.derive_data", {"offset": offset, "models": MODELS}, compute)
+    derived = [(r["kb_" + m], r["err_" + m], r["avg_" + m]) for m in MODELS]
+    return (r["time_arr"], float(r["distance_d"]), r["tt_arr"], r["temp_arr"], r["pres_arr"], derived)
+
+# The figures of a run: k_B of the three models with errors and averages,
+# and the temperature
+def make_figures(time_arr, temp_arr, derived):
+    (derived_kb_arr, kb_err_abs_arr, kb_avg_arr), (derived_kb_vdw_arr, kb_err_abs_vdw_arr, kb_avg_vdw_arr), (derived_kb_rk_arr, kb_err_abs_rk_arr, kb_avg_rk_arr) = derived
+
+    fig = plt.figure()
+    fig2 = plt.figure()
+
+    ax1 = fig.add_subplot(111)
+
+    ax2 = fig2.add_subplot(111)
+
+    line, (bottoms, tops), verts = ax1.errorbar([0], [0], yerr=0.01, capsize=0.1, fmt='ko', markersize=4, elinewidth=1,label="Measurement").lines
+
+    lineb, (bottomsb, topsb), vertsb = ax1.errorbar([0], [0], yerr=0.01, capsize=0.1, fmt='bo', markersize=4, elinewidth=1,label="Measurement (w./ VDW Correction)").lines
+
+    linec, (bottomsc, topsc), vertsc = ax1.errorbar([0], [0], yerr=0.01, capsize=0.1, fmt='ro', markersize=4, elinewidth=1,label="Measurement (w./ RK Correction)").lines
+
+    st_lines = [ax1.plot([], [], linestyle='dashed', label="Mean Measured Value")[0], ax1.plot([], [], linestyle='dashed', label="Mean Measured Value (w./ VDW Correction)")[0], ax1.plot([], [], linestyle='dashed', label="Mean Measured Value (w./ RK Correction)")[0], ax1.plot([], [], '.', label="Instantaneous Average Value", markersize=8)[0], ax1.plot([], [], '.', label="Instantaneous Average Value (w./ VDW Correction)", markersize=8)[0], ax1.plot([], [], '.', label="Instantaneous Average Value (w./ RK Correction)", markersize=8)[0], ax1.plot([], [], linestyle='dashed', label=r"True $k_B$")[0], ax2.plot([], [], '.', label="Temperature")[0]]
+
+    ax1.set_xlabel("Time (s)")
+    ax1.set_ylabel(r"Derived $k_B$ ($10^{-23} J K^{-1}$)")
+    ax1.legend(loc="lower right")
+
+    ax2.set_xlabel("Time (s)")
+    ax2.set_ylabel(r"Temperature $T$ (K)")
+    ax2.legend(loc="lower right")
+
+    err_gp = util.err_arr_gp(time_arr, derived_kb_arr, kb_err_abs_arr)
+    line.set_xdata(time_arr)
+    line.set_ydata(derived_kb_arr)
+    bottoms.set_xdata(time_arr)
+    tops.set_xdata(time_arr)
+    bottoms.set_ydata(err_gp[0])
+    tops.set_ydata(err_gp[1])
+    verts[0].set_segments(err_gp[2])
 
     kb_d_avg = np.mean(derived_kb_arr)
 
-    kb_avg_arr.append(kb_d_avg)
+    err_gpb = util.err_arr_gp(time_arr, derived_kb_vdw_arr, kb_err_abs_vdw_arr)
+    lineb.set_xdata(time_arr)
+    lineb.set_ydata(derived_kb_vdw_arr)
+    bottomsb.set_xdata(time_arr)
+    topsb.set_xdata(time_arr)
+    bottomsb.set_ydata(err_gpb[0])
+    topsb.set_ydata(err_gpb[1])
+    vertsb[0].set_segments(err_gpb[2])
 
-    kb_d = util.kb_from_tt_vdw_n2(tt, temp, distance_d, pres)
-    err_pct = util.err_from_tt_pct(tt, temp, distance_d)
-    err_abs = err_pct * kb_d
+    kb_d_avgb = np.mean(derived_kb_vdw_arr)
 
-    derived_kb_vdw_arr.append(kb_d)
-    kb_err_abs_vdw_arr.append(err_abs)
+    err_gpc = util.err_arr_gp(time_arr, derived_kb_rk_arr, kb_err_abs_rk_arr)
+    linec.set_xdata(time_arr)
+    linec.set_ydata(derived_kb_rk_arr)
+    bottomsc.set_xdata(time_arr)
+    topsc.set_xdata(time_arr)
+    bottomsc.set_ydata(err_gpc[0])
+    topsc.set_ydata(err_gpc[1])
+    vertsc[0].set_segments(err_gpc[2])
 
-    kb_d_avg = np.mean(derived_kb_vdw_arr)
+    kb_d_avgc = np.mean(derived_kb_rk_arr)
 
-    kb_avg_vdw_arr.append(kb_d_avg)
+    x_list = [[np.min(time_arr), np.max(time_arr)], [np.min(time_arr), np.max(time_arr)], [np.min(time_arr), np.max(time_arr)], time_arr, time_arr, time_arr, [np.min(time_arr), np.max(time_arr)], time_arr]
+    y_list = [[kb_d_avg , kb_d_avg], [kb_d_avgb , kb_d_avgb], [kb_d_avgc , kb_d_avgc], kb_avg_arr, kb_avg_vdw_arr, kb_avg_rk_arr, [K_B, K_B], temp_arr]
 
-    kb_d = util.kb_from_tt_rk_n2(tt, temp, distance_d, pres)
-    err_pct = util.err_from_tt_pct(tt, temp, distance_d)
-    err_abs = err_pct * kb_d
+    for lnum, st_line in enumerate(st_lines):
+        st_line.set_data(x_list[lnum], y_list[lnum])
 
-    derived_kb_rk_arr.append(kb_d)
-    kb_err_abs_rk_arr.append(err_abs)
+    fig.gca().relim()
+    fig.gca().autoscale_view()
 
-    kb_d_avg = np.mean(derived_kb_rk_arr)
+    ax1.relim()
+    ax1.autoscale_view()
 
-    kb_avg_rk_arr.append(kb_d_avg)
+    ax2.relim()
+    ax2.autoscale_view()
+    ax2.set_ylim([np.min(temp_arr) - 0.1,np.max(temp_arr) + 0.1])
 
-fig = plt.figure()
-fig2 = plt.figure()
+    return (fig, fig2)
 
-ax1 = fig.add_subplot(111)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plot an existing data set with and without the VDW and RK corrections.")
+    parser.add_argument("--window", type=float, nargs=2, metavar=("T0", "T1"), help="plot only the samples with T0 <= Time < T1 (s)")
+    args = parser.parse_args()
+    t0, t1 = args.window if args.window is not None else (None, None)
 
-ax2 = fig2.add_subplot(111)
+    data_id = util.user_input("data number", val_float=False)
+    DATA_NAME = DATA_NAME = "data/{}".format(data_id)
+    csv_loc = DATA_NAME + ".csv"
 
-line, (bottoms, tops), verts = ax1.errorbar([0], [0], yerr=0.01, capsize=0.1, fmt='ko', markersize=4, elinewidth=1,label="Measurement").lines
+    # List storing values
+    tt_arr = []
+    time_arr = []
+    temp_arr = []
 
-lineb, (bottomsb, topsb), vertsb = ax1.errorbar([0], [0], yerr=0.01, capsize=0.1, fmt='bo', markersize=4, elinewidth=1,label="Measurement (w./ VDW Correction)").lines
+    pres_arr = []
 
-linec, (bottomsc, topsc), vertsc = ax1.errorbar([0], [0], yerr=0.01, capsize=0.1, fmt='ro', markersize=4, elinewidth=1,label="Measurement (w./ RK Correction)").lines
+    distance_d = 0
 
-st_lines = [ax1.plot([], [], linestyle='dashed', label="Mean Measured Value")[0], ax1.plot([], [], linestyle='dashed', label="Mean Measured Value (w./ VDW Correction)")[0], ax1.plot([], [], linestyle='dashed', label="Mean Measured Value (w./ RK Correction)")[0], ax1.plot([], [], '.', label="Instantaneous Average Value", markersize=8)[0], ax1.plot([], [], '.', label="Instantaneous Average Value (w./ VDW Correction)", markersize=8)[0], ax1.plot([], [], '.', label="Instantaneous Average Value (w./ RK Correction)", markersize=8)[0], ax1.plot([], [], linestyle='dashed', label=r"True $k_B$")[0], ax2.plot([], [], '.', label="Temperature")[0]]
+    try:
+        time_arr, distance_d, tt_arr, temp_arr, pres_arr, derived = load_derived(csv_loc, t0=t0, t1=t1)
+        print("The data set has been successfully loaded from CSV file.")
+    except Exception as e:
+        print(e)
+        derived = derive_data(tt_arr, temp_arr, distance_d, pres_arr)
 
-ax1.set_xlabel("Time (s)")
-ax1.set_ylabel(r"Derived $k_B$ ($10^{-23} J K^{-1}$)")
-ax1.legend(loc="lower right")
+    fig, fig2 = make_figures(time_arr, temp_arr, derived)
 
-ax2.set_xlabel("Time (s)")
-ax2.set_ylabel(r"Temperature $T$ (K)")
-ax2.legend(loc="lower right")
+    try:
+        fig_now = plt.gcf()
+        plt.show()
+    except (KeyboardInterrupt, SystemExit):
+        save_plot(fig_now)
+        exit()
+    except Exception as e:
+        print(e)
 
-err_gp = util.err_arr_gp(time_arr, derived_kb_arr, kb_err_abs_arr)
-line.set_xdata(time_arr)
-line.set_ydata(derived_kb_arr)
-bottoms.set_xdata(time_arr)
-tops.set_xdata(time_arr)
-bottoms.set_ydata(err_gp[0])
-tops.set_ydata(err_gp[1])
-verts[0].set_segments(err_gp[2])
-
-kb_d_avg = np.mean(derived_kb_arr)
-
-err_gpb = util.err_arr_gp(time_arr, derived_kb_vdw_arr, kb_err_abs_vdw_arr)
-lineb.set_xdata(time_arr)
-lineb.set_ydata(derived_kb_vdw_arr)
-bottomsb.set_xdata(time_arr)
-topsb.set_xdata(time_arr)
-bottomsb.set_ydata(err_gpb[0])
-topsb.set_ydata(err_gpb[1])
-vertsb[0].set_segments(err_gpb[2])
-
-kb_d_avgb = np.mean(derived_kb_vdw_arr)
-
-err_gpc = util.err_arr_gp(time_arr, derived_kb_rk_arr, kb_err_abs_rk_arr)
-linec.set_xdata(time_arr)
-linec.set_ydata(derived_kb_rk_arr)
-bottomsc.set_xdata(time_arr)
-topsc.set_xdata(time_arr)
-bottomsc.set_ydata(err_gpc[0])
-topsc.set_ydata(err_gpc[1])
-vertsc[0].set_segments(err_gpc[2])
-
-kb_d_avgc = np.mean(derived_kb_rk_arr)
-
-x_list = [[np.min(time_arr), np.max(time_arr)], [np.min(time_arr), np.max(time_arr)], [np.min(time_arr), np.max(time_arr)], time_arr, time_arr, time_arr, [np.min(time_arr), np.max(time_arr)], time_arr]
-y_list = [[kb_d_avg , kb_d_avg], [kb_d_avgb , kb_d_avgb], [kb_d_avgc , kb_d_avgc], kb_avg_arr, kb_avg_vdw_arr, kb_avg_rk_arr, [K_B, K_B], temp_arr]
-
-for lnum, st_line in enumerate(st_lines):
-    st_line.set_data(x_list[lnum], y_list[lnum])
-
-fig.gca().relim()
-fig.gca().autoscale_view()
-
-ax1.relim()
-ax1.autoscale_view()
-
-ax2.relim()
-ax2.autoscale_view()
-ax2.set_ylim([np.min(temp_arr) - 0.1,np.max(temp_arr) + 0.1])
-
-try:
-    fig_now = plt.gcf()
-    plt.show()
-except (KeyboardInterrupt, SystemExit):
     save_plot(fig_now)
-    exit()
-except Exception as e:
-    print(e)
-
-save_plot(fig_now)
@@ -5,118 +5,125 @@
 # Created by Jerry Yan
 
 
-import csv
 import util
 import numpy as np
 import matplotlib.pyplot as plt
 import itertools
 import time
+import multirun
+import catalog
+import cache
+import export
+import runio
 
 # Boltzmann constant (10^-23)
 K_B = 1.38064852
 
 def save_plot(fig):
-    eps_loc = "data/plt3_" + str(int(time.time())) + '.eps'
-    fig_now.savefig(eps_loc, format='eps')
-    print("\nPlot saved to {}.\n".format(eps_loc))
+    plot_loc = "data/plt3_" + str(int(time.time())) + '.' + export.PLOT_FORMAT
+    print("\nSaving the plot to {} in the background.\n".format(plot_loc))
+    export.export_background(fig_now, plot_loc)
 
 def std_error(err_arr):
     n = len(err_arr)
     ste = np.sqrt(np.sum([e ** 2 for e in err_arr])/(n-1))
     return ste
 
-data_id = util.user_input("data numbers (separated by comma)", val_float=False)
-data_id = data_id.split(",")
+# Read one data CSV and derive its distance, mean k_B (RK, air) without and
+# with the offset (ms), mean absolute error and number of samples
+def load_run(csv_loc, offset):
+    cols = runio.read_columns(csv_loc, ["Measured Time Diff", "Temperature", "Pressure"])
+    distance_d = runio.read_distance(csv_loc)
+    tt_arr = cols["Measured Time Diff"]
+    temp_arr = cols["Temperature"]
+    pres_arr = runio.pressure(cols)
 
-data_ids = [d.strip() for d in data_id]
+    if len(tt_arr) == 0:
+        raise Exception("No samples in {}.".format(csv_loc))
 
-# Desired Offset (ms)
-OFFSET = util.user_input("offset in ms", [-1,1])
+    tt_col = np.array(tt_arr)
+    derived_kb_arr = util.kb_from_tt_rk_air_arr(tt_col, temp_arr, distance_d, pres_arr)
+    derived_kb_offset_arr = util.kb_from_tt_rk_air_arr(tt_col + offset * 10 ** -3, temp_arr, distance_d, pres_arr)
+    kb_d_avg_arr = util.err_from_tt_pct_arr(tt_col, temp_arr, distance_d) * derived_kb_arr
 
-# List storing values
-d_arr = []
-kb_arr = []
+    return (distance_d, np.mean(derived_kb_arr), np.mean(derived_kb_offset_arr), np.mean(kb_d_avg_arr), len(tt_arr))
 
-kb_offset_arr = []
-kb_err_arr = []
+# load_run() through the derived-results cache
+def load_run_cached(csv_loc, offset):
+    r = cache.cached(csv_loc, "plot3.load_run", {"offset": offset}, lambda: {"summary": load_run(csv_loc, offset)})
+    distance_d, kb_d, kb_offset_d, kb_err_d, n = r["summary"]
+    return (distance_d, kb_d, kb_offset_d, kb_err_d, int(n))
 
-for di in data_ids:
+# The run summaries of the CSVs that could be read, as lists of distances,
+# mean k_B without and with the offset (ms) and mean errors
+def load_runs(csv_locs, offset, progress=True):
+    # List storing values
+    d_arr = []
+    kb_arr = []
 
-    DATA_NAME = DATA_NAME = "data/{}".format(di)
-    csv_loc = DATA_NAME + ".csv"
+    kb_offset_arr = []
+    kb_err_arr = []
 
+    # Runs are loaded and reduced in parallel, results come in input order
+    for summary in multirun.map_runs(load_run_cached, csv_locs, (offset,), progress=progress):
+        if summary is None:
+            continue
+        distance_d, kb_d, kb_offset_d, kb_err_d, n = summary
 
-    h = ["Time", "Exp Distance", "Measured Time Diff", "Temperature", "Derived k_B", "Derived k_B Error", "Pressure"]
+        d_arr.append(distance_d)
+        kb_arr.append(kb_d)
+        kb_offset_arr.append(kb_offset_d)
+        kb_err_arr.append(kb_err_d)
 
-    time_arr = []
-    tt_arr = []
-    distance_d = 0
-    temp_arr = []
-    pres_arr = []
-    derived_kb_arr = []
-    derived_kb_offset_arr = []
-    kb_d_avg_arr = []
+    return (d_arr, kb_arr, kb_offset_arr, kb_err_arr)
 
-    try:
-        csvFile = open(csv_loc, "r")
-        dict_reader = csv.DictReader(csvFile)
+# The figure of the run summaries: mean k_B against distance, without and
+# with the offset (ms)
+def make_figure(d_arr, kb_arr, kb_offset_arr, kb_err_arr, offset):
+    fig = plt.figure()
+
+    ax1 = fig.add_subplot(111)
+
+    ax1.set_xlabel("Distance (m)")
+    ax1.set_ylabel(r"Derived $k_B$ ($10^{-23} J K^{-1}$)")
+
+    ax1.errorbar(d_arr, kb_arr, yerr=kb_err_arr, fmt='.', color='#1f77b4', label="Data", markersize=12)
+    if offset != 0:
+        # ax1.errorbar(d_arr, kb_offset_arr, yerr=kb_err_arr, fmt='c.', label="Data w./ offset {}ms".format(offset), markersize=12)
+        ax1.errorbar(d_arr, kb_offset_arr, yerr=kb_err_arr, fmt='m.', label="Data w/o offset", markersize=12)
+    ax1.plot([np.min(d_arr), np.max(d_arr)],[K_B, K_B], color='#ff7f0e', linestyle = 'dashed', label = r"True $k_B$")
+
+    ax1.legend(loc="upper right")
+
+    return fig
+
+if __name__ == "__main__":
+    data_id = util.user_input("data numbers (separated by comma, all, or a catalog query like distance=1.34)", val_float=False)
+    csv_locs = catalog.select_runs(data_id)
 
-        for row in dict_reader:
-            time_arr.append(float(row[h[0]]))
-            distance_d = float(row[h[1]])
-            tt_arr.append(float(row[h[2]]))
-            temp_arr.append(float(row[h[3]]))
-            pres_arr.append(float(row[h[6]]))
+    # Desired Offset (ms)
+    OFFSET = util.user_input("offset in ms", [-1,1])
 
+    d_arr, kb_arr, kb_offset_arr, kb_err_arr = load_runs(csv_locs, OFFSET)
+
+    if len(d_arr) == 0:
+        print("No runs to plot.")
+        exit()
+
+    fig = make_figure(d_arr, kb_arr, kb_offset_arr, kb_err_arr, OFFSET)
+
+    print("The measurement mean value is {}.".format(np.mean(kb_arr)))
+    print("The mean error is {}.".format(np.mean(kb_err_arr)))
+    print("The standard error is {}.".format(std_error(kb_err_arr)))
+    print("The precision is {}%.".format(np.mean(kb_err_arr) * 100/np.mean(kb_arr)))
+
+    try:
+        fig_now = plt.gcf()
+        plt.show()
+    except (KeyboardInterrupt, SystemExit):
+        save_plot(fig_now)
+        exit()
     except Exception as e:
         print(e)
 
-    for i in range(0, len(time_arr)):
-        tt = tt_arr[i]
-        pres = pres_arr[i]
-        tt_offset = tt + OFFSET * 10 ** -3
-        temp = temp_arr[i]
-        kb_d = util.kb_from_tt_rk_air(tt, temp, distance_d, pres)
-        kb_d_offset = util.kb_from_tt_rk_air(tt_offset, temp, distance_d, pres)
-        err_pct = util.err_from_tt_pct(tt, temp, distance_d)
-        err_abs = err_pct * kb_d
-
-        derived_kb_arr.append(kb_d)
-        derived_kb_offset_arr.append(kb_d_offset)
-        kb_d_avg_arr.append(err_abs)
-
-    d_arr.append(distance_d)
-    kb_arr.append(np.mean(derived_kb_arr))
-    kb_offset_arr.append(np.mean(derived_kb_offset_arr))
-    kb_err_arr.append(np.mean(kb_d_avg_arr))
-
-fig = plt.figure()
-
-ax1 = fig.add_subplot(111)
-
-ax1.set_xlabel("Distance (m)")
-ax1.set_ylabel(r"Derived $k_B$ ($10^{-23} J K^{-1}$)")
-
-ax1.errorbar(d_arr, kb_arr, yerr=kb_err_arr, fmt='.', color='#1f77b4', label="Data", markersize=12)
-if OFFSET != 0:
-    # ax1.errorbar(d_arr, kb_offset_arr, yerr=kb_err_arr, fmt='c.', label="Data w./ offset {}ms".format(OFFSET), markersize=12)
-    ax1.errorbar(d_arr, kb_offset_arr, yerr=kb_err_arr, fmt='m.', label="Data w/o offset", markersize=12)
-ax1.plot([np.min(d_arr), np.max(d_arr)],[K_B, K_B], color='#ff7f0e', linestyle = 'dashed', label = r"True $k_B$")
-
-ax1.legend(loc="upper right")
-#ax1.loglog()
-print("The measurement mean value is {}.".format(np.mean(kb_arr)))
-print("The mean error is {}.".format(np.mean(kb_err_arr)))
-print("The standard error is {}.".format(std_error(kb_err_arr)))
-print("The precision is {}%.".format(np.mean(kb_err_arr) * 100/np.mean(kb_arr)))
-
-try:
-    fig_now = plt.gcf()
-    plt.show()
-except (KeyboardInterrupt, SystemExit):
     save_plot(fig_now)
-    exit()
-except Exception as e:
-    print(e)
-
-save_plot(fig_now)
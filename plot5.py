@@ -5,131 +5,126 @@
 # Created by Jerry Yan
 
 
-import csv
 import util
 import numpy as np
 import matplotlib.pyplot as plt
 import itertools
 import time
+import catalog
+import models
+import export
+import runio
 
 # Boltzmann constant (10^-23)
 K_B = 1.38064852
 
 def save_plot(fig):
-    eps_loc = "data/plt5_" + str(int(time.time())) + '.eps'
-    fig_now.savefig(eps_loc, format='eps')
-    print("\nPlot saved to {}.\n".format(eps_loc))
+    plot_loc = "data/plt5_" + str(int(time.time())) + '.' + export.PLOT_FORMAT
+    print("\nSaving the plot to {} in the background.\n".format(plot_loc))
+    export.export_background(fig_now, plot_loc)
+
+# Models compared: ideal gas, VDW correction and RK correction (air)
+MODELS = ["air", "vdw_air", "rk_air"]
 
 def std_error(err_arr):
     n = len(err_arr)
     ste = np.sqrt(np.sum([e ** 2 for e in err_arr])/(n-1))
     return ste
 
-data_id = util.user_input("data numbers (separated by comma)", val_float=False)
-data_id = data_id.split(",")
+# Read one data CSV and derive its distance, mean k_B (air) with the ideal
+# gas law, VDW correction and RK correction, mean absolute error and number
+# of samples
+def load_run(csv_loc):
+    cols = runio.read_columns(csv_loc, ["Measured Time Diff", "Temperature", "Pressure"])
+    distance_d = runio.read_distance(csv_loc)
+    tt_arr = cols["Measured Time Diff"]
+    temp_arr = cols["Temperature"]
+    pres_arr = runio.pressure(cols)
 
-data_ids = [d.strip() for d in data_id]
+    if len(tt_arr) == 0:
+        raise Exception("No samples in {}.".format(csv_loc))
 
-# List storing values
-d_arr = []
-kb_arr = []
-kb_vdw_arr = []
-kb_rk_arr = []
+    kb, err, avg = models.evaluate(MODELS, tt_arr, temp_arr, distance_d, pres_arr)
+    kb_mean = np.mean(kb, axis=1)
 
-kb_offset_arr = []
+    return (distance_d, kb_mean[0], kb_mean[1], kb_mean[2], np.mean(err[0]), len(tt_arr))
 
-kb_err_arr = []
+# The run summaries of the CSVs in the catalog, as lists of distances, mean
+# k_B of the ideal gas, VDW and RK models (air) and mean errors
+def load_runs(csv_locs):
+    # List storing values
+    d_arr = []
+    kb_arr = []
+    kb_vdw_arr = []
+    kb_rk_arr = []
 
-for di in data_ids:
+    kb_err_arr = []
 
-    DATA_NAME = DATA_NAME = "data/{}".format(di)
-    csv_loc = DATA_NAME + ".csv"
+    # The summaries of load_run() come from the run catalog, which only
+    # reads the runs that are new or changed since it was last updated
+    for summary in catalog.run_summaries(csv_locs, MODELS):
+        if summary is None:
+            continue
+        distance_d, n, (s_air, s_vdw, s_rk) = summary
 
+        d_arr.append(distance_d)
+        kb_arr.append(s_air["kb_mean"])
+        kb_vdw_arr.append(s_vdw["kb_mean"])
+        kb_rk_arr.append(s_rk["kb_mean"])
+        kb_err_arr.append(s_air["err_mean"])
 
-    h = ["Time", "Exp Distance", "Measured Time Diff", "Temperature", "Derived k_B", "Derived k_B Error", "Pressure"]
+    return (d_arr, kb_arr, kb_vdw_arr, kb_rk_arr, kb_err_arr)
 
-    time_arr = []
-    tt_arr = []
-    distance_d = 0
-    temp_arr = []
-    pres_arr = []
-    derived_kb_arr = []
-    derived_kb_vdw_arr = []
-    derived_kb_rk_arr = []
-    kb_d_avg_arr = []
+# The figure of the run summaries: mean k_B of the three models against
+# distance
+def make_figure(d_arr, kb_arr, kb_vdw_arr, kb_rk_arr, kb_err_arr):
+    fig = plt.figure()
 
-    try:
-        csvFile = open(csv_loc, "r")
-        dict_reader = csv.DictReader(csvFile)
+    ax1 = fig.add_subplot(111)
+
+    ax1.set_xlabel("Distance (m)")
+    ax1.set_ylabel(r"Derived $k_B$ ($10^{-23} J K^{-1}$)")
+
+    # kb_err_arr = 0
+
+    ax1.errorbar(d_arr, kb_arr, yerr=kb_err_arr, fmt='k.', label="w./ Ideal Gas Law", markersize=12)
+    ax1.errorbar(d_arr, kb_vdw_arr, yerr=kb_err_arr, fmt='b.', label="w./ VDW correction", markersize=12)
+    ax1.errorbar(d_arr, kb_rk_arr, yerr=kb_err_arr, fmt='r.', label="w./ RK correction", markersize=12)
+    ax1.plot([np.min(d_arr), np.max(d_arr)],[K_B, K_B], linestyle = '-.', color='#ff7f0e', label = r"True $k_B$")
+    ax1.plot([np.min(d_arr), np.max(d_arr)],[np.mean(kb_arr), np.mean(kb_arr)],color='k', linestyle = 'dashed', label = "Mean (Ideal Gas)")
+    ax1.plot([np.min(d_arr), np.max(d_arr)],[np.mean(kb_vdw_arr), np.mean(kb_vdw_arr)],color='b', linestyle = 'dashed', label = "Mean (VDW)")
+    ax1.plot([np.min(d_arr), np.max(d_arr)],[np.mean(kb_rk_arr), np.mean(kb_rk_arr)],color='r', linestyle = 'dashed', label = "Mean (RK)")
+
+    # ax1.set_ylim([1.35, 1.41])
+
+    ax1.legend(loc="lower right")
 
-        for row in dict_reader:
-            time_arr.append(float(row[h[0]]))
-            distance_d = float(row[h[1]])
-            tt_arr.append(float(row[h[2]]))
-            temp_arr.append(float(row[h[3]]))
-            pres_arr.append(float(row[h[6]]))
+    return fig
 
+if __name__ == "__main__":
+    data_id = util.user_input("data numbers (separated by comma, all, or a catalog query like distance=1.34)", val_float=False)
+    csv_locs = catalog.select_runs(data_id)
+
+    d_arr, kb_arr, kb_vdw_arr, kb_rk_arr, kb_err_arr = load_runs(csv_locs)
+
+    if len(d_arr) == 0:
+        print("No runs to plot.")
+        exit()
+
+    fig = make_figure(d_arr, kb_arr, kb_vdw_arr, kb_rk_arr, kb_err_arr)
+
+    print("The measurement mean value (ideal gas) is {}.".format(np.mean(kb_arr)))
+    print("The measurement mean value (VDW) is {}.".format(np.mean(kb_vdw_arr)))
+    print("The measurement mean value (RK) is {}.".format(np.mean(kb_rk_arr)))
+    print("The precision is {}%.".format(np.mean(kb_err_arr) * 100/np.mean(kb_arr)))
+
+    try:
+        fig_now = plt.gcf()
+        plt.show()
+    except (KeyboardInterrupt, SystemExit):
+        save_plot(fig_now)
+        exit()
     except Exception as e:
         print(e)
 
-    for i in range(0, len(time_arr)):
-        tt = tt_arr[i]
-        pres = pres_arr[i]
-        temp = temp_arr[i]
-        # kb_d = util.kb_from_tt_n2(tt, temp, distance_d)
-        # kb_d_vdw = util.kb_from_tt_vdw_n2(tt, temp, distance_d, pres)
-        # kb_d_rk = util.kb_from_tt_rk_n2(tt, temp, distance_d, pres)
-        kb_d = util.kb_from_tt_air(tt, temp, distance_d)
-        kb_d_vdw = util.kb_from_tt_vdw_air(tt, temp, distance_d, pres)
-        kb_d_rk = util.kb_from_tt_rk_air(tt, temp, distance_d, pres)
-        err_pct = util.err_from_tt_pct(tt, temp, distance_d)
-        err_abs = err_pct * kb_d
-
-        derived_kb_arr.append(kb_d)
-        derived_kb_vdw_arr.append(kb_d_vdw)
-        derived_kb_rk_arr.append(kb_d_rk)
-        kb_d_avg_arr.append(err_abs)
-
-    d_arr.append(distance_d)
-    kb_arr.append(np.mean(derived_kb_arr))
-    kb_vdw_arr.append(np.mean(derived_kb_vdw_arr))
-    kb_rk_arr.append(np.mean(derived_kb_rk_arr))
-    kb_err_arr.append(np.mean(kb_d_avg_arr))
-
-fig = plt.figure()
-
-ax1 = fig.add_subplot(111)
-
-ax1.set_xlabel("Distance (m)")
-ax1.set_ylabel(r"Derived $k_B$ ($10^{-23} J K^{-1}$)")
-
-# kb_err_arr = 0
-
-ax1.errorbar(d_arr, kb_arr, yerr=kb_err_arr, fmt='k.', label="w./ Ideal Gas Law", markersize=12)
-ax1.errorbar(d_arr, kb_vdw_arr, yerr=kb_err_arr, fmt='b.', label="w./ VDW correction", markersize=12)
-ax1.errorbar(d_arr, kb_rk_arr, yerr=kb_err_arr, fmt='r.', label="w./ RK correction", markersize=12)
-ax1.plot([np.min(d_arr), np.max(d_arr)],[K_B, K_B], linestyle = '-.', color='#ff7f0e', label = r"True $k_B$")
-ax1.plot([np.min(d_arr), np.max(d_arr)],[np.mean(kb_arr), np.mean(kb_arr)],color='k', linestyle = 'dashed', label = "Mean (Ideal Gas)")
-ax1.plot([np.min(d_arr), np.max(d_arr)],[np.mean(kb_vdw_arr), np.mean(kb_vdw_arr)],color='b', linestyle = 'dashed', label = "Mean (VDW)")
-ax1.plot([np.min(d_arr), np.max(d_arr)],[np.mean(kb_rk_arr), np.mean(kb_rk_arr)],color='r', linestyle = 'dashed', label = "Mean (RK)")
-
-# ax1.set_ylim([1.35, 1.41])
-
-ax1.legend(loc="lower right")
-#ax1.loglog()
-
-print("The measurement mean value (ideal gas) is {}.".format(np.mean(kb_arr)))
-print("The measurement mean value (VDW) is {}.".format(np.mean(kb_vdw_arr)))
-print("The measurement mean value (RK) is {}.".format(np.mean(kb_rk_arr)))
-print("The precision is {}%.".format(np.mean(kb_err_arr) * 100/np.mean(kb_arr)))
-
-try:
-    fig_now = plt.gcf()
-    plt.show()
-except (KeyboardInterrupt, SystemExit):
     save_plot(fig_now)
-    exit()
-except Exception as e:
-    print(e)
-
-save_plot(fig_now)
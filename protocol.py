@@ -0,0 +1,221 @@
+# protocol.py - serial protocols between ard_code.ino and main_ard.py
+#
+# Note: This file is not intended to run independently.
+#
+# JSON mode (default, also read by pyserial_test.py): one line per sample,
+#   {"tt_us":7890,"temp":21.5,"pres":101325.3}
+#
+# Binary mode: fixed-size little-endian packets of PACKET_SIZE bytes,
+#   sync    uint8    0xA5
+#   seq     uint16   packet counter, wraps at 65536
+#   t_us    uint32   Arduino micros() when the sample was taken
+#   tt_us   uint32   HC-SR04 echo pulse duration (us)
+#   temp    float32  temperature (°C)
+#   pres    float32  pressure (Pa)
+#   crc     uint16   CRC-16/CCITT-FALSE of the bytes from seq to pres
+#
+# The host switches the firmware to binary mode by sending "BIN <baud>\n"
+# at 9600 baud; the firmware answers "OK <baud>" and reopens the port at
+# the new baud rate.
+
+import binascii
+import json
+import re
+import struct
+import time
+
+import numpy as np
+
+SYNC = 0xA5
+PACKET = struct.Struct("<BHIIffH")
+PACKET_SIZE = PACKET.size
+
+# Binary mode baud rate requested by the host
+BINARY_BAUD = 115200
+
+# The exact line ArduinoJson writes for one sample
+JSON_SAMPLE = re.compile(rb'^\{"tt_us":([-+.0-9eE]+),"temp":([-+.0-9eE]+),"pres":([-+.0-9eE]+)\}\r?$', re.M)
+
+# Any line: the three values of a JSON_SAMPLE line, or else the whole line
+# in the fourth group
+JSON_LINE = re.compile(rb'^(?:\{"tt_us":([-+.0-9eE]+),"temp":([-+.0-9eE]+),"pres":([-+.0-9eE]+)\}\r?|(.*?))\r?$', re.M)
+
+# Incremental parser of the JSON lines
+#
+# feed_chunks() takes the raw chunks returned by ser.read(ser.in_waiting)
+# and returns the tt_us, temp and pres columns of the lines they complete,
+# plus the index of the chunk that completed each line; a partial last line
+# is kept for the next call. When every line has the usual three-key shape,
+# the whole batch is parsed by one regex pass and one NumPy conversion.
+# Otherwise only the unusual lines go through json.loads, and lines that
+# still do not parse are counted in self.malformed.
+class JsonLineParser:
+    def __init__(self):
+        self.tail = b""
+        self.lines = 0
+        self.malformed = 0
+
+    def feed(self, chunk):
+        return self.feed_chunks([chunk])[:3]
+
+    def feed_chunks(self, chunks):
+        data = self.tail + b"".join(chunks)
+        end = data.rfind(b"\n")
+        if end < 0:
+            self.tail = data
+            return (np.zeros(0), np.zeros(0), np.zeros(0), np.zeros(0, dtype=int))
+        chunk_ends = np.cumsum([len(c) for c in chunks]) + len(self.tail)
+        self.tail = data[end + 1:]
+
+        line_ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8, count=end + 1) == 10)
+        line_chunk = np.searchsorted(chunk_ends, line_ends, side="right")
+        n_lines = len(line_ends)
+
+        matches = JSON_SAMPLE.findall(data, 0, end)
+        if len(matches) == n_lines:
+            try:
+                vals = np.array(matches, dtype=float)
+            except ValueError:
+                pass
+            else:
+                self.lines += n_lines
+                return (vals[:, 0], vals[:, 1], vals[:, 2], line_chunk)
+
+        fields = np.array(JSON_LINE.findall(data, 0, end), dtype=bytes).reshape(-1, 4)[:n_lines]
+        other = fields[:, 3] != b""
+        fast = ~other & (fields[:, 0] != b"")
+        keep = fast | other
+
+        vals = np.zeros((n_lines, 3))
+        try:
+            vals[fast] = fields[fast, :3].astype(float)
+        except ValueError:
+            for i in np.flatnonzero(fast):
+                try:
+                    vals[i] = fields[i, :3].astype(float)
+                except ValueError:
+                    self.malformed += 1
+                    keep[i] = False
+
+        for i in np.flatnonzero(other):
+            try:
+                l_json = json.loads(fields[i, 3])
+                vals[i] = [float(l_json['tt_us']), float(l_json['temp']), float(l_json['pres'])]
+            except Exception:
+                self.malformed += 1
+                keep[i] = False
+
+        self.lines += int(np.count_nonzero(fast | other))
+        vals = vals[keep]
+        return (vals[:, 0], vals[:, 1], vals[:, 2], line_chunk[keep])
+
+def crc16(data):
+    return binascii.crc_hqx(data, 0xFFFF)
+
+def encode_packet(seq, t_us, tt_us, temp, pres):
+    body = PACKET.pack(SYNC, seq & 0xFFFF, t_us & 0xFFFFFFFF, tt_us, temp, pres, 0)[:-2]
+    return body + struct.pack("<H", crc16(body[1:]))
+
+# Incremental decoder of the binary stream
+#
+# feed() takes raw bytes as they come from the port (in chunks of any size)
+# and returns the complete packets decoded so far as columns. A packet with
+# a bad CRC makes the decoder drop one byte and look for the next sync byte,
+# so it recovers from corruption or a start in the middle of a packet. Gaps
+# in the sequence numbers are counted as dropped packets.
+class BinaryDecoder:
+    def __init__(self):
+        self.buf = bytearray()
+        self.packets = 0
+        self.dropped = 0
+        self.corrupted = 0
+
+        self.seq = None
+        self.t_us = None
+        self.t_wraps = 0
+
+    def feed(self, data):
+        self.buf += data
+        buf = self.buf
+        seq_arr = []
+        t_arr = []
+        tt_us_arr = []
+        temp_arr = []
+        pres_arr = []
+
+        i = 0
+        end = len(buf) - PACKET_SIZE
+        while i <= end:
+            if buf[i] != SYNC:
+                j = buf.find(SYNC, i + 1)
+                if j < 0:
+                    i = len(buf)
+                    break
+                i = j
+                continue
+            packet = bytes(buf[i:i + PACKET_SIZE])
+            sync, seq, t_us, tt_us, temp, pres, crc = PACKET.unpack(packet)
+            if crc != crc16(packet[1:-2]):
+                self.corrupted += 1
+                i += 1
+                continue
+
+            if self.seq is not None:
+                self.dropped += (seq - self.seq - 1) & 0xFFFF
+            self.seq = seq
+
+            # Unwrap micros(), which overflows every 71.6 minutes
+            if self.t_us is not None and t_us < self.t_us:
+                self.t_wraps += 1
+            self.t_us = t_us
+
+            seq_arr.append(seq)
+            t_arr.append((t_us + self.t_wraps * 2 ** 32) * 10 ** (-6))
+            tt_us_arr.append(tt_us)
+            temp_arr.append(temp)
+            pres_arr.append(pres)
+            self.packets += 1
+            i += PACKET_SIZE
+
+        del buf[:i]
+        return (np.array(seq_arr), np.array(t_arr), np.array(tt_us_arr, dtype=float), np.array(temp_arr, dtype=float), np.array(pres_arr, dtype=float))
+
+# Seconds between two "BIN" requests while the firmware does not answer
+RESEND_INTERVAL = 0.5
+
+# Longest single read while waiting for the answer (s)
+READ_TIMEOUT = 0.1
+
+# Ask the firmware to switch to binary mode at the given baud rate. Returns
+# False (and leaves the port in JSON mode) if the firmware does not answer
+# within timeout seconds, e.g. because it is an older version.
+#
+# Opening the port resets an Uno, and a request sent while its bootloader
+# runs is lost, so the request is repeated every RESEND_INTERVAL until the
+# answer arrives. Reads are bounded by READ_TIMEOUT (instead of the timeout
+# of the port) so the whole exchange keeps to timeout.
+def negotiate_binary(ser, baud=BINARY_BAUD, timeout=5):
+    port_timeout = ser.timeout
+    ser.timeout = READ_TIMEOUT
+    try:
+        ser.reset_input_buffer()
+        t_end = time.monotonic() + timeout
+        t_send = 0
+        line = b""
+        while time.monotonic() < t_end:
+            if time.monotonic() >= t_send:
+                ser.write("BIN {}\n".format(baud).encode("ascii"))
+                t_send = time.monotonic() + RESEND_INTERVAL
+            # A line cut off by the read timeout is completed by the next read
+            line += ser.readline()
+            if not line.endswith(b"\n"):
+                continue
+            if line.startswith(b"OK"):
+                ser.flush()
+                ser.baudrate = baud
+                ser.reset_input_buffer()
+                return True
+            line = b""
+        return False
+    finally:
+        ser.timeout = port_timeout
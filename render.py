@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+# render.py - headless batch rendering of the plot script figures
+#
+# Renders the figures of plot.py, plot2.py and plot4.py for every selected
+# run (in parallel worker processes) and the run summary figures of plot3.py
+# and plot5.py for the whole selection, with the non-interactive Agg backend
+# and without prompts, so figures can be regenerated overnight or on a Pi
+# without a display. A figure is skipped when it is newer than its CSVs.
+#
+# Usage: python3 render.py all | ID,ID,... | distance=1.34 ...
+#                          [--scripts plot,plot2,plot3,plot4,plot5]
+#                          [--format png] [--out figures] [--offset 0]
+
+import argparse
+import os
+import re
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+import multirun
+import export
+import catalog
+import plot
+import plot2
+import plot3
+import plot4
+import plot5
+
+def figures_plot(csv_loc):
+    distance_d, time_arr, tt_arr, temp_arr, pres_arr, derived_kb_arr, kb_err_abs_arr, kb_avg_arr, kb_mask = plot.load_derived(csv_loc)
+    return [plot.make_figure(time_arr, temp_arr, pres_arr, derived_kb_arr, kb_err_abs_arr, kb_avg_arr)]
+
+def figures_plot2(csv_loc):
+    time_arr, distance_d, tt_arr, temp_arr, pres_arr, derived = plot2.load_derived(csv_loc)
+    return list(plot2.make_figures(time_arr, temp_arr, derived))
+
+def figures_plot4(csv_loc):
+    time_arr, distance_d, tt_arr, temp_arr, pres_arr, derived_kb_arr, kb_err_abs_arr, kb_avg_arr = plot4.load_derived(csv_loc)
+    return [plot4.make_figure(time_arr, tt_arr, temp_arr, pres_arr, derived_kb_arr, kb_err_abs_arr, kb_avg_arr)]
+
+def figures_plot3(csv_locs, offset):
+    d_arr, kb_arr, kb_offset_arr, kb_err_arr = plot3.load_runs(csv_locs, offset, progress=False)
+    if len(d_arr) == 0:
+        return []
+    return [plot3.make_figure(d_arr, kb_arr, kb_offset_arr, kb_err_arr, offset)]
+
+def figures_plot5(csv_locs, offset):
+    d_arr, kb_arr, kb_vdw_arr, kb_rk_arr, kb_err_arr = plot5.load_runs(csv_locs)
+    if len(d_arr) == 0:
+        return []
+    return [plot5.make_figure(d_arr, kb_arr, kb_vdw_arr, kb_rk_arr, kb_err_arr)]
+
+# Figures of one run, with the name suffix of each figure
+RUN_SCRIPTS = {
+    "plot": (figures_plot, [""]),
+    "plot2": (figures_plot2, ["_kb", "_temp"]),
+    "plot4": (figures_plot4, [""]),
+}
+
+# Figures of a selection of runs
+SUMMARY_SCRIPTS = {
+    "plot3": (figures_plot3, [""]),
+    "plot5": (figures_plot5, [""]),
+}
+
+def out_locs(out_dir, name, suffixes, fmt):
+    return [os.path.join(out_dir, "{0}{1}.{2}".format(name, s, fmt)) for s in suffixes]
+
+# True if every output exists and is newer than every input
+def up_to_date(locs, csv_locs):
+    try:
+        newest_in = max(os.stat(c).st_mtime_ns for c in csv_locs)
+        return min(os.stat(l).st_mtime_ns for l in locs) > newest_in
+    except (OSError, ValueError):
+        return False
+
+def save_figures(figs, locs, fmt, dpi):
+    for fig, loc in zip(figs, locs):
+        export.export(fig, loc, fmt, dpi)
+        plt.close(fig)
+
+# Render the figures of the given scripts for one run. Returns the numbers
+# of figures written and skipped.
+def render_run(csv_loc, scripts, fmt, out_dir, force, dpi):
+    run_id = os.path.splitext(os.path.basename(csv_loc))[0]
+    written = 0
+    skipped = 0
+    for script in scripts:
+        fn, suffixes = RUN_SCRIPTS[script]
+        locs = out_locs(out_dir, "{0}_{1}".format(run_id, script), suffixes, fmt)
+        if not force and up_to_date(locs, [csv_loc]):
+            skipped += len(locs)
+            continue
+        save_figures(fn(csv_loc), locs, fmt, dpi)
+        written += len(locs)
+    return (written, skipped)
+
+# Render the summary figures of a script for the whole selection, named
+# after the selection. Returns the numbers of figures written and skipped.
+def render_summary(csv_locs, script, label, offset, fmt, out_dir, force, dpi):
+    fn, suffixes = SUMMARY_SCRIPTS[script]
+    name = "{0}_{1}".format(script, label)
+    if script == "plot3" and offset != 0:
+        name += "_offset{}".format(offset)
+    locs = out_locs(out_dir, name, suffixes, fmt)
+    if not force and up_to_date(locs, csv_locs):
+        return (0, len(locs))
+    figs = fn(csv_locs, offset)
+    if len(figs) == 0:
+        print("{}: no runs to plot.".format(script))
+        return (0, 0)
+    save_figures(figs, locs, fmt, dpi)
+    return (len(locs), 0)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the figures of the plot scripts without a display.")
+    parser.add_argument("runs", nargs="+", help="all, comma separated IDs or a catalog query")
+    parser.add_argument("--scripts", default="plot,plot2,plot3,plot4,plot5", help="plot scripts to render (default all)")
+    parser.add_argument("--format", default="png", choices=export.FORMATS, help="figure format (default png)")
+    parser.add_argument("--out", default="figures", help="output directory (default figures)")
+    parser.add_argument("--dpi", type=float, help="resolution of raster output and of the rasterized data in vector output")
+    parser.add_argument("--offset", type=float, default=0, help="offset in ms for plot3.py (default 0)")
+    parser.add_argument("--workers", type=int, help="worker processes (default one per CPU)")
+    parser.add_argument("--force", action="store_true", help="render even when the figure is newer than its CSVs")
+    args = parser.parse_args()
+
+    scripts = [s.strip() for s in args.scripts.split(",")]
+    for s in scripts:
+        if s not in RUN_SCRIPTS and s not in SUMMARY_SCRIPTS:
+            parser.error("unknown script {}".format(s))
+
+    selection = " ".join(args.runs)
+    csv_locs = [c for c in catalog.select_runs(selection) if os.path.exists(c)]
+    if len(csv_locs) == 0:
+        print("No runs selected.")
+        exit()
+    os.makedirs(args.out, exist_ok=True)
+
+    written = 0
+    skipped = 0
+    run_scripts = [s for s in scripts if s in RUN_SCRIPTS]
+    if len(run_scripts) > 0:
+        for r in multirun.map_runs(render_run, csv_locs, (run_scripts, args.format, args.out, args.force, args.dpi), args.workers):
+            if r is not None:
+                written += r[0]
+                skipped += r[1]
+
+    label = re.sub(r"[^\w.-]+", "_", selection.replace("=", "-")).strip("_")
+    for script in scripts:
+        if script in SUMMARY_SCRIPTS:
+            w, s = render_summary(csv_locs, script, label, args.offset, args.format, args.out, args.force, args.dpi)
+            written += w
+            skipped += s
+
+    print("{0} figures written to {1}, {2} up to date.".format(written, args.out, skipped))
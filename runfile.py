@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+# runfile.py - columnar binary run format (.kbr)
+#
+# A .kbr file holds one run: a small JSON header with the per-run constants
+# (distance, SR04 offset, layout and format version, start time) and one
+# block of little-endian float64 values per column. "Exp Distance" is kept in
+# the header only. Columns are read through np.memmap, so a loader can open a
+# run of any size and touch only the column (or the time window) it needs.
+#
+# File layout:
+#   8 bytes     MAGIC
+#   2 bytes     format version (uint16)
+#   4 bytes     length of the JSON header (uint32)
+#   JSON header, padded with spaces to HEADER_SIZE bytes in total
+#   column blocks, each starting at a multiple of ALIGN bytes
+#
+# Usage: python3 runfile.py convert [all | ID,ID,... | distance=1.34 ...] [--force]
+#        python3 runfile.py info data/<id>.kbr
+
+import argparse
+import itertools
+import json
+import os
+import struct
+
+import numpy as np
+
+import runio
+
+MAGIC = b"KBRUN\x00\x00\x00"
+VERSION = 1
+PREAMBLE = struct.Struct("<8sHI")
+
+# Room for the header, so it can be rewritten in place when a run is
+# finished (e.g. with its final row count)
+HEADER_SIZE = 4096
+
+ALIGN = 64
+
+DTYPE = "<f8"
+
+# Rows converted at a time by convert_csv()
+CHUNK_ROWS = 10 ** 6
+
+def _aligned(n):
+    return -(-n // ALIGN) * ALIGN
+
+def _write_header(f, meta):
+    data = json.dumps(meta).encode("utf-8")
+    if PREAMBLE.size + len(data) > HEADER_SIZE:
+        raise Exception("The run header is too large.")
+    f.seek(0)
+    f.write(PREAMBLE.pack(MAGIC, VERSION, len(data)))
+    f.write(data.ljust(HEADER_SIZE - PREAMBLE.size))
+
+def read_meta(run_loc):
+    with open(run_loc, "rb") as f:
+        magic, version, size = PREAMBLE.unpack(f.read(PREAMBLE.size))
+        if magic != MAGIC:
+            raise Exception("{} is not a run file.".format(run_loc))
+        if version > VERSION:
+            raise Exception("{0} has format version {1}, newer than {2}.".format(run_loc, version, VERSION))
+        return json.loads(f.read(size).decode("utf-8"))
+
+# Create a run file with room for capacity rows of the given columns.
+# Returns the header and writable memory maps of the column blocks; fill
+# them, then call finish_run() with the number of rows written.
+def create_run(run_loc, columns, capacity, meta):
+    meta = dict(meta, version=VERSION, rows=0, capacity=capacity, columns=[])
+    offset = HEADER_SIZE
+    for c in columns:
+        meta["columns"].append({"name": c, "dtype": DTYPE, "offset": offset})
+        offset = _aligned(offset + capacity * np.dtype(DTYPE).itemsize)
+
+    with open(run_loc, "wb") as f:
+        _write_header(f, meta)
+        f.truncate(offset)
+
+    blocks = {}
+    if capacity > 0:
+        for c in meta["columns"]:
+            blocks[c["name"]] = np.memmap(run_loc, dtype=c["dtype"], mode="r+", offset=c["offset"], shape=(capacity,))
+    return (meta, blocks)
+
+def finish_run(run_loc, meta, blocks, rows):
+    for b in blocks.values():
+        b.flush()
+    meta["rows"] = rows
+    with open(run_loc, "r+b") as f:
+        _write_header(f, meta)
+
+# Write a run held in memory (a dict of equally long columns)
+def write_run(run_loc, cols, meta):
+    names = [c for c in cols if c != "Exp Distance"]
+    rows = len(cols[names[0]]) if len(names) > 0 else 0
+    meta, blocks = create_run(run_loc, names, rows, meta)
+    for c in names:
+        if rows > 0:
+            blocks[c][:] = cols[c]
+    finish_run(run_loc, meta, blocks, rows)
+
+# A run file opened for reading. Columns are memory-mapped on first use.
+class RunFile:
+    def __init__(self, run_loc):
+        self.path = run_loc
+        self.meta = read_meta(run_loc)
+        self.rows = self.meta["rows"]
+        self.distance = self.meta.get("distance")
+        self.columns = [c["name"] for c in self.meta["columns"]]
+        self._maps = {}
+
+    # A stored column, memory-mapped ("Exp Distance" is not stored: see read())
+    def column(self, name):
+        if name not in self._maps:
+            c = self.meta["columns"][self.columns.index(name)]
+            if self.rows == 0:
+                self._maps[name] = np.empty(0, dtype=c["dtype"])
+            else:
+                self._maps[name] = np.memmap(self.path, dtype=c["dtype"], mode="r", offset=c["offset"], shape=(self.rows,))
+        return self._maps[name]
+
+    def has(self, name):
+        return name in self.columns or name == "Exp Distance"
+
+    # Column names in the order of the CSV header of the run, "Exp Distance"
+    # included
+    def header(self):
+        return [c for c in runio.COLUMNS if self.has(c)] + [c for c in self.columns if c not in runio.COLUMNS]
+
+    # Row range [i0, i1) of the samples with t0 <= Time < t1, found by binary
+    # search in the (increasing) time column
+    def rows_between(self, t0=None, t1=None):
+        t = self.column("Time")
+        i0 = 0 if t0 is None else int(np.searchsorted(t, t0, "left"))
+        i1 = self.rows if t1 is None else int(np.searchsorted(t, t1, "left"))
+        return (i0, max(i0, i1))
+
+    # The requested columns (all, in header order, by default) of the time
+    # window [t0, t1); None for a column the run does not have
+    def read(self, columns=None, t0=None, t1=None):
+        if columns is None:
+            columns = self.header()
+        i0, i1 = self.rows_between(t0, t1)
+        cols = {}
+        for c in columns:
+            if c == "Exp Distance":
+                # Built for the rows read only, not for the whole run
+                cols[c] = np.full(i1 - i0, np.nan if self.distance is None else float(self.distance))
+            elif self.has(c):
+                cols[c] = self.column(c)[i0:i1]
+            else:
+                cols[c] = None
+        return cols
+
+# Metadata of a run from its CSV: the id is the start time, the distance
+# the "Exp Distance" of the last row
+def csv_meta(csv_loc, offset_us=None):
+    run_id = os.path.splitext(os.path.basename(csv_loc))[0]
+    header = runio.read_header(csv_loc)
+    return {
+        "id": run_id,
+        "start_time": float(run_id) if run_id.isdigit() else None,
+        "distance": runio.read_distance(csv_loc),
+        "schema": runio.schema(header),
+        "sr04_offset_us": offset_us,
+    }
+
+# Convert a data CSV to a run file, CHUNK_ROWS rows at a time, so a run
+# larger than the memory can be converted. Returns the number of rows.
+def convert_csv(csv_loc, run_loc, offset_us=None, chunk_rows=CHUNK_ROWS):
+    header = runio.read_header(csv_loc)
+    names = [c for c in header if c != "Exp Distance"]
+    usecols = [header.index(c) for c in names]
+
+    # Rows after the header, counted by line ends (plus an unterminated
+    # last line)
+    lines = 0
+    last = b"\n"
+    with open(csv_loc, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":
+        lines += 1
+    capacity = max(lines - 1, 0)
+    meta, blocks = create_run(run_loc, names, capacity, csv_meta(csv_loc, offset_us))
+
+    rows = 0
+    with open(csv_loc, "r", encoding="latin1") as f:
+        next(f, None)
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if len(lines) == 0:
+                break
+            data = runio.load_lines(lines, len(header), usecols)
+            n = min(len(data), capacity - rows)
+            for i, c in enumerate(names):
+                blocks[c][rows:rows + n] = data[:n, i]
+            rows += n
+
+    finish_run(run_loc, meta, blocks, rows)
+    return rows
+
+def run_loc_of(csv_loc):
+    return os.path.splitext(csv_loc)[0] + ".kbr"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert data CSVs to the binary run format, or show a run file.")
+    parser.add_argument("command", choices=["convert", "info"])
+    parser.add_argument("runs", nargs="*", default=["all"], help="convert: all, comma separated IDs or a catalog query; info: run files")
+    parser.add_argument("--offset", type=float, help="SR04 offset (us) to record in the header")
+    parser.add_argument("--force", action="store_true", help="convert even when the run file is newer than its CSV")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        for run_loc in args.runs:
+            run = RunFile(run_loc)
+            print("{0}: {1} rows, distance {2} m, columns {3}".format(run_loc, run.rows, run.distance, ", ".join(run.columns)))
+            print(json.dumps({k: v for k, v in run.meta.items() if k != "columns"}))
+        exit()
+
+    import catalog
+    converted = 0
+    for csv_loc in catalog.select_runs(" ".join(args.runs)):
+        run_loc = run_loc_of(csv_loc)
+        try:
+            if not args.force and os.path.exists(run_loc) and os.stat(run_loc).st_mtime_ns > os.stat(csv_loc).st_mtime_ns:
+                continue
+            rows = convert_csv(csv_loc, run_loc, args.offset)
+        except Exception as e:
+            print("{0}: {1}".format(csv_loc, e))
+            continue
+        converted += 1
+        print("{0} -> {1} ({2} rows, {3:.1f} of {4:.1f} kB)".format(csv_loc, run_loc, rows, os.path.getsize(run_loc) / 1024, os.path.getsize(csv_loc) / 1024))
+    print("{} runs converted.".format(converted))
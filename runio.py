@@ -0,0 +1,253 @@
+# runio.py - fast reading of the data CSVs
+#
+# Note: This file is not intended to run independently.
+#
+# The data/ archive mixes several CSV layouts: the oldest runs lack the k_B
+# error, the pressure or the raw HC-SR04 time. read_columns() detects the
+# layout from the header, parses only the requested columns straight into
+# float arrays (in C, with np.loadtxt) and gives None for a requested column
+# the run does not have, instead of failing. Binary run files (.kbr, see
+# runfile.py) are read through the same functions.
+#
+# A time window [t0, t1) of a long run is read without parsing the rest of
+# the file: a sparse time index of the CSV (the byte offset and time of every
+# INDEX_EVERY-th row) is binary-searched for the bytes holding the window.
+
+import csv
+import hashlib
+import os
+import warnings
+import zipfile
+
+import numpy as np
+
+import cache
+
+# Every column main_ard.py has ever written, in file order
+COLUMNS = ["Time", "Exp Distance", "Measured Time Diff", "Temperature", "Derived k_B", "Derived k_B Error", "Pressure", "HC-SRO4 Raw"]
+
+# Data CSV layouts, by number of columns, from the oldest to the newest
+SCHEMAS = {5: "kb", 6: "kb_err", 7: "pres", 8: "raw"}
+
+# Pressure assumed for runs recorded without a pressure sensor (Pa)
+STANDARD_PRESSURE = 101325
+
+# Rows between two entries of the time index of a CSV
+INDEX_EVERY = 4096
+
+def is_run_file(path):
+    return path.endswith(".kbr")
+
+def read_header(csv_loc):
+    if is_run_file(csv_loc):
+        import runfile
+        return runfile.RunFile(csv_loc).header()
+    with open(csv_loc, "r", newline="") as f:
+        return next(csv.reader(f), [])
+
+# Layout name of a header (None if unknown)
+def schema(header):
+    if header != COLUMNS[:len(header)]:
+        return None
+    return SCHEMAS.get(len(header))
+
+# The requested columns (all columns of the file by default) as a dict of
+# float arrays; a column the file does not have is None. Rows that do not
+# have as many fields as the header (e.g. a line cut short by a crash) are
+# skipped. With t0 and/or t1, only the samples with t0 <= Time < t1 are read.
+def read_columns(csv_loc, columns=None, t0=None, t1=None):
+    if is_run_file(csv_loc):
+        import runfile
+        return runfile.RunFile(csv_loc).read(columns, t0, t1)
+
+    header = read_header(csv_loc)
+    if columns is None:
+        columns = header
+    present = [c for c in columns if c in header]
+    cols = {c: None for c in columns}
+    if len(present) == 0:
+        return cols
+
+    if t0 is not None or t1 is not None:
+        return _read_window(csv_loc, header, cols, present, t0, t1)
+
+    usecols = [header.index(c) for c in present]
+    data = _loadtxt(csv_loc, len(header), usecols, count_commas(csv_loc), skiprows=1, encoding="latin1")
+    if data is None:
+        with open(csv_loc, "r", newline="") as f:
+            next(f, None)
+            data = parse_rows(f, len(header), usecols)
+
+    for i, c in enumerate(present):
+        cols[c] = data[:, i]
+    return cols
+
+# read_columns() of the rows in [t0, t1): only the index blocks that overlap
+# the window are read and parsed
+def _read_window(csv_loc, header, cols, present, t0, t1):
+    times, offsets = time_index(csv_loc)
+    if len(offsets) == 0:
+        return {c: np.empty(0) if c in present else None for c in cols}
+    start = offsets[0]
+    end = os.path.getsize(csv_loc)
+    if t0 is not None:
+        start = offsets[max(int(np.searchsorted(times, t0, "left")) - 1, 0)]
+    if t1 is not None:
+        j = int(np.searchsorted(times, t1, "left"))
+        if j < len(offsets):
+            end = offsets[j]
+
+    with open(csv_loc, "rb") as f:
+        f.seek(start)
+        lines = f.read(max(end - start, 0)).decode("latin1").splitlines()
+    usecols = [header.index("Time")] + [header.index(c) for c in present]
+    data = load_lines(lines, len(header), usecols)
+
+    keep = np.ones(len(data), dtype=bool)
+    if t0 is not None:
+        keep &= data[:, 0] >= t0
+    if t1 is not None:
+        keep &= data[:, 0] < t1
+    data = data[keep]
+    for i, c in enumerate(present):
+        cols[c] = data[:, i + 1]
+    return cols
+
+# The usecols fields of CSV lines (without the header) as a 2-D array, in C
+# where possible, skipping malformed rows
+def load_lines(lines, n_fields, usecols):
+    data = _loadtxt(lines, n_fields, usecols, "".join(lines).count(","))
+    if data is None:
+        return parse_rows(lines, n_fields, usecols)
+    return data
+
+# Fast path of read_columns() and load_lines(): the usecols fields of src (a
+# file or lines) parsed in C by np.loadtxt, or None if a row does not have
+# n_fields fields. loadtxt alone keeps any row that has the usecols fields,
+# so the last field is loaded as well (a row cut short fails) and the n_commas
+# of src must be n_fields - 1 per row (a row with extra fields has more).
+def _loadtxt(src, n_fields, usecols, n_commas, **kwargs):
+    try:
+        with warnings.catch_warnings():
+            # An empty run is not an error
+            warnings.simplefilter("ignore", UserWarning)
+            data = np.loadtxt(src, delimiter=",", usecols=usecols + [n_fields - 1], comments=None, ndmin=2, **kwargs)
+    except ValueError:
+        return None
+    if n_commas != len(data) * (n_fields - 1):
+        return None
+    return data[:, :len(usecols)]
+
+# Number of commas in a CSV after the header line
+def count_commas(csv_loc):
+    n = 0
+    with open(csv_loc, "rb") as f:
+        f.readline()
+        for block in iter(lambda: f.read(1 << 22), b""):
+            n += block.count(b",")
+    return n
+
+# Slow path of read_columns() for lines with malformed rows: the usecols
+# fields of the rows with n_fields fields, as a 2-D array
+def parse_rows(lines, n_fields, usecols):
+    rows = []
+    for r in csv.reader(lines):
+        if len(r) != n_fields:
+            continue
+        try:
+            rows.append([float(r[i]) for i in usecols])
+        except ValueError:
+            continue
+    return np.array(rows, dtype=float).reshape(-1, len(usecols))
+
+# Byte offsets and times of the rows 0, every, 2 * every, ... of a CSV (or
+# of the next well-formed row), from one pass over the file. The line ends
+# are found block by block with NumPy; only the indexed rows are parsed.
+def build_time_index(csv_loc, every=INDEX_EVERY):
+    i = read_header(csv_loc).index("Time")
+    size = os.path.getsize(csv_loc)
+    starts = []
+    with open(csv_loc, "rb") as f:
+        f.readline()
+        starts.append(f.tell())
+        base = f.tell()
+        row = 0
+        for block in iter(lambda: f.read(1 << 22), b""):
+            ends = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 10)
+            rows = row + 1 + np.arange(len(ends))
+            sel = (rows % every) == 0
+            starts.extend((base + ends[sel] + 1).tolist())
+            row += len(ends)
+            base += len(block)
+
+        times = []
+        offsets = []
+        for start in starts:
+            f.seek(start)
+            while start < size:
+                line = f.readline()
+                try:
+                    t = float(line.split(b",")[i])
+                except (IndexError, ValueError):
+                    start = f.tell()
+                    continue
+                if len(offsets) == 0 or start > offsets[-1]:
+                    times.append(t)
+                    offsets.append(start)
+                break
+    return (np.array(times, dtype=float), np.array(offsets, dtype=np.int64))
+
+# The time index of a CSV, kept in the cache directory and rebuilt when the
+# size or modification time of the CSV changes
+def time_index(csv_loc, every=INDEX_EVERY, cache_dir=cache.CACHE_DIR):
+    st = os.stat(csv_loc)
+    stamp = np.array([st.st_size, st.st_mtime_ns, every], dtype=np.int64)
+    key = hashlib.blake2b(os.path.abspath(csv_loc).encode("utf-8"), digest_size=16).hexdigest()
+    path = os.path.join(cache_dir, "index-{}.npz".format(key))
+    try:
+        with np.load(path, allow_pickle=False) as f:
+            if np.array_equal(f["stamp"], stamp):
+                return (f["times"], f["offsets"])
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        pass
+
+    times, offsets = build_time_index(csv_loc, every)
+    try:
+        cache.store(path, {"stamp": stamp, "times": times, "offsets": offsets})
+    except OSError as e:
+        print(e)
+    return (times, offsets)
+
+# Distance of a run (the "Exp Distance" of its last complete row), read from
+# the end of the file. None for an empty run.
+def read_distance(csv_loc, block=4096):
+    if is_run_file(csv_loc):
+        import runfile
+        return runfile.RunFile(csv_loc).distance
+
+    header = read_header(csv_loc)
+    i = header.index("Exp Distance")
+    with open(csv_loc, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(size - block, 0))
+        lines = f.read().decode("latin1").splitlines()
+    for line in reversed(lines):
+        fields = line.split(",")
+        if len(fields) == len(header):
+            try:
+                return float(fields[i])
+            except ValueError:
+                continue
+    if size > block:
+        d = read_columns(csv_loc, ["Exp Distance"])["Exp Distance"]
+        if len(d) > 0:
+            return d[-1]
+    return None
+
+# The pressure column of a run, or STANDARD_PRESSURE for every sample of a
+# run recorded without one
+def pressure(cols, like="Measured Time Diff"):
+    if cols.get("Pressure") is not None:
+        return cols["Pressure"]
+    return np.full(len(cols[like]), float(STANDARD_PRESSURE))
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+# samplelog.py - crash-safe append-only sample log for live acquisition
+#
+# Every sample is appended to a buffered log as soon as it arrives and the log
+# is fsync'ed every few seconds (by a background thread when no sample comes
+# in, e.g. while the Arduino is stalled), so a crash, a power glitch or a kill -9 loses
+# at most the last few seconds of a run. The log uses the same rows as the
+# standard data CSV; a log cut off in the middle of a row can be turned back
+# into a CSV with:
+#
+#   python3 samplelog.py data/1559781685.log [data/1559781685.csv]
+
+import csv
+import os
+import sys
+import threading
+import time
+
+# Seconds between two fsync calls
+FSYNC_INTERVAL = 5
+
+class SampleLog:
+    def __init__(self, path, header, fsync_interval=FSYNC_INTERVAL):
+        self.path = path
+        self.header = header
+        self.fsync_interval = fsync_interval
+        self.count = 0
+        self.dirty = False
+        self.lock = threading.Lock()
+
+        self.f = open(path, "w", newline="")
+        self.writer = csv.writer(self.f, lineterminator="\n")
+        self.writer.writerow(header)
+        self.sync()
+
+        self.closing = threading.Event()
+        self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self.flusher.start()
+
+    def append(self, row):
+        with self.lock:
+            if self.f.closed:
+                return
+            self.writer.writerow(row)
+            self.count += 1
+            self.dirty = True
+            if time.monotonic() - self.t_sync >= self.fsync_interval:
+                self._sync()
+
+    def sync(self):
+        with self.lock:
+            self._sync()
+
+    def _sync(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.t_sync = time.monotonic()
+        self.dirty = False
+
+    # Sync rows left unsynced once the interval has passed without a sample
+    def _flush_loop(self):
+        while not self.closing.wait(self.fsync_interval / 2):
+            with self.lock:
+                if self.f.closed:
+                    return
+                if self.dirty and time.monotonic() - self.t_sync >= self.fsync_interval:
+                    self._sync()
+
+    def close(self):
+        self.closing.set()
+        with self.lock:
+            if not self.f.closed:
+                self._sync()
+                self.f.close()
+
+    # Close the log and move it to csv_loc: it already is the data CSV
+    def finish(self, csv_loc):
+        self.close()
+        os.replace(self.path, csv_loc)
+
+# Rebuild a standard CSV from a crashed (possibly truncated) log. A partially written
+# last row and rows with the wrong number of fields are dropped. Returns the
+# number of rows recovered.
+def rebuild_csv(log_loc, csv_loc):
+    count = 0
+    with open(log_loc, "r", newline="") as f_in, open(csv_loc, "w", newline="") as f_out:
+        writer = csv.writer(f_out, lineterminator="\n")
+        header = None
+        for line in f_in:
+            if not line.endswith("\n"):
+                break
+            row = next(csv.reader([line]), None)
+            if not row:
+                continue
+            if header is None:
+                header = row
+                writer.writerow(header)
+            elif len(row) == len(header):
+                try:
+                    [float(v) for v in row]
+                except ValueError:
+                    continue
+                writer.writerow(row)
+                count += 1
+    return count
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python3 samplelog.py LOG [CSV]")
+        sys.exit(1)
+
+    log_loc = sys.argv[1]
+    if len(sys.argv) > 2:
+        csv_loc = sys.argv[2]
+    else:
+        csv_loc = os.path.splitext(log_loc)[0] + ".csv"
+
+    try:
+        count = rebuild_csv(log_loc, csv_loc)
+        print("{0} samples recovered to {1}.".format(count, csv_loc))
+    except Exception as e:
+        print(e)
+        sys.exit(1)
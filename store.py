@@ -0,0 +1,116 @@
+# store.py - columnar sample store backed by preallocated NumPy arrays
+#
+# Note: This file is not intended to run independently.
+
+import numpy as np
+
+# Columnar store of samples
+#
+# Every column is a preallocated float64 array, so appending a sample does
+# not box any floats and reading a column is a zero-copy view.
+#
+# By default the arrays double in size whenever they are full. With ring=True
+# the store keeps only the latest `capacity` samples in bounded memory: each
+# sample is written twice, at i and i + capacity of a 2 * capacity array, so
+# the latest window is always one contiguous slice and can still be handed
+# out as a view.
+#
+# The store has one writer (the serial reader thread) and any number of
+# readers (the plot callback). After every append the writer publishes the
+# arrays, the window and a sequence number as a single tuple, so a reader
+# gets a consistent view of all columns from snapshot() without any lock.
+class SampleStore:
+    def __init__(self, columns, capacity=1024, ring=False):
+        self.columns = list(columns)
+        self.capacity = capacity
+        self.ring = ring
+        self.count = 0
+
+        size = 2 * capacity if ring else capacity
+        self.data = {c: np.empty(size) for c in self.columns}
+
+        # (arrays, start of window, length of window, sequence number)
+        self.published = (self.data, 0, 0, 0)
+
+    def __len__(self):
+        return min(self.count, self.capacity) if self.ring else self.count
+
+    # Append one sample, given in the order of self.columns
+    def append(self, row):
+        i = self.count
+        if self.ring:
+            i = i % self.capacity
+            for c, v in zip(self.columns, row):
+                col = self.data[c]
+                col[i] = v
+                col[i + self.capacity] = v
+        else:
+            if i == self.capacity:
+                self._grow()
+            for c, v in zip(self.columns, row):
+                self.data[c][i] = v
+        self.count += 1
+        self.published = (self.data, self._start(), len(self), self.count)
+
+    def _grow(self):
+        capacity = self.capacity * 2
+        data = {}
+        for c in self.columns:
+            col = np.empty(capacity)
+            col[:self.count] = self.data[c][:self.count]
+            data[c] = col
+        self.data = data
+        self.capacity = capacity
+
+    # First index of the stored window
+    def _start(self):
+        if self.ring and self.count > self.capacity:
+            return self.count % self.capacity
+        return 0
+
+    # Zero-copy view of one column, oldest sample first
+    def col(self, name):
+        data, start, n, seq = self.published
+        return data[name][start:start + n]
+
+    # The most recent value of a column
+    def last(self, name):
+        data, start, n, seq = self.published
+        if n == 0:
+            return None
+        return data[name][start + n - 1]
+
+    # Consistent view of all columns at one sequence number
+    #
+    # In growing mode the published part of an array is never written again
+    # (growing copies into new arrays), so the snapshot is made of zero-copy
+    # views. In ring mode the writer overwrites the oldest samples, so the
+    # window is copied and the samples that may have been overwritten during
+    # the copy (the ones appended since, plus one in progress) are dropped
+    # from the front.
+    def snapshot(self, columns=None):
+        if columns is None:
+            columns = self.columns
+        data, start, n, seq = self.published
+        snap = Snapshot(seq)
+        for c in columns:
+            snap[c] = data[c][start:start + n]
+        if self.ring:
+            for c in columns:
+                snap[c] = snap[c].copy()
+            overwritten = min(self.count - seq + 1 - (self.capacity - n), n)
+            if overwritten > 0:
+                for c in columns:
+                    snap[c] = snap[c][overwritten:]
+        return snap
+
+# Columns of a SampleStore at one sequence number
+class Snapshot(dict):
+    def __init__(self, seq):
+        super().__init__()
+        self.seq = seq
+
+    def __len__(self):
+        for col in self.values():
+            return len(col)
+        return 0
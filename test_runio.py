@@ -0,0 +1,91 @@
+# test_runio.py - malformed rows in runio.py and the run file converter
+#
+# A row without as many fields as the header (cut short, or with a field too
+# many) must be skipped whichever columns are read, by every read path: the
+# whole file, a time window, load_lines() and runfile.convert_csv().
+#
+# Usage: python3 -m pytest test_runio.py
+
+import numpy as np
+import pytest
+
+import runio
+import runfile
+
+# Rows 0, 2 and 4 are well-formed. Row 1 lacks its last field and row 3 has
+# one too many. The runs are tested as they are and with a last line cut off
+# by a crash.
+ROWS = [
+    "0,1.34,0.0039,295.1,1.33,0.005,101480.5,0.00385",
+    "1,1.34,0.0039,295.2,1.33,0.005,101480.6",
+    "2,1.34,0.0039,295.3,1.33,0.005,101480.7,0.00385",
+    "3,1.34,0.0039,295.4,1.33,0.005,101480.8,0.00385,7",
+    "4,1.34,0.0039,295.5,1.33,0.005,101480.9,0.00385",
+]
+CUT = "5,1.34,0.00"
+
+KEPT = [0, 2, 4]
+
+SELECTIONS = [
+    ["Time", "Temperature"],
+    ["Time", "Pressure"],
+    ["Temperature", "HC-SRO4 Raw"],
+    ["Exp Distance"],
+    None,
+]
+
+@pytest.fixture(params=["", CUT], ids=["complete", "cut"])
+def csv_loc(request, tmp_path, monkeypatch):
+    # The time index is kept under data/.cache of the working directory
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "1559781685.csv"
+    path.write_text(",".join(runio.COLUMNS) + "\n" + "\n".join(ROWS) + "\n" + request.param)
+    return str(path)
+
+def check(cols, columns):
+    if columns is None:
+        columns = runio.COLUMNS
+    assert list(cols) == columns
+    for c in columns:
+        assert len(cols[c]) == len(KEPT), c
+    if "Time" in cols:
+        assert np.array_equal(cols["Time"], KEPT)
+    if "Temperature" in cols:
+        assert np.array_equal(cols["Temperature"], [295.1, 295.3, 295.5])
+
+@pytest.mark.parametrize("columns", SELECTIONS)
+def test_read_columns(csv_loc, columns):
+    check(runio.read_columns(csv_loc, columns), columns)
+
+@pytest.mark.parametrize("columns", SELECTIONS)
+def test_read_window(csv_loc, columns):
+    check(runio.read_columns(csv_loc, columns, 0, 10), columns)
+
+def test_read_window_part(csv_loc):
+    cols = runio.read_columns(csv_loc, ["Time", "Pressure"], 1, 4)
+    assert np.array_equal(cols["Time"], [2])
+
+@pytest.mark.parametrize("cut", [[], [CUT]], ids=["complete", "cut"])
+def test_load_lines(cut):
+    usecols = [0, runio.COLUMNS.index("Pressure")]
+    data = runio.load_lines(ROWS + cut, len(runio.COLUMNS), usecols)
+    assert np.array_equal(data[:, 0], KEPT)
+    # Well-formed lines are all kept
+    data = runio.load_lines([ROWS[i] for i in KEPT], len(runio.COLUMNS), usecols)
+    assert np.array_equal(data[:, 0], KEPT)
+
+def test_convert_csv(csv_loc, tmp_path):
+    run_loc = str(tmp_path / "1559781685.kbr")
+    assert runfile.convert_csv(csv_loc, run_loc) == len(KEPT)
+    check(runio.read_columns(run_loc, ["Time", "Temperature", "Pressure"]), ["Time", "Temperature", "Pressure"])
+
+def test_distance(csv_loc):
+    assert runio.read_distance(csv_loc) == 1.34
+
+def test_run_file_window(csv_loc, tmp_path):
+    run_loc = str(tmp_path / "1559781685.kbr")
+    runfile.convert_csv(csv_loc, run_loc)
+    cols = runfile.RunFile(run_loc).read(None, 1, 4)
+    assert list(cols) == runio.read_header(run_loc)
+    assert np.array_equal(cols["Time"], [2])
+    assert np.array_equal(cols["Exp Distance"], [1.34])
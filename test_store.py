@@ -0,0 +1,121 @@
+# test_store.py - growth, ring wraparound and snapshots of store.SampleStore
+#
+# The samples appended are (i, 2 * i), so a snapshot is consistent if its
+# columns hold exactly the samples seq - n to seq - 1.
+#
+# Usage: python3 -m pytest test_store.py
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from store import SampleStore
+
+def fill(store, start, stop):
+    for i in range(start, stop):
+        store.append((i, 2 * i))
+
+def check_snapshot(snap):
+    x = snap["x"]
+    assert len(snap["y"]) == len(x)
+    assert np.array_equal(x, np.arange(snap.seq - len(x), snap.seq))
+    assert np.array_equal(snap["y"], 2 * x)
+
+def test_growth():
+    store = SampleStore(["x", "y"], capacity=4)
+    fill(store, 0, 3)
+    early = store.snapshot()
+    fill(store, 3, 37)
+
+    assert len(store) == 37
+    assert store.capacity == 64
+    assert np.array_equal(store.col("x"), np.arange(37))
+    assert np.array_equal(store.col("y"), 2 * np.arange(37))
+    assert store.last("x") == 36
+
+    snap = store.snapshot()
+    assert snap.seq == 37 and len(snap) == 37
+    check_snapshot(snap)
+    # A snapshot taken before the arrays grew still holds its samples
+    assert early.seq == 3
+    check_snapshot(early)
+
+def test_empty():
+    store = SampleStore(["x", "y"], capacity=4, ring=True)
+    assert len(store) == 0
+    assert store.last("x") is None
+    assert len(store.snapshot()) == 0
+
+@pytest.mark.parametrize("n", [3, 5, 6, 10, 13, 27])
+def test_ring_wraparound(n):
+    store = SampleStore(["x", "y"], capacity=5, ring=True)
+    fill(store, 0, n)
+
+    kept = np.arange(max(n - 5, 0), n)
+    assert len(store) == len(kept)
+    assert np.array_equal(store.col("x"), kept)
+    assert np.array_equal(store.col("y"), 2 * kept)
+    assert store.last("x") == n - 1
+    # The window is a view of the 2 * capacity arrays
+    assert store.col("x").base is store.data["x"]
+
+    # Once the ring is full, the next append writes over the oldest sample,
+    # so a snapshot leaves it out
+    snap = store.snapshot()
+    assert snap.seq == n and len(snap) == len(kept) - (n >= 5)
+    check_snapshot(snap)
+
+# The reader took the published tuple at seq, then the writer appended more
+# samples before the window was copied: the samples they may have overwritten
+# (plus the one being written) are dropped from the front
+@pytest.mark.parametrize("seq, more, dropped", [
+    (3, 1, 0),   # not full: the new sample went to a free slot
+    (4, 1, 1),   # ... and filled the ring: the next one may be in progress
+    (4, 2, 2),   # the second new sample wrapped around
+    (8, 0, 1),   # full: the slot of the oldest sample may be in progress
+    (8, 2, 3),
+    (12, 3, 4),
+    (12, 9, 5),  # the whole window was overwritten
+])
+def test_ring_snapshot_overwritten(seq, more, dropped):
+    store = SampleStore(["x", "y"], capacity=5, ring=True)
+    fill(store, 0, seq)
+    published = store.published
+    n = published[2]
+    fill(store, seq, seq + more)
+
+    store.published = published
+    snap = store.snapshot()
+    assert snap.seq == seq
+    assert len(snap) == n - dropped
+    check_snapshot(snap)
+
+@pytest.mark.parametrize("ring", [False, True])
+def test_snapshot_concurrent(ring):
+    store = SampleStore(["x", "y"], capacity=64, ring=ring)
+    done = threading.Event()
+
+    def writer():
+        i = 0
+        while not done.is_set() and i < 10 ** 6:
+            store.append((i, 2 * i))
+            i += 1
+
+    t = threading.Thread(target=writer)
+    t.start()
+    snaps = 0
+    t_end = time.monotonic() + 0.5
+    try:
+        while time.monotonic() < t_end:
+            snap = store.snapshot()
+            check_snapshot(snap)
+            if ring:
+                assert len(snap) <= 64
+            snaps += 1
+    finally:
+        done.set()
+        t.join()
+    assert snaps > 0
+    check_snapshot(store.snapshot())
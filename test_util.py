@@ -0,0 +1,113 @@
+# test_util.py - the vectorized k_B models of util.py against the original
+# formulas
+#
+# The reference functions below are the scalar k_B and error models as they
+# were written before the *_arr versions (with ** 2 and math.sqrt). Every
+# *_arr function and its scalar wrapper must agree with them to a few ulp,
+# row by row, on the runs in data/.
+#
+# Usage: python3 -m pytest test_util.py
+
+import csv
+import glob
+import math
+
+import numpy as np
+import pytest
+
+import util
+
+# Relative tolerance: a few ulp of a float64
+RTOL = 4 * np.finfo(float).eps
+
+def ref_kb_ideal(tt, temp, dis, molar_mass):
+    c_sound = dis / tt
+    return (c_sound ** 2) * molar_mass / (util.GAMMA * util.N_A * temp)
+
+def ref_kb_vdw_n2_aprx(tt, temp, dis):
+    c_sound = dis / tt
+    return ((c_sound ** 2) - 611) / (1.003 * 1.4 * temp) * (2.32586 * 2 * 10 ** -3)
+
+def ref_kb_vdw(tt, temp, dis, pres, molar_mass_g, vdw_a, vdw_b):
+    vm = 22.4 * pres / 101325 * (temp / 273.15)
+    m_molar = 2 * util.GAMMA * vdw_a / (molar_mass_g * vm)
+    a_f = (vm) ** 2 / (vm - vdw_b) ** 2
+    c_sound = dis / tt
+    return (c_sound ** 2 + m_molar) / (a_f * util.GAMMA * temp) * (molar_mass_g * util.AMU) * 10 ** (23)
+
+def ref_kb_rk(tt, temp, dis, pres, molar_mass_g, rk_a, rk_b):
+    vm = 22.4 * pres / 101325 * (temp / 273.15)
+    m_molar = util.GAMMA * rk_a * (2 * vm + rk_b) / (math.sqrt(temp) * molar_mass_g * (vm + rk_b))
+    a_f = (vm) ** 2 / (vm - rk_b) ** 2
+    c_sound = dis / tt
+    return (c_sound ** 2 + m_molar) / (a_f * util.GAMMA * temp) * (molar_mass_g * util.AMU) * 10 ** (23)
+
+def ref_err_pct(tt, temp, dis):
+    dis_err_pct = util.DIS_ERR_ABS / dis
+    temp_err_pct = util.TEMP_ERR_ABS / temp
+    tt_err_pct = util.TT_ERR_ABS / tt
+    return 2 * (dis_err_pct + tt_err_pct) + temp_err_pct
+
+MODELS = {
+    "n2": lambda tt, temp, dis: ref_kb_ideal(tt, temp, dis, util.MOLAR_MASS_N2),
+    "air": lambda tt, temp, dis: ref_kb_ideal(tt, temp, dis, util.MOLAR_MASS_AIR),
+    "vdw_n2_aprx": ref_kb_vdw_n2_aprx,
+}
+
+PRES_MODELS = {
+    "vdw_n2": lambda tt, temp, dis, pres: ref_kb_vdw(tt, temp, dis, pres, util.MOLAR_MASS_G_N2, util.VDW_A_N2, util.VDW_B_N2),
+    "vdw_air": lambda tt, temp, dis, pres: ref_kb_vdw(tt, temp, dis, pres, util.MOLAR_MASS_G_AIR, util.VDW_A_AIR, util.VDW_B_AIR),
+    "rk_n2": lambda tt, temp, dis, pres: ref_kb_rk(tt, temp, dis, pres, util.MOLAR_MASS_G_N2, util.RK_A_N2, util.RK_B_N2),
+    "rk_air": lambda tt, temp, dis, pres: ref_kb_rk(tt, temp, dis, pres, util.MOLAR_MASS_G_AIR, util.RK_A_AIR, util.RK_B_AIR),
+}
+
+# The samples of every run in data/ as (csv_loc, distance, tt, temp, pres)
+# lists; runs without a pressure column are at the standard pressure
+def load_corpus():
+    runs = []
+    for csv_loc in sorted(glob.glob("data/*.csv")):
+        with open(csv_loc, "r") as f:
+            rows = list(csv.DictReader(f))
+        if len(rows) == 0:
+            continue
+        dis = float(rows[-1]["Exp Distance"])
+        tt = [float(r["Measured Time Diff"]) for r in rows]
+        temp = [float(r["Temperature"]) for r in rows]
+        pres = [float(r["Pressure"]) if r.get("Pressure") else 101325.0 for r in rows]
+        runs.append((csv_loc, dis, tt, temp, pres))
+    return runs
+
+RUNS = load_corpus()
+
+def check(got, expected, csv_loc):
+    np.testing.assert_allclose(got, expected, rtol=RTOL, atol=0, err_msg=csv_loc)
+
+def test_corpus():
+    assert len(RUNS) > 0
+
+@pytest.mark.parametrize("name", list(MODELS))
+def test_kb_arr(name):
+    ref = MODELS[name]
+    fn = getattr(util, "kb_from_tt_" + name)
+    fn_arr = getattr(util, "kb_from_tt_{}_arr".format(name))
+    for csv_loc, dis, tt, temp, pres in RUNS:
+        expected = np.array([ref(a, b, dis) for a, b in zip(tt, temp)])
+        check(fn_arr(tt, temp, dis), expected, csv_loc)
+        check([fn(a, b, dis) for a, b in zip(tt, temp)], expected, csv_loc)
+
+@pytest.mark.parametrize("name", list(PRES_MODELS))
+def test_kb_pres_arr(name):
+    ref = PRES_MODELS[name]
+    fn = getattr(util, "kb_from_tt_" + name)
+    fn_arr = getattr(util, "kb_from_tt_{}_arr".format(name))
+    for csv_loc, dis, tt, temp, pres in RUNS:
+        expected = np.array([ref(a, b, dis, p) for a, b, p in zip(tt, temp, pres)])
+        check(fn_arr(tt, temp, dis, pres), expected, csv_loc)
+        check([fn(a, b, dis, p) for a, b, p in zip(tt, temp, pres)], expected, csv_loc)
+
+def test_err_arr():
+    for csv_loc, dis, tt, temp, pres in RUNS:
+        expected = np.array([ref_err_pct(a, b, dis) for a, b in zip(tt, temp)])
+        check(util.err_from_tt_pct_arr(tt, temp, dis), expected, csv_loc)
+        check([util.err_from_tt_pct(a, b, dis) for a, b in zip(tt, temp)], expected, csv_loc)
+        check([util.err_from_tt_vdw_pct(a, b, p, dis) for a, b, p in zip(tt, temp, pres)], expected, csv_loc)
@@ -5,6 +5,7 @@
 # Created by Jerry Yan
 
 import math
+import numpy as np
 
 # Module to securely prompt for a user input
 def user_input(val_name, val_range = None, val_float = True):
@@ -69,87 +70,289 @@ def c_from_tt(tt, dis):
     c_sound = dis / tt
     return c_sound
 
-def kb_from_tt_n2(tt, temp, dis):
-    c_sound = c_from_tt(tt, dis)
-    kb = (c_sound ** 2) * MOLAR_MASS_N2 / (GAMMA * N_A * temp)
+# Vectorized k_B models
+#
+# The *_arr functions take whole columns (lists, NumPy arrays or scalars) of
+# tt, temp, dis and pres and broadcast them against each other. The operations
+# are kept in the same order as the scalar formulas, and squares are written
+# as products (NumPy and libm disagree on the last bit of x ** 2), so the
+# scalar wrappers below return exactly the same value as one array element.
+
+def _kb_ideal_arr(tt, temp, dis, molar_mass):
+    c_sound = c_from_tt(np.asarray(tt, dtype=float), np.asarray(dis, dtype=float))
+    kb = (c_sound * c_sound) * molar_mass / (GAMMA * N_A * np.asarray(temp, dtype=float))
     return kb
 
-def kb_from_tt_air(tt, temp, dis):
-    c_sound = c_from_tt(tt, dis)
-    kb = (c_sound ** 2) * MOLAR_MASS_AIR / (GAMMA * N_A * temp)
+def _kb_vdw_arr(tt, temp, dis, pres, molar_mass_g, vdw_a, vdw_b):
+    temp = np.asarray(temp, dtype=float)
+    vm = 22.4 * np.asarray(pres, dtype=float) / 101325 * (temp / 273.15)
+    m_molar = 2 * GAMMA * vdw_a / (molar_mass_g * vm)
+    a_f = (vm * vm) / ((vm - vdw_b) * (vm - vdw_b))
+    c_sound = c_from_tt(np.asarray(tt, dtype=float), np.asarray(dis, dtype=float))
+    kb = (c_sound * c_sound + m_molar) / ( a_f * GAMMA * temp ) * (molar_mass_g * AMU) * 10 ** (23)
     return kb
 
+def _kb_rk_arr(tt, temp, dis, pres, molar_mass_g, rk_a, rk_b):
+    temp = np.asarray(temp, dtype=float)
+    vm = 22.4 * np.asarray(pres, dtype=float) / 101325 * (temp / 273.15)
+    m_molar = GAMMA * rk_a * (2 * vm + rk_b)/(np.sqrt(temp) * molar_mass_g * (vm + rk_b))
+    a_f = (vm * vm) / ((vm - rk_b) * (vm - rk_b))
+    c_sound = c_from_tt(np.asarray(tt, dtype=float), np.asarray(dis, dtype=float))
+    kb = (c_sound * c_sound + m_molar) / ( a_f * GAMMA * temp ) * (molar_mass_g * AMU) * 10 ** (23)
+    return kb
+
+def kb_from_tt_n2_arr(tt, temp, dis):
+    return _kb_ideal_arr(tt, temp, dis, MOLAR_MASS_N2)
+
+def kb_from_tt_air_arr(tt, temp, dis):
+    return _kb_ideal_arr(tt, temp, dis, MOLAR_MASS_AIR)
+
+def kb_from_tt_vdw_n2_aprx_arr(tt, temp, dis):
+    c_sound = c_from_tt(np.asarray(tt, dtype=float), np.asarray(dis, dtype=float))
+    kb = ((c_sound * c_sound) - 611) / (1.003 * 1.4 * np.asarray(temp, dtype=float)) * (2.32586 * 2 * 10 ** -3)
+    return kb
+
+def kb_from_tt_vdw_n2_arr(tt, temp, dis, pres):
+    return _kb_vdw_arr(tt, temp, dis, pres, MOLAR_MASS_G_N2, VDW_A_N2, VDW_B_N2)
+
+def kb_from_tt_vdw_air_arr(tt, temp, dis, pres):
+    return _kb_vdw_arr(tt, temp, dis, pres, MOLAR_MASS_G_AIR, VDW_A_AIR, VDW_B_AIR)
+
+def kb_from_tt_rk_n2_arr(tt, temp, dis, pres):
+    return _kb_rk_arr(tt, temp, dis, pres, MOLAR_MASS_G_N2, RK_A_N2, RK_B_N2)
+
+def kb_from_tt_rk_air_arr(tt, temp, dis, pres):
+    return _kb_rk_arr(tt, temp, dis, pres, MOLAR_MASS_G_AIR, RK_A_AIR, RK_B_AIR)
+
+def err_from_tt_pct_arr(tt, temp, dis):
+    dis_err_pct = DIS_ERR_ABS / np.asarray(dis, dtype=float)
+    temp_err_pct = TEMP_ERR_ABS / np.asarray(temp, dtype=float)
+    tt_err_pct = TT_ERR_ABS / np.asarray(tt, dtype=float)
+    err_pct = 2 * (dis_err_pct + tt_err_pct) + temp_err_pct
+    return err_pct
+
+# Scalar k_B models (thin wrappers around the vectorized ones)
+
+def kb_from_tt_n2(tt, temp, dis):
+    return float(kb_from_tt_n2_arr(tt, temp, dis))
+
+def kb_from_tt_air(tt, temp, dis):
+    return float(kb_from_tt_air_arr(tt, temp, dis))
+
 # N2 VDW Approximation
 def kb_from_tt_vdw_n2_aprx(tt, temp, dis):
-    c_sound = c_from_tt(tt, dis)
-    kb = ((c_sound ** 2) - 611) / (1.003 * 1.4 * temp) * (2.32586 * 2 * 10 ** -3)
-    return kb
+    return float(kb_from_tt_vdw_n2_aprx_arr(tt, temp, dis))
 
 # N2 VDW Correction
 def kb_from_tt_vdw_n2(tt, temp, dis, pres):
-    vm = 22.4 * pres / 101325 * (temp / 273.15)
-    m_molar = 2 * GAMMA * VDW_A_N2 / (MOLAR_MASS_G_N2 * vm)
-    a_f = (vm) ** 2 / (vm - VDW_B_N2) ** 2
-    c_sound = c_from_tt(tt, dis)
-    kb = (c_sound ** 2 + m_molar) / ( a_f * GAMMA * temp ) * (MOLAR_MASS_G_N2 * AMU) * 10 ** (23)
-    return kb
+    return float(kb_from_tt_vdw_n2_arr(tt, temp, dis, pres))
 
 # Air VDW Correction
 def kb_from_tt_vdw_air(tt, temp, dis, pres):
-    vm = 22.4 * pres / 101325 * (temp / 273.15)
-    m_molar = 2 * GAMMA * VDW_A_AIR / (MOLAR_MASS_G_AIR * vm)
-    a_f = (vm) ** 2 / (vm - VDW_B_AIR) ** 2
-    c_sound = c_from_tt(tt, dis)
-    kb = (c_sound ** 2 + m_molar) / ( a_f * GAMMA * temp ) * (MOLAR_MASS_G_AIR * AMU) * 10 ** (23)
-    return kb
+    return float(kb_from_tt_vdw_air_arr(tt, temp, dis, pres))
 
 # N2 RK Correction
 def kb_from_tt_rk_n2(tt, temp, dis, pres):
-    vm = 22.4 * pres / 101325 * (temp / 273.15)
-    m_molar = GAMMA * RK_A_N2 * (2 * vm + RK_B_N2)/(math.sqrt(temp) * MOLAR_MASS_G_N2 * (vm + RK_B_N2))
-    a_f = (vm) ** 2 / (vm - RK_B_N2) ** 2
-    c_sound = c_from_tt(tt, dis)
-    kb = (c_sound ** 2 + m_molar) / ( a_f * GAMMA * temp ) * (MOLAR_MASS_G_N2 * AMU) * 10 ** (23)
-    return kb
+    return float(kb_from_tt_rk_n2_arr(tt, temp, dis, pres))
 
 # Air RK Correction
 def kb_from_tt_rk_air(tt, temp, dis, pres):
-    vm = 22.4 * pres / 101325 * (temp / 273.15)
-    m_molar = GAMMA * RK_A_AIR * (2 * vm + RK_B_AIR)/(math.sqrt(temp) * MOLAR_MASS_G_AIR * (vm + RK_B_AIR))
-    a_f = (vm) ** 2 / (vm - RK_B_AIR) ** 2
-    c_sound = c_from_tt(tt, dis)
-    kb = (c_sound ** 2 + m_molar) / ( a_f * GAMMA * temp ) * (MOLAR_MASS_G_AIR * AMU) * 10 ** (23)
-    return kb
+    return float(kb_from_tt_rk_air_arr(tt, temp, dis, pres))
 
 def err_from_tt_pct(tt, temp, dis):
-    dis_err_pct = DIS_ERR_ABS / dis
-    temp_err_pct = TEMP_ERR_ABS / temp
-    tt_err_pct = TT_ERR_ABS / tt
-    err_pct = 2 * (dis_err_pct + tt_err_pct) + temp_err_pct
-    return err_pct
+    return float(err_from_tt_pct_arr(tt, temp, dis))
 
 def err_from_tt_vdw_pct(tt, temp, pres, dis):
-    dis_err_pct = DIS_ERR_ABS / dis
-    temp_err_pct = TEMP_ERR_ABS / temp
-    tt_err_pct = TT_ERR_ABS / tt
-    err_pct = 2 * (dis_err_pct + tt_err_pct) + temp_err_pct
-    return err_pct
+    return float(err_from_tt_pct_arr(tt, temp, dis))
+
+# Running (cumulative) mean of a column, e.g. the instantaneous average k_B
+def cum_mean_arr(data_arr):
+    data_arr = np.asarray(data_arr, dtype=float)
+    return np.cumsum(data_arr) / np.arange(1, len(data_arr) + 1)
+
+# Running statistics of a measured quantity (Welford's algorithm)
+#
+# Each add() is O(1) regardless of how many samples came before. The whole
+# state is published as one tuple, so a reader in another thread (e.g. the
+# plot callback) always sees the count, mean and variance of the same sample.
+class RunningStats:
+    def __init__(self, state=(0, 0.0, 0.0, 0.0, 0.0)):
+        # (count, mean, sum of squared deviations, sum of 1/err^2, sum of x/err^2)
+        self.state = state
+
+    def add(self, x, err=None):
+        n, mean, m2, w_sum, wx_sum = self.state
+        n += 1
+        delta = x - mean
+        mean += delta / n
+        m2 += delta * (x - mean)
+        if err:
+            w = 1 / (err * err)
+            w_sum += w
+            wx_sum += w * x
+        self.state = (n, mean, m2, w_sum, wx_sum)
+
+    # Combine the statistics of two independent sets of samples (Chan et al.)
+    def merge(self, other):
+        n_a, mean_a, m2_a, w_a, wx_a = self.state
+        n_b, mean_b, m2_b, w_b, wx_b = other.state
+        n = n_a + n_b
+        if n == 0:
+            return RunningStats()
+        delta = mean_b - mean_a
+        mean = mean_a + delta * n_b / n
+        m2 = m2_a + m2_b + delta * delta * n_a * n_b / n
+        return RunningStats((n, mean, m2, w_a + w_b, wx_a + wx_b))
+
+    @property
+    def count(self):
+        return self.state[0]
+
+    @property
+    def mean(self):
+        return self.state[1]
+
+    # Sample variance (ddof = 1, as scipy.stats.sem uses)
+    @property
+    def var(self):
+        n, mean, m2 = self.state[:3]
+        if n < 2:
+            return 0
+        return m2 / (n - 1)
+
+    @property
+    def sem(self):
+        n, mean, m2 = self.state[:3]
+        if n < 2:
+            return 0
+        return math.sqrt(m2 / (n - 1) / n)
+
+    # Inverse-variance weighted mean and its uncertainty
+    @property
+    def wmean(self):
+        n, mean, m2, w_sum, wx_sum = self.state
+        if w_sum == 0:
+            return mean
+        return wx_sum / w_sum
+
+    @property
+    def wmean_err(self):
+        w_sum = self.state[3]
+        if w_sum == 0:
+            return 0
+        return 1 / math.sqrt(w_sum)
+
+# Sigma-clipping outlier filter
+#
+# A sample is accepted if it lies within nsigma * sigma of the mean of the
+# samples accepted before it, where sigma is the RMS error of those samples.
+# The first two samples are always accepted. The running sums make every
+# decision O(1), so filtering a whole run is linear in its length.
+class SigmaClip:
+    def __init__(self, nsigma=2):
+        self.nsigma = nsigma
+        self.count = 0
+        self.data_sum = 0.0
+        self.err_sq_sum = 0.0
+
+    def update(self, data_p, err_p):
+        if self.count > 1:
+            sigma = math.sqrt(self.err_sq_sum / (self.count - 1))
+            avg = self.data_sum / self.count
+        else:
+            sigma = err_p
+            avg = data_p
+
+        accept = avg - self.nsigma * sigma <= data_p <= avg + self.nsigma * sigma
+        if accept:
+            self.count += 1
+            self.data_sum += data_p
+            self.err_sq_sum += err_p * err_p
+        return accept
 
+# Boolean mask of the samples accepted by SigmaClip, in order
+def sigma_clip_mask(data_arr, err_arr, nsigma=2):
+    clip = SigmaClip(nsigma)
+    data_arr = np.asarray(data_arr, dtype=float).tolist()
+    err_arr = np.asarray(err_arr, dtype=float).tolist()
+    mask = np.zeros(len(data_arr), dtype=bool)
+    for i in range(0, len(data_arr)):
+        mask[i] = clip.update(data_arr[i], err_arr[i])
+    return mask
+
+# Batch version: clip the whole array against the mean and RMS error of the
+# currently accepted samples until the accepted set stops changing
+def sigma_clip_mask_batch(data_arr, err_arr, nsigma=2, max_iter=10):
+    data_arr = np.asarray(data_arr, dtype=float)
+    err_arr = np.asarray(err_arr, dtype=float)
+    mask = np.ones(len(data_arr), dtype=bool)
+    for i in range(0, max_iter):
+        n = np.count_nonzero(mask)
+        if n < 2:
+            break
+        avg = np.mean(data_arr[mask])
+        sigma = np.sqrt(np.sum(err_arr[mask] ** 2) / (n - 1))
+        new_mask = np.abs(data_arr - avg) <= nsigma * sigma
+        if np.array_equal(new_mask, mask):
+            break
+        mask = new_mask
+    return mask
+
+# Error bar geometry: lower ends, upper ends and the (N, 2, 2) array of
+# [[x, low], [x, up]] segments that LineCollection.set_segments takes
 def err_arr_gp(x_arr, data_arr, err_arr):
     if len(data_arr) != len(err_arr):
         return False
     else:
-        up_arr = []
-        low_arr = []
-        seg_arr = []
-        for i in range(0, len(data_arr)):
-            x_p = x_arr[i]
-            data_p = data_arr[i]
-            err_p = err_arr[i]
-            up_p = data_p + err_p
-            low_p = data_p - err_p
-            up_arr.append(up_p)
-            low_arr.append(low_p)
-            seg_arr.append([[x_p, low_p], [x_p, up_p]])
+        x_arr = np.asarray(x_arr, dtype=float)
+        data_arr = np.asarray(data_arr, dtype=float)
+        err_arr = np.asarray(err_arr, dtype=float)
+
+        low_arr = data_arr - err_arr
+        up_arr = data_arr + err_arr
+        seg_arr = np.empty((len(data_arr), 2, 2))
+        seg_arr[:, 0, 0] = x_arr
+        seg_arr[:, 0, 1] = low_arr
+        seg_arr[:, 1, 0] = x_arr
+        seg_arr[:, 1, 1] = up_arr
 
         return (low_arr, up_arr, seg_arr)
+
+# Incremental error bar geometry for live plots
+#
+# update() takes the full columns every frame but only computes the points
+# added since the previous call, as long as the earlier points are unchanged
+# (same length or longer, same first x). Otherwise it starts over.
+class ErrorBarGeometry:
+    def __init__(self):
+        self.n = 0
+        self.x_first = None
+        self.low_arr = np.empty(0)
+        self.up_arr = np.empty(0)
+        self.seg_arr = np.empty((0, 2, 2))
+
+    def update(self, x_arr, data_arr, err_arr):
+        if len(data_arr) != len(err_arr):
+            return False
+
+        n = len(data_arr)
+        if n < self.n or (n > 0 and x_arr[0] != self.x_first):
+            self.n = 0
+
+        if n > len(self.low_arr):
+            capacity = max(2 * len(self.low_arr), n, 1024)
+            for name in ["low_arr", "up_arr", "seg_arr"]:
+                old = getattr(self, name)
+                new = np.empty((capacity,) + old.shape[1:])
+                new[:self.n] = old[:self.n]
+                setattr(self, name, new)
+
+        i = self.n
+        low, up, seg = err_arr_gp(x_arr[i:n], data_arr[i:n], err_arr[i:n])
+        self.low_arr[i:n] = low
+        self.up_arr[i:n] = up
+        self.seg_arr[i:n] = seg
+
+        self.n = n
+        self.x_first = x_arr[0] if n > 0 else None
+        return (self.low_arr[:n], self.up_arr[:n], self.seg_arr[:n])
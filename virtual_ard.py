@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+# virtual_ard.py - a virtual Arduino on a pseudo-terminal for load testing
+#
+# Emits the same JSON lines (or, after a "BIN <baud>" request, the same
+# binary packets) as ard_code.ino on a pty, so main_ard.py can run without
+# the hardware:
+#
+#   python3 virtual_ard.py --rate 50 --distance 67
+#   python3 main_ard.py --port /dev/pts/5 --distance 67
+#
+# The samples are either synthetic (realistic tt for the given distance at a
+# drifting temperature and pressure, plus noise) or replayed from a data CSV.
+# Garbage lines and disconnects can be injected. A disconnect closes the pty,
+# as unplugging the USB cable removes the port, and the virtual Arduino
+# comes back on a new pty (printed) afterwards. With --bench the script
+# instead runs the acquisition pipeline, sample store and live plot of
+# main_ard.py against itself and reports throughput and latency.
+
+import argparse
+import math
+import os
+import pty
+import random
+import select
+import threading
+import time
+import tty
+
+import util
+import runio
+import protocol
+
+# HC-SR04 Offset (us), as in main_ard.py
+SR04_OFFSET = 55
+
+class VirtualArduino:
+    def __init__(self, rate=1, distance=50, noise=2, garbage=0, disconnect_every=0, disconnect_for=0, replay=None, binary=False, seed=0):
+        self.rate = rate
+        self.distance = distance / 100 * 2
+        self.noise = noise
+        self.garbage = garbage
+        self.disconnect_every = disconnect_every
+        self.disconnect_for = disconnect_for
+        self.binary = binary
+        self.random = random.Random(seed)
+
+        self.replay = None
+        if replay is not None:
+            self.replay = load_replay(replay)
+
+        self._connect()
+
+        self.seq = 0
+        self.sent = 0
+        self.garbled = 0
+        self.send_times = []
+        self.running = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+    def close(self):
+        if self.master is not None:
+            os.close(self.master)
+            os.close(self.slave)
+            self.master = None
+
+    # Open a new pty, as the port of a freshly plugged-in Arduino
+    def _connect(self):
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+    # Close the pty, so the host sees the port vanish, then open a new one
+    def _disconnect(self):
+        self.close()
+        print("Disconnected.")
+
+    def _reconnect(self):
+        self._connect()
+        print("Reconnected on {}".format(self.port))
+
+    # Synthetic sample: speed of sound from the true k_B in dry air, with a
+    # slow random walk of temperature and pressure
+    def _synthetic(self, i):
+        if i == 0:
+            self.temp = 22 + self.random.uniform(-1, 1)
+            self.pres = 101325 + self.random.uniform(-300, 300)
+        self.temp += self.random.gauss(0, 0.01)
+        self.pres += self.random.gauss(0, 1)
+        c_sound = math.sqrt(util.K_B * util.GAMMA * util.N_A * (self.temp + 273.15) / util.MOLAR_MASS_AIR)
+        tt_us = self.distance / c_sound * 10 ** 6 - SR04_OFFSET + self.random.gauss(0, self.noise)
+        return (round(tt_us), round(self.temp, 4), round(self.pres, 2))
+
+    def _sample(self, i):
+        if self.replay is not None:
+            return self.replay[i % len(self.replay)]
+        return self._synthetic(i)
+
+    def _write(self, data):
+        if self.master is None:
+            return
+        try:
+            os.write(self.master, data)
+        except OSError:
+            pass
+
+    # Answer a "BIN <baud>" request like the firmware does
+    def _check_command(self):
+        if self.master is None:
+            return
+        r, w, x = select.select([self.master], [], [], 0)
+        if not r:
+            return
+        cmd = os.read(self.master, 1024)
+        if cmd.startswith(b"BIN"):
+            baud = cmd.split()[1].decode("ascii") if len(cmd.split()) > 1 else "9600"
+            self._write("OK {}\r\n".format(baud).encode("ascii"))
+            self.binary = True
+
+    def _run(self):
+        t_start = time.perf_counter()
+        i = 0
+        while self.running:
+            t_next = t_start + i / self.rate
+            delay = t_next - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self._check_command()
+
+            t = time.perf_counter() - t_start
+            if self.disconnect_every and t % self.disconnect_every > self.disconnect_every - self.disconnect_for:
+                if self.master is not None:
+                    self._disconnect()
+                i += 1
+                continue
+            if self.master is None:
+                self._reconnect()
+
+            tt_us, temp, pres = self._sample(i)
+            if self.garbage and self.random.random() < self.garbage:
+                self._write(b'{"tt_us":' + bytes(self.random.getrandbits(8) for j in range(8)) + b"\r\n")
+                self.garbled += 1
+                i += 1
+                continue
+            elif self.binary:
+                self._write(protocol.encode_packet(self.seq, int(t * 10 ** 6), tt_us, temp, pres))
+            else:
+                self._write('{{"tt_us":{0},"temp":{1},"pres":{2}}}\r\n'.format(tt_us, temp, pres).encode("ascii"))
+            self.send_times.append(time.perf_counter())
+            self.seq += 1
+            self.sent += 1
+            i += 1
+
+# (tt_us, temp, pres) of every row of a data CSV, as the firmware sent them
+def load_replay(csv_loc):
+    cols = runio.read_columns(csv_loc, ["Measured Time Diff", "HC-SRO4 Raw", "Temperature", "Pressure"])
+    if cols["HC-SRO4 Raw"] is not None:
+        tt_us = cols["HC-SRO4 Raw"] * 10 ** 6
+    else:
+        tt_us = cols["Measured Time Diff"] * 10 ** 6 - SR04_OFFSET
+    temp = cols["Temperature"] - 273.15
+    pres = runio.pressure(cols)
+    rows = [(round(t), round(c, 4), p) for t, c, p in zip(tt_us.tolist(), temp.tolist(), pres.tolist())]
+    if len(rows) == 0:
+        raise Exception("No samples in {}.".format(csv_loc))
+    return rows
+
+# Throughput and latency of the acquisition stack of main_ard.py
+def bench(ard, seconds, mode):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import numpy as np
+    import serial
+
+    import acquisition
+    from store import SampleStore
+    from liveplot import LivePlot
+
+    # Samples are matched to their send times by order, so the simulator
+    # starts in the benchmarked mode instead of negotiating it
+    ard.binary = mode == "binary"
+    ser = serial.Serial(ard.port, 9600, timeout=1)
+
+    distance_d = ard.distance
+    samples = SampleStore(["tt", "time", "temp", "pres", "kb", "kb_err", "kb_avg"])
+    kb_stats = util.RunningStats()
+    stored_times = []
+
+    def process_batch(t_arr, tt_us_arr, temp_arr, pres_arr):
+        tt_arr = (tt_us_arr + SR04_OFFSET) * 10 ** (-6)
+        temp_arr = temp_arr + 273.15
+        kb_arr = util.kb_from_tt_rk_n2_arr(tt_arr, temp_arr, distance_d, pres_arr)
+        err_abs_arr = util.err_from_tt_pct_arr(tt_arr, temp_arr, distance_d) * kb_arr
+        for i in range(0, len(t_arr)):
+            kb_stats.add(kb_arr[i], err_abs_arr[i])
+            samples.append([tt_arr[i], t_arr[i], temp_arr[i], pres_arr[i], kb_arr[i], err_abs_arr[i], kb_stats.mean])
+        stored_times.extend([time.perf_counter()] * len(t_arr))
+
+    fig = plt.figure()
+    ax1 = fig.add_subplot(211)
+    ax2 = fig.add_subplot(223)
+    ax3 = fig.add_subplot(224)
+    live = LivePlot(fig, samples)
+    live.add_axis(ax1)
+    live.add_axis(ax2, y_pad=0.1)
+    live.add_axis(ax3, y_pad=25)
+    live.add_errorbar(ax1, ax1.errorbar([0], [0], yerr=0.01, capsize=0.1, fmt='ko').lines, "time", "kb", "kb_err")
+    live.add_line(ax1, ax1.plot([], [], '.')[0], "time", "kb_avg")
+    live.add_line(ax2, ax2.plot([], [], '.')[0], "time", "temp")
+    live.add_line(ax3, ax3.plot([], [], '.')[0], "time", "pres")
+    fig.canvas.draw()
+
+    pipeline = acquisition.SerialPipeline(ser, process_batch, mode=mode)
+    pipeline.start()
+    ard.start()
+
+    frame_times = []
+    t_end = time.perf_counter() + seconds
+    while time.perf_counter() < t_end:
+        t = time.perf_counter()
+        if live.update():
+            frame_times.append(time.perf_counter() - t)
+        time.sleep(0.25)
+    ard.stop()
+    time.sleep(0.5)
+    pipeline.stop()
+
+    n = min(len(stored_times), len(ard.send_times))
+    latency = np.array(stored_times[:n]) - np.array(ard.send_times[:n])
+    p_stats = pipeline.stats()
+    print("Sent {0} samples and {1} garbage lines in {2} s ({3:.0f} samples/s).".format(ard.sent, ard.garbled, seconds, ard.sent / seconds))
+    print("Stored {0} samples; queue: {dropped} dropped, {malformed} malformed, {lost} lost, {corrupted} corrupted.".format(samples.count, **p_stats))
+    if n > 0:
+        print("Send-to-store latency: median {0:.2f} ms, p99 {1:.2f} ms, max {2:.2f} ms.".format(np.median(latency) * 1e3, np.percentile(latency, 99) * 1e3, np.max(latency) * 1e3))
+    if len(frame_times) > 0:
+        print("Live plot frames: {0}, median {1:.1f} ms, max {2:.1f} ms.".format(len(frame_times), np.median(frame_times) * 1e3, np.max(frame_times) * 1e3))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Virtual Arduino on a pseudo-terminal.")
+    parser.add_argument("--rate", type=float, default=1, help="samples per second (default 1)")
+    parser.add_argument("--distance", type=float, default=50, help="distance in cm (default 50)")
+    parser.add_argument("--noise", type=float, default=2, help="standard deviation of tt_us (default 2)")
+    parser.add_argument("--garbage", type=float, default=0, help="probability of a garbage line (default 0)")
+    parser.add_argument("--disconnect-every", type=float, default=0, help="disconnect (close the pty) every this many seconds")
+    parser.add_argument("--disconnect-for", type=float, default=5, help="seconds until it reconnects on a new pty (default 5)")
+    parser.add_argument("--replay", help="data CSV to replay instead of synthetic samples")
+    parser.add_argument("--binary", action="store_true", help="send binary packets from the start")
+    parser.add_argument("--bench", type=float, metavar="SECONDS", help="run the acquisition benchmark for this long")
+    parser.add_argument("--mode", default="json", choices=["json", "binary"], help="protocol used by --bench")
+    args = parser.parse_args()
+
+    ard = VirtualArduino(args.rate, args.distance, args.noise, args.garbage, args.disconnect_every, args.disconnect_for, args.replay, args.binary)
+
+    if args.bench:
+        bench(ard, args.bench, args.mode)
+    else:
+        print("Virtual Arduino on {}".format(ard.port))
+        print("Run: python3 main_ard.py --port {0} --distance {1}".format(ard.port, args.distance))
+        ard.start()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print()
+            print("{0} samples and {1} garbage lines sent.".format(ard.sent, ard.garbled))
+    ard.close()